@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import Car, Photo
+from .models import Car, FailedAdvert, Photo, SyncRun
 
 
 @admin.register(Car)
@@ -123,3 +123,58 @@ class PhotoAdmin(admin.ModelAdmin):
     readonly_fields = (
         "created_at",
     )
+
+
+@admin.register(SyncRun)
+class SyncRunAdmin(admin.ModelAdmin):
+    list_display = (
+        "id",
+        "source",
+        "kind",
+        "status",
+        "page",
+        "listing_done",
+        "resumed",
+        "started_at",
+        "updated_at",
+        "finished_at",
+    )
+    list_filter = (
+        "status",
+        "kind",
+    )
+    readonly_fields = (
+        "started_at",
+        "updated_at",
+        "finished_at",
+        "counters",
+        "error",
+    )
+
+
+@admin.register(FailedAdvert)
+class FailedAdvertAdmin(admin.ModelAdmin):
+    list_display = (
+        "id",
+        "source",
+        "external_id",
+        "status",
+        "error_class",
+        "attempts",
+        "last_failed_at",
+        "next_retry_at",
+        "resolved_at",
+    )
+    list_filter = (
+        "status",
+        "error_class",
+    )
+    search_fields = (
+        "external_id",
+    )
+    readonly_fields = (
+        "first_failed_at",
+        "last_failed_at",
+        "resolved_at",
+        "error",
+    )
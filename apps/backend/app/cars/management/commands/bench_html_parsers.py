@@ -0,0 +1,194 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError, CommandParser
+
+from app.cars.services import html_parsers
+from app.integrations.html_slice import CHUNK_SIZE, HtmlSlicer
+from app.integrations.replay import Corpus
+
+# что import_999 берёт со страницы — это и сравниваем с bs4
+META_PROPS = (
+    "product:price:amount",
+    "product:price:currency",
+    "og:title",
+    "og:description",
+    "og:image",
+)
+
+
+def _extract(page: html_parsers.ParsedPage) -> dict:
+    return {
+        "meta": {prop: page.meta(prop) for prop in META_PROPS},
+        "spec_pairs": page.spec_pairs(),
+        "images": page.image_candidates(),
+    }
+
+
+def _slice(html: str, images: bool = True) -> HtmlSlicer:
+    """Нарезка как при скачивании: кусками по CHUNK_SIZE, пока не соберём всё нужное."""
+    slicer = HtmlSlicer(images=images)
+    for start in range(0, len(html), CHUNK_SIZE):
+        if slicer.feed(html[start:start + CHUNK_SIZE]):
+            break
+    slicer.close()
+    return slicer
+
+
+class Command(BaseCommand):
+    help = (
+        "Паритет бэкендов разбора публичной страницы (html_parsers) на большом корпусе.\n"
+        "Каждую страницу корпуса разбирает каждый доступный бэкенд; мета, пары\n"
+        "характеристик и кандидаты в фотки должны совпасть с bs4 — иначе ошибка.\n"
+        "С --slice — то же для нарезки (html_slice) против целой страницы: с фотками\n"
+        "(страница дочитывается до конца) должно совпасть всё; без фоток (API их дал,\n"
+        "останавливаемся после блока) — мета и пары, фотки — быть началом списка.\n"
+        "Скорость — pytest-benchmark: app/cars/tests/test_bench_html_parsers.py\n"
+        "(корпус — N999_BENCH_CORPUS=DIR).\n"
+        "Пример:\n"
+        "  python manage.py bench_html_parsers --corpus ./corpus\n"
+        "  python manage.py bench_html_parsers --corpus ./corpus --slice --output parity.json"
+    )
+
+    def add_arguments(self, parser: CommandParser) -> None:
+        parser.add_argument("--corpus", default=None, help="Папка с записанным корпусом (берётся public_html).")
+        parser.add_argument("--synthetic", type=int, default=0, help="Вместо корпуса — N синтетических страниц.")
+        parser.add_argument(
+            "--backends",
+            default=None,
+            help="Через запятую (по умолчанию все доступные): selectolax,lxml,bs4.",
+        )
+        parser.add_argument(
+            "--slice",
+            action="store_true",
+            help="Сравнить нарезку страницы (html_slice) с целой: паритет и сколько символов уходит в разбор.",
+        )
+        parser.add_argument("--output", default=None, help="Сохранить результат в JSON.")
+
+    def handle(self, *args, **options):
+        if options["corpus"]:
+            corpus = Corpus.load(options["corpus"])
+        elif options["synthetic"]:
+            corpus = Corpus.synthetic(options["synthetic"])
+        else:
+            raise CommandError("Укажи --corpus DIR или --synthetic N")
+        pages = [(aid, html) for aid, html in sorted(corpus.bodies["public_html"].items()) if html]
+        if not pages:
+            raise CommandError("В корпусе нет public_html")
+
+        available = html_parsers.available_backends()
+        if options["backends"]:
+            backends = [b.strip() for b in options["backends"].split(",") if b.strip()]
+            missing = [b for b in backends if b not in available]
+            if missing:
+                raise CommandError(f"Недоступны: {', '.join(missing)} (есть: {', '.join(available)})")
+        else:
+            backends = available
+        if "bs4" not in backends:
+            backends.append("bs4")
+
+        self.stdout.write(
+            f"{len(pages)} страниц, {sum(len(h) for _, h in pages) // 1024} КиБ; "
+            f"бэкенды: {', '.join(backends)} (активный: {html_parsers.active_backend()})"
+        )
+
+        if options["slice"]:
+            self._slice_report(pages, backends, options)
+            return
+
+        mismatches = self._parity(pages, backends)
+        for name in backends:
+            if name != "bs4":
+                self.stdout.write(f"  {name:<12}расхождений с bs4: {len(mismatches[name])}")
+
+        if options["output"]:
+            report = {
+                "corpus": options["corpus"] or f"synthetic:{options['synthetic']}",
+                "pages": len(pages),
+                "backends": backends,
+                "mismatches": mismatches,
+            }
+            with open(options["output"], "w", encoding="utf-8") as fh:
+                json.dump(report, fh, ensure_ascii=False, indent=2)
+            self.stdout.write(self.style.SUCCESS(f"[OK] Результат сохранён в {options['output']}"))
+
+        if any(mismatches.values()):
+            for name, items in mismatches.items():
+                for item in items[:5]:
+                    self.stdout.write(self.style.ERROR(f"  {name} {item['id']} {item['field']}:"))
+                    self.stdout.write(f"    bs4: {item['bs4']}")
+                    self.stdout.write(f"    {name}: {item['got']}")
+            raise CommandError("Бэкенды расходятся с bs4 — см. выше")
+        self.stdout.write(self.style.SUCCESS("[OK] Все бэкенды совпадают с bs4"))
+
+    # ---------- паритет ----------
+
+    def _parity(self, pages, backends) -> dict:
+        mismatches = {name: [] for name in backends if name != "bs4"}
+        for aid, html in pages:
+            expected = _extract(html_parsers.Bs4Page(html))
+            for name in mismatches:
+                got = _extract(html_parsers.BACKENDS[name](html))
+                for field, want in expected.items():
+                    if got[field] != want:
+                        mismatches[name].append({"id": aid, "field": field, "bs4": want, "got": got[field]})
+        return mismatches
+
+    # ---------- нарезка ----------
+
+    def _slice_report(self, pages, backends, options) -> None:
+        total = sum(len(html) for _, html in pages)
+        slices = {}
+        for images in (True, False):
+            slices[images] = {aid: _slice(html, images=images) for aid, html in pages}
+            scanned = sum(s.chars_scanned for s in slices[images].values())
+            kept = sum(len(s.document()) for s in slices[images].values())
+            self.stdout.write(
+                f"  {'с фотками' if images else 'без фоток'}: прочитано {scanned / total:.0%} символов, "
+                f"в разбор ушло {kept / total:.0%}; остановились раньше конца на "
+                f"{sum(s.done for s in slices[images].values())} из {len(pages)} стр."
+            )
+
+        mismatches = []
+        images_cut = 0
+        for aid, html in pages:
+            full = _extract(html_parsers.Bs4Page(html))
+            for name in backends:
+                for images in (True, False):
+                    got = _extract(html_parsers.BACKENDS[name](slices[images][aid].document()))
+                    for field in ("meta", "spec_pairs", "images"):
+                        if got[field] == full[field]:
+                            continue
+                        if field == "images" and not images and full["images"][:len(got["images"])] == got["images"]:
+                            images_cut += 1  # фотки после точки остановки не видим — они и не нужны
+                            continue
+                        mismatches.append({
+                            "id": aid, "backend": name, "images": images, "field": field,
+                            "full": full[field], "got": got[field],
+                        })
+        if images_cut:
+            self.stdout.write(f"  фотки обрезаны (начало списка совпадает) на {images_cut} разборах")
+
+        if options["output"]:
+            report = {
+                "corpus": options["corpus"] or f"synthetic:{options['synthetic']}",
+                "pages": len(pages),
+                "chars_total": total,
+                "chars_scanned": sum(s.chars_scanned for s in slices[True].values()),
+                "chars_parsed": sum(len(s.document()) for s in slices[True].values()),
+                "chars_scanned_without_images": sum(s.chars_scanned for s in slices[False].values()),
+                "chars_parsed_without_images": sum(len(s.document()) for s in slices[False].values()),
+                "images_cut": images_cut,
+                "mismatches": mismatches,
+            }
+            with open(options["output"], "w", encoding="utf-8") as fh:
+                json.dump(report, fh, ensure_ascii=False, indent=2)
+            self.stdout.write(self.style.SUCCESS(f"[OK] Результат сохранён в {options['output']}"))
+
+        if mismatches:
+            for item in mismatches[:5]:
+                mode = "с фотками" if item["images"] else "без фоток"
+                self.stdout.write(self.style.ERROR(f"  {item['backend']} {item['id']} {item['field']} ({mode}):"))
+                self.stdout.write(f"    целиком: {item['full']}")
+                self.stdout.write(f"    нарезка: {item['got']}")
+            raise CommandError("Нарезка расходится с целой страницей — см. выше")
+        self.stdout.write(self.style.SUCCESS("[OK] Нарезка совпадает с целой страницей"))
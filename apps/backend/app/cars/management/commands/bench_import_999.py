@@ -0,0 +1,266 @@
+import json
+import os
+import statistics
+
+from django.core.management.base import BaseCommand, CommandError, CommandParser
+from django.db import transaction
+
+from app.cars.services import import_999 as import_service
+from app.cars.services.import_metrics import ImportMetrics
+from app.integrations import html_slice, partners999
+from app.integrations.http_cache import configure_cache
+from app.integrations.ratelimit import configure_limiter
+from app.integrations.replay import Corpus
+from app.integrations.standin_999 import StandinConfig, start_in_thread
+
+# стадии в порядке конвейера — так и печатаем
+STAGES = (
+    "listing",
+    "listing_wait",
+    "delta",
+    "prefetch",
+    "advert_fetch",
+    "features_fetch",
+    "html_fetch",
+    "html_parse",
+    "html_extract",
+    "normalize",
+    "reconcile",
+    "bulk_upsert",
+    "update_or_create",
+    "photo_sync",
+    "archive",
+)
+
+
+class Command(BaseCommand):
+    help = (
+        "Бенчмарк импорта 999.md на записанном (или синтетическом) корпусе.\n"
+        "Гоняет sync_all_from_999_with_archive без настоящего API и печатает\n"
+        "adverts/sec, p50/p95 на объявление и разбивку по стадиям.\n"
+        "По умолчанию всё в транзакции с откатом — БД не меняется.\n"
+        "Тот же прогон на синтетике — pytest-benchmark (app/cars/tests/test_bench_import_999.py);\n"
+        "команда — для записанного корпуса, стенда с задержкой/429 и --compare.\n"
+        "Пример:\n"
+        "  python manage.py bench_import_999 --synthetic 200 --repeat 3 --output bench.json\n"
+        "  python manage.py bench_import_999 --corpus ./corpus --compare bench.json"
+    )
+
+    def add_arguments(self, parser: CommandParser) -> None:
+        parser.add_argument("--corpus", default=None, help="Папка с записанным корпусом (N999_RECORD_DIR).")
+        parser.add_argument("--synthetic", type=int, default=0, help="Вместо корпуса — N синтетических объявлений.")
+        parser.add_argument(
+            "--mode",
+            choices=("replay", "standin"),
+            default="replay",
+            help=(
+                "replay — ответы прямо из памяти (ReplayAdapter), чистая стоимость нашего кода; "
+                "standin — через локальный HTTP-стенд, с сокетами, задержкой и 429."
+            ),
+        )
+        parser.add_argument("--latency-ms", type=float, default=0.0, help="standin: задержка ответа.")
+        parser.add_argument("--rate-429", type=float, default=0.0, help="standin: доля ответов 429 (0..1).")
+        parser.add_argument("--page-size", type=int, default=25)
+        parser.add_argument("--max-items", type=int, default=None)
+        parser.add_argument("--repeat", type=int, default=1, help="Сколько прогонов (в отчёте — медиана).")
+        parser.add_argument(
+            "--ratelimit",
+            default="off",
+            help="Бэкенд лимитера на время бенчмарка: off | memory | redis (по умолчанию off).",
+        )
+        parser.add_argument(
+            "--cache",
+            default="off",
+            help="Бэкенд HTTP-кеша на время бенчмарка: off | memory | redis (по умолчанию off).",
+        )
+        parser.add_argument("--output", default=None, help="Сохранить результат в JSON.")
+        parser.add_argument("--compare", default=None, help="Сравнить с прошлым JSON-результатом.")
+        parser.add_argument("--keep", action="store_true", help="Не откатывать изменения в БД.")
+        parser.add_argument(
+            "--delta",
+            action="store_true",
+            help="Включить дельту по листингу (по умолчанию бенчмарк меряет полный импорт).",
+        )
+        parser.add_argument(
+            "--html-slice",
+            choices=("on", "off"),
+            default=None,
+            help="Нарезка публичных страниц (html_slice): on — читать до блока характеристик, off — целиком. "
+                 "По умолчанию — как в N999_HTML_SLICE.",
+        )
+        parser.add_argument(
+            "--pipeline",
+            action="store_true",
+            help="Импорт конвейером (import_pipeline); в отчёт попадают загрузка стадий и глубина очередей.",
+        )
+
+    def handle(self, *args, **options):
+        if options["corpus"]:
+            corpus = Corpus.load(options["corpus"])
+        elif options["synthetic"]:
+            corpus = Corpus.synthetic(options["synthetic"])
+        else:
+            raise CommandError("Укажи --corpus DIR или --synthetic N")
+        if not len(corpus):
+            raise CommandError("Корпус пустой")
+        if options["pipeline"] and options["delta"] and not options["keep"]:
+            # дельта пишет в БД из потока листинга — мимо транзакции, которую бенчмарк откатывает
+            raise CommandError("--pipeline вместе с --delta — только с --keep")
+
+        # ключ нужен только чтобы собрать заголовок — наружу запросы не уходят
+        os.environ.setdefault("N999_API_KEY", "bench")
+        configure_limiter(options["ratelimit"])
+        configure_cache(options["cache"])
+        if options["html_slice"]:
+            html_slice.configure_html_slice(options["html_slice"] == "on")
+
+        server = None
+        client = partners999.get_client()
+        if options["mode"] == "standin":
+            server = start_in_thread(corpus, config=StandinConfig(
+                latency_ms=options["latency_ms"],
+                rate_429=options["rate_429"],
+                seed=1,
+            ))
+            partners999.API_BASE = server.base_url
+            partners999.PUBLIC_BASE = server.base_url
+        else:
+            client.mount_replay(corpus)
+
+        runs = []
+        try:
+            for n in range(max(1, options["repeat"])):
+                result = self._run_once(options)
+                runs.append(result)
+                self.stdout.write(
+                    f"  run {n + 1}: {result['adverts']} объявлений за {result['elapsed_s']} c "
+                    f"-> {result['adverts_per_sec']} adverts/sec"
+                )
+        finally:
+            if server is not None:
+                server.shutdown()
+                server.server_close()
+
+        report = {
+            "corpus": options["corpus"] or f"synthetic:{options['synthetic']}",
+            "mode": options["mode"],
+            "html_mode": import_service.HTML_MODE,
+            "html_slice": html_slice.SLICE,
+            "concurrency": import_service.CONCURRENCY,
+            "page_size": options["page_size"],
+            "pipeline": options["pipeline"],
+            "repeat": len(runs),
+            "adverts_per_sec": round(statistics.median(r["adverts_per_sec"] for r in runs), 2),
+            "p50_ms": round(statistics.median(r["per_advert"]["p50_ms"] for r in runs), 2),
+            "p95_ms": round(statistics.median(r["per_advert"]["p95_ms"] for r in runs), 2),
+            # сколько в среднем скачали на одну публичную страницу
+            "html_kib": round(statistics.median((r["http"].get("public_html") or {}).get("avg_kib") or 0 for r in runs), 1),
+            "runs": runs,
+        }
+        self._print_report(report)
+
+        if options["compare"]:
+            self._print_compare(report, options["compare"])
+        if options["output"]:
+            with open(options["output"], "w", encoding="utf-8") as fh:
+                json.dump(report, fh, ensure_ascii=False, indent=2)
+            self.stdout.write(self.style.SUCCESS(f"[OK] Результат сохранён в {options['output']}"))
+
+    # ---------- прогон ----------
+
+    def _run_once(self, options) -> dict:
+        metrics = ImportMetrics()
+        with transaction.atomic():
+            stats = import_service.sync_all_from_999_with_archive(
+                page_size=options["page_size"],
+                max_items=options["max_items"],
+                metrics=metrics,
+                delta=options["delta"],
+                pipeline=options["pipeline"],
+            )
+            if not options["keep"]:
+                transaction.set_rollback(True)
+
+        result = metrics.summary()
+        http = stats.get("http") or {}
+        result["http"] = {
+            name: {
+                k: ep.get(k)
+                for k in ("calls", "errors", "retries", "status_429", "total_s", "p50_ms", "p95_ms", "bytes", "avg_kib")
+            }
+            for name, ep in (http.get("endpoints") or {}).items()
+        }
+        result["handshakes"] = http.get("handshakes")
+        if http.get("html_slice"):
+            result["html_slice"] = http["html_slice"]
+        result["fetch_plan"] = {k: v for k, v in (stats.get("fetch_plan") or {}).items() if not isinstance(v, dict)}
+        if stats.get("pipeline"):
+            result["pipeline"] = stats["pipeline"]
+        return result
+
+    # ---------- вывод ----------
+
+    def _print_report(self, report: dict) -> None:
+        # разбивку по стадиям печатаем по медианному (по скорости) прогону
+        runs = sorted(report["runs"], key=lambda r: r["adverts_per_sec"])
+        run = runs[len(runs) // 2]
+        self.stdout.write(self.style.SUCCESS(
+            f"[OK] {report['adverts_per_sec']} adverts/sec, "
+            f"на объявление p50={report['p50_ms']} мс, p95={report['p95_ms']} мс "
+            f"(mode={report['mode']}, html={report['html_mode']}, slice={'on' if report['html_slice'] else 'off'}, "
+            f"concurrency={report['concurrency']})"
+        ))
+        stages = run["stages"]
+        total = run["elapsed_s"] or 1.0
+        self.stdout.write(f"  {'стадия':<16}{'вызовов':>9}{'всего, c':>11}{'доля':>8}{'p50, мс':>10}{'p95, мс':>10}")
+        for name in STAGES + tuple(sorted(set(stages) - set(STAGES))):
+            s = stages.get(name)
+            if not s:
+                continue
+            self.stdout.write(
+                f"  {name:<16}{s['count']:>9}{s['total_s']:>11.3f}{s['total_s'] / total:>8.0%}"
+                f"{s['p50_ms']:>10.2f}{s['p95_ms']:>10.2f}"
+            )
+        pipeline = run.get("pipeline")
+        if pipeline:
+            self.stdout.write(f"  {'конвейер':<16}{'воркеров':>9}{'работа, c':>11}{'загрузка':>10}{'ждал, c':>10}")
+            for name, st in pipeline["stages"].items():
+                self.stdout.write(
+                    f"  {name:<16}{st['workers']:>9}{st['busy_s']:>11.3f}{st['utilisation']:>10.0%}{st['blocked_s']:>10.3f}"
+                )
+            self.stdout.write(
+                "  очереди: "
+                + ", ".join(f"{name} ср. {q['avg_depth']} / макс. {q['max_depth']} из {q['maxsize']}"
+                            for name, q in pipeline["queues"].items())
+                + f"; узкое место — {pipeline['bottleneck']}"
+            )
+        for name, ep in run["http"].items():
+            self.stdout.write(
+                f"  http {name:<11}{ep['calls']:>9}{ep['total_s']:>11.3f}"
+                f"{'':>8}{ep['p50_ms']:>10.2f}{ep['p95_ms']:>10.2f}  {ep.get('avg_kib') or 0:.1f} КиБ/запрос"
+                + (f"  429={ep['status_429']} retries={ep['retries']}" if ep.get("status_429") or ep.get("retries") else "")
+            )
+        sliced = run.get("html_slice")
+        if sliced and sliced.get("pages"):
+            self.stdout.write(
+                f"  нарезка: {sliced['pages']} стр., остановились раньше конца — {sliced['stopped_early']}, "
+                f"оборвали соединение — {sliced['truncated']}; в разбор ушло "
+                f"{sliced['chars_kept'] / max(1, sliced['chars_scanned']):.0%} просканированного"
+            )
+
+    def _print_compare(self, report: dict, path: str) -> None:
+        try:
+            with open(path, encoding="utf-8") as fh:
+                prev = json.load(fh)
+        except (OSError, ValueError) as e:
+            raise CommandError(f"Не смог прочитать {path}: {e}")
+
+        def delta(key: str) -> str:
+            old, new = prev.get(key) or 0, report.get(key) or 0
+            if not old:
+                return f"{key}: {old} -> {new}"
+            return f"{key}: {old} -> {new} ({(new - old) / old:+.1%})"
+
+        self.stdout.write("Сравнение с " + path + ":")
+        for key in ("adverts_per_sec", "p50_ms", "p95_ms", "html_kib"):
+            self.stdout.write("  " + delta(key))
@@ -1,11 +1,18 @@
-from django.core.management.base import BaseCommand, CommandParser
+import json
+
+from django.core.management.base import BaseCommand, CommandError, CommandParser
 from django.utils import timezone
 
 from app.cars.services.import_999 import (
+    import_adverts_from_999,
+    retry_failed_adverts_from_999,
     sync_all_from_999,
     sync_all_from_999_with_archive,
+    sync_liveness_from_999,
     upsert_car_from_999,
 )
+from app.cars.tasks import SYNC_LOCK_NAME
+from app.integrations.sync_lock import sync_lock
 
 
 class Command(BaseCommand):
@@ -13,7 +20,9 @@ class Command(BaseCommand):
         "Импорт / обновление объявлений из 999.md в локальную БД (cars).\n"
         "Без флага --with-archive: просто апсерты/обновления.\n"
         "С флагом --with-archive: плюс деактивация машин, "
-        "которых больше нет на 999.md."
+        "которых больше нет на 999.md.\n"
+        "С флагом --liveness: быстрый режим — только листинг, last_seen_at, "
+        "архивация исчезнувших и полный импорт лишь новых объявлений."
     )
 
     def add_arguments(self, parser: CommandParser) -> None:
@@ -55,7 +64,94 @@ class Command(BaseCommand):
             ),
         )
 
+        parser.add_argument(
+            "--full",
+            dest="full",
+            action="store_true",
+            help=(
+                "С --with-archive: полный импорт всех объявлений, без дельты по листингу "
+                "(по умолчанию заново тянем только изменившиеся / устаревшие)."
+            ),
+        )
+
+        parser.add_argument(
+            "--resume",
+            dest="resume",
+            action="store_true",
+            help=(
+                "С --with-archive: продолжить последний незавершённый прогон (SyncRun) "
+                "с его страницы, а не начинать с первой."
+            ),
+        )
+
+        parser.add_argument(
+            "--pipeline",
+            dest="pipeline",
+            action="store_true",
+            default=None,
+            help=(
+                "С --with-archive: импорт конвейером (скачивание, разбор и запись "
+                "параллельно, через ограниченные очереди); по умолчанию — N999_PIPELINE."
+            ),
+        )
+
+        # быстрый режим «живости»
+        parser.add_argument(
+            "--liveness",
+            dest="liveness",
+            action="store_true",
+            help=(
+                "Только пройти листинг: отметить last_seen_at у известных машин, "
+                "заархивировать исчезнувшие, а полностью импортировать только новые id."
+            ),
+        )
+        parser.add_argument(
+            "--no-import-new",
+            dest="import_new",
+            action="store_false",
+            help="С --liveness: новые id только вывести, не импортировать.",
+        )
+
+        parser.add_argument(
+            "--no-lock",
+            dest="lock",
+            action="store_false",
+            help=(
+                "Не брать лок синка 999 (его уже держит вызывающий — import_999_task). "
+                "По умолчанию команда берёт тот же лок, что и задачи Celery, и не "
+                "запускается, пока идёт другой синк."
+            ),
+        )
+
+        parser.add_argument(
+            "--retry-failed",
+            dest="retry_failed",
+            action="store_true",
+            help=(
+                "Повторить объявления из dead-letter (FailedAdvert), у которых подошло "
+                "время следующей попытки (не больше --max-items, по умолчанию 100)."
+            ),
+        )
+
     def handle(self, *args, **options):
+        if not options["lock"]:
+            self._handle(options, guard=None)
+            return
+        with sync_lock(SYNC_LOCK_NAME, "command") as lock:
+            if not lock.acquired:
+                if lock.error:
+                    raise CommandError(
+                        f"Лок синка 999 недоступен, не запускаемся: {lock.error}\n"
+                        "Локально без Redis: N999_SYNC_LOCK_BACKEND=memory"
+                    )
+                holder = lock.state().get("holder") or {}
+                raise CommandError(
+                    f"Синк 999 уже идёт ({holder.get('kind')}, task {holder.get('task_id')}, "
+                    f"{holder.get('host')}:{holder.get('pid')}) — не запускаемся"
+                )
+            self._handle(options, guard=lock.ensure_held)
+
+    def _handle(self, options, guard):
         advert_id = options["advert_id"]
         page_size = options["page_size"]
         max_items = options["max_items"]
@@ -77,13 +173,51 @@ class Command(BaseCommand):
             )
             return
 
+        if options["retry_failed"]:
+            stats = retry_failed_adverts_from_999(limit=max_items or 100, guard=guard)
+            self.stdout.write(
+                self.style.SUCCESS(
+                    "[OK] Повтор упавших объявлений:\n"
+                    f"  К повтору: {stats['due']}\n"
+                    f"  Импортировано: {stats['imported']}\n"
+                    f"  Уже в архиве (не повторяем): {stats['archived']}\n"
+                    f"  Снова упало: {stats['failed']} (из них больше не повторяем: {stats['given_up']})"
+                )
+            )
+            return
+
+        if options["liveness"]:
+            stats = sync_liveness_from_999(page_size=page_size, guard=guard)
+            new_ids = stats["new_ids"]
+            self.stdout.write(
+                self.style.SUCCESS(
+                    "[OK] Синк живости (только листинг):\n"
+                    f"  Активных объявлений замечено на 999.md: {stats['active_seen']}\n"
+                    f"  Обновлён last_seen_at: {stats['touched']}\n"
+                    f"  Помечено как archived: {stats['archived']}\n"
+                    f"  Новых / вернувшихся id: {len(new_ids)}"
+                )
+            )
+            if new_ids and options["import_new"]:
+                if max_items:
+                    new_ids = new_ids[:max_items]
+                imported = import_adverts_from_999(new_ids, chunk_size=page_size, guard=guard)
+                self.stdout.write(self.style.SUCCESS(f"  Импортировано новых: {imported['imported']}"))
+            elif new_ids and options["verbosity"] > 1:
+                self.stdout.write("  " + " ".join(new_ids))
+            return
+
         # Массовый режим
         if with_archive:
             stats = sync_all_from_999_with_archive(
                 page_size=page_size,
                 max_items=max_items,
+                delta=False if options["full"] else None,
+                resume=options["resume"],
+                pipeline=options["pipeline"],
+                guard=guard,
             )
-            # stats = {"imported": X, "archived": Y, "active_seen": Z}
+            # stats = {"imported": X, "archived": Y, "active_seen": Z, "timings": {...}, ...}
             self.stdout.write(
                 self.style.SUCCESS(
                     "[OK] Полная синхронизация с архивированием:\n"
@@ -92,10 +226,45 @@ class Command(BaseCommand):
                     f"  Помечено как archived (снято с витрины): {stats.get('archived')}"
                 )
             )
+            if stats.get("failed"):
+                self.stdout.write(self.style.WARNING(
+                    f"  Упало и отложено на повтор (FailedAdvert): {stats['failed']}"
+                ))
+            run = stats.get("run") or {}
+            self.stdout.write(
+                f"  Прогон SyncRun #{run.get('id')}: страниц {run.get('pages')}, "
+                f"возобновлялся {run.get('resumed')} раз, листинг пройден целиком: "
+                f"{'да' if run.get('listing_done') else 'нет (архивацию пропустили)'}"
+            )
+            delta = stats.get("delta")
+            if delta:
+                self.stdout.write(
+                    f"  Дельта по листингу: полностью {delta['full']}, без изменений {delta['skipped']}, "
+                    f"только цена {delta['price_only']}"
+                )
+            timings = stats.get("timings") or {}
+            if timings:
+                per_advert = timings.get("per_advert") or {}
+                self.stdout.write(
+                    f"  Время: {timings.get('elapsed_s')} c, {timings.get('adverts_per_sec')} объявл./с, "
+                    f"на объявление p50={per_advert.get('p50_ms')} мс, p95={per_advert.get('p95_ms')} мс"
+                )
+            pipeline = stats.get("pipeline")
+            if pipeline:
+                self.stdout.write(
+                    "  Конвейер: загрузка "
+                    + ", ".join(f"{name} {st['utilisation']:.0%}" for name, st in pipeline["stages"].items())
+                    + f"; узкое место — {pipeline['bottleneck']}"
+                )
+            if options["verbosity"] > 1:
+                for key in ("http", "concurrency", "fetch_plan", "delta", "timings", "pipeline"):
+                    if stats.get(key):
+                        self.stdout.write(f"{key}:\n" + json.dumps(stats[key], ensure_ascii=False, indent=2))
         else:
             imported_count = sync_all_from_999(
                 page_size=page_size,
                 max_items=max_items,
+                guard=guard,
             )
             self.stdout.write(
                 self.style.SUCCESS(
@@ -0,0 +1,61 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from app.integrations.replay import Corpus
+from app.integrations.standin_999 import StandinConfig, make_server
+
+
+class Command(BaseCommand):
+    help = (
+        "Локальный двойник partners API / 999.md для офлайн-бенчмарков.\n"
+        "Отдаёт записанный корпус (N999_RECORD_DIR) или синтетический сток.\n"
+        "Импорт направляем сюда так:\n"
+        "  N999_API_BASE=http://127.0.0.1:8999 N999_PUBLIC_BASE=http://127.0.0.1:8999 "
+        "python manage.py import_999 --with-archive"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--corpus", default=None, help="Папка с записанным корпусом.")
+        parser.add_argument(
+            "--synthetic",
+            type=int,
+            default=0,
+            help="Вместо корпуса сгенерировать N фейковых объявлений.",
+        )
+        parser.add_argument("--save", default=None, help="Сохранить (синтетический) корпус в папку и выйти.")
+        parser.add_argument("--host", default="127.0.0.1")
+        parser.add_argument("--port", type=int, default=8999)
+        parser.add_argument("--latency-ms", type=float, default=0.0, help="Задержка на каждый ответ.")
+        parser.add_argument("--jitter-ms", type=float, default=0.0, help="Разброс задержки (±).")
+        parser.add_argument("--rate-429", type=float, default=0.0, help="Доля ответов 429 (0..1).")
+        parser.add_argument("--retry-after", type=int, default=1, help="Retry-After для 429, секунды.")
+
+    def handle(self, *args, **options):
+        if options["corpus"]:
+            corpus = Corpus.load(options["corpus"])
+        elif options["synthetic"]:
+            corpus = Corpus.synthetic(options["synthetic"])
+        else:
+            raise CommandError("Укажи --corpus DIR или --synthetic N")
+
+        if options["save"]:
+            corpus.save(options["save"])
+            self.stdout.write(self.style.SUCCESS(f"[OK] Корпус ({len(corpus)} объявлений) сохранён в {options['save']}"))
+            return
+
+        config = StandinConfig(
+            latency_ms=options["latency_ms"],
+            jitter_ms=options["jitter_ms"],
+            rate_429=options["rate_429"],
+            retry_after=options["retry_after"],
+        )
+        server = make_server(corpus, options["host"], options["port"], config)
+        self.stdout.write(self.style.SUCCESS(
+            f"[OK] Стенд 999.md на {server.base_url} ({len(corpus)} объявлений). Ctrl+C — остановить."
+        ))
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
+            self.stdout.write(f"Ответы: {server.stats}")
@@ -0,0 +1,22 @@
+# Generated by Django 5.1.1 on 2026-10-18 18:22
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cars', '0009_car_fuel_type_canonical'),
+    ]
+
+    operations = [
+        migrations.AddConstraint(
+            model_name='car',
+            constraint=models.UniqueConstraint(fields=('source', 'external_id'), name='car_source_external_id_uniq'),
+        ),
+        migrations.AlterField(
+            model_name='car',
+            name='external_id',
+            field=models.CharField(db_index=True, max_length=64, verbose_name='ID на стороне источника'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.1.1 on 2026-10-18 18:24
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cars', '0010_car_source_external_id_uniq'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='car',
+            name='content_hash',
+            field=models.CharField(blank=True, default='', editable=False, max_length=40, verbose_name='Отпечаток содержимого'),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.1.1 on 2026-10-18 18:25
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cars', '0011_car_content_hash'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='car',
+            name='detail_synced_at',
+            field=models.DateTimeField(blank=True, editable=False, null=True, verbose_name='Последний полный импорт'),
+        ),
+        migrations.AddField(
+            model_name='car',
+            name='listing_hash',
+            field=models.CharField(blank=True, default='', editable=False, max_length=40, verbose_name='Отпечаток записи листинга'),
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 5.1.1 on 2026-10-18 18:27
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cars', '0012_car_listing_hash_detail_synced_at'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='car',
+            index=models.Index(fields=['source', 'active', 'last_seen_at'], name='car_src_active_seen_idx'),
+        ),
+    ]
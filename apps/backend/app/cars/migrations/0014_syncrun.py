@@ -0,0 +1,39 @@
+# Generated by Django 5.1.1 on 2026-10-18 18:28
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cars', '0013_car_src_active_seen_idx'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SyncRun',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('source', models.CharField(default='999', max_length=32, verbose_name='Источник')),
+                ('kind', models.CharField(default='full', max_length=32, verbose_name='Режим')),
+                ('status', models.CharField(choices=[('running', 'Running'), ('completed', 'Completed'), ('failed', 'Failed'), ('abandoned', 'Abandoned')], db_index=True, default='running', max_length=16, verbose_name='Статус')),
+                ('started_at', models.DateTimeField(default=django.utils.timezone.now, verbose_name='Начат (водяной знак)')),
+                ('finished_at', models.DateTimeField(blank=True, null=True, verbose_name='Завершён')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='Последний чекпоинт')),
+                ('page_size', models.IntegerField(default=25, verbose_name='Размер страницы')),
+                ('max_items', models.IntegerField(blank=True, null=True, verbose_name='Лимит объявлений')),
+                ('delta', models.BooleanField(default=True, verbose_name='Дельта по листингу')),
+                ('page', models.IntegerField(default=0, verbose_name='Обработано страниц')),
+                ('listing_done', models.BooleanField(default=False, verbose_name='Листинг пройден целиком')),
+                ('resumed', models.IntegerField(default=0, verbose_name='Сколько раз возобновляли')),
+                ('counters', models.JSONField(blank=True, default=dict, verbose_name='Счётчики')),
+                ('error', models.TextField(blank=True, default='', verbose_name='Ошибка')),
+            ],
+            options={
+                'verbose_name': 'Прогон синка',
+                'verbose_name_plural': 'Прогоны синка',
+                'ordering': ['-started_at'],
+            },
+        ),
+    ]
@@ -0,0 +1,37 @@
+# Generated by Django 5.1.1 on 2026-10-18 18:32
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cars', '0014_syncrun'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FailedAdvert',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('source', models.CharField(default='999', max_length=32, verbose_name='Источник')),
+                ('external_id', models.CharField(max_length=64, verbose_name='ID объявления')),
+                ('status', models.CharField(choices=[('pending', 'Pending'), ('resolved', 'Resolved'), ('given_up', 'Given up')], default='pending', max_length=16, verbose_name='Статус')),
+                ('error_class', models.CharField(blank=True, default='', max_length=128, verbose_name='Класс ошибки')),
+                ('error', models.TextField(blank=True, default='', verbose_name='Ошибка')),
+                ('attempts', models.IntegerField(default=1, verbose_name='Попыток')),
+                ('first_failed_at', models.DateTimeField(default=django.utils.timezone.now, verbose_name='Первая ошибка')),
+                ('last_failed_at', models.DateTimeField(default=django.utils.timezone.now, verbose_name='Последняя ошибка')),
+                ('next_retry_at', models.DateTimeField(blank=True, null=True, verbose_name='Следующая попытка')),
+                ('resolved_at', models.DateTimeField(blank=True, null=True, verbose_name='Импортировано')),
+            ],
+            options={
+                'verbose_name': 'Упавшее объявление',
+                'verbose_name_plural': 'Упавшие объявления',
+                'ordering': ['-last_failed_at'],
+                'indexes': [models.Index(fields=['status', 'next_retry_at'], name='failedadvert_due_idx')],
+                'constraints': [models.UniqueConstraint(fields=('source', 'external_id'), name='failedadvert_source_external_id_uniq')],
+            },
+        ),
+    ]
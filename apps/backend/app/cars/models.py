@@ -72,13 +72,40 @@ class Car(models.Model):
         verbose_name="Источник",
     )
 
+    # уникальность — в паре с source (см. Meta.constraints):
+    # на неё опирается пакетный апсерт импорта (INSERT ... ON CONFLICT)
     external_id = models.CharField(
         max_length=64,
-        unique=True,
         db_index=True,
         verbose_name="ID на стороне источника",
     )
 
+    # отпечаток нормализованной записи + списка фото (см. import_999.content_fingerprint):
+    # при повторном импорте совпал -> строку и фото не переписываем, только last_seen_at
+    content_hash = models.CharField(
+        max_length=40,
+        blank=True,
+        default="",
+        editable=False,
+        verbose_name="Отпечаток содержимого",
+    )
+
+    # отпечаток записи в листинге 999 (без цены) и время последнего полного импорта:
+    # по ним синк решает, тянуть ли advert/features/HTML заново
+    listing_hash = models.CharField(
+        max_length=40,
+        blank=True,
+        default="",
+        editable=False,
+        verbose_name="Отпечаток записи листинга",
+    )
+    detail_synced_at = models.DateTimeField(
+        null=True,
+        blank=True,
+        editable=False,
+        verbose_name="Последний полный импорт",
+    )
+
     status = models.CharField(
         max_length=32,
         choices=Status.choices,
@@ -349,6 +376,16 @@ class Car(models.Model):
         verbose_name = "Авто"
         verbose_name_plural = "Авто"
         ordering = ["-updated_at", "-created_at"]
+        constraints = [
+            models.UniqueConstraint(
+                fields=["source", "external_id"],
+                name="car_source_external_id_uniq",
+            ),
+        ]
+        indexes = [
+            # архивация импорта: active машины источника, не замеченные с начала синка
+            models.Index(fields=["source", "active", "last_seen_at"], name="car_src_active_seen_idx"),
+        ]
 
     def __str__(self):
         base = f"{self.make} {self.model}".strip()
@@ -499,3 +536,103 @@ class Photo(models.Model):
 
     def __str__(self):
         return f"Photo {self.id} / car {self.car_id}"
+
+
+class SyncRun(models.Model):
+    """
+    Один прогон синка с 999.md — чекпоинт, чтобы упавший прогон
+    (рестарт воркера, деплой, лежащий API) продолжить с места падения,
+    а не со страницы 1.
+
+    started_at — водяной знак: все машины, увиденные прогоном, получают
+    last_seen_at = started_at (в т.ч. после возобновления), архивация —
+    по last_seen_at < started_at и только когда листинг пройден целиком.
+    """
+
+    class Status(models.TextChoices):
+        RUNNING = "running", "Running"
+        COMPLETED = "completed", "Completed"
+        FAILED = "failed", "Failed"
+        ABANDONED = "abandoned", "Abandoned"
+
+    source = models.CharField(max_length=32, default="999", verbose_name="Источник")
+    kind = models.CharField(max_length=32, default="full", verbose_name="Режим")
+    status = models.CharField(
+        max_length=16,
+        choices=Status.choices,
+        default=Status.RUNNING,
+        db_index=True,
+        verbose_name="Статус",
+    )
+
+    started_at = models.DateTimeField(default=timezone.now, verbose_name="Начат (водяной знак)")
+    finished_at = models.DateTimeField(null=True, blank=True, verbose_name="Завершён")
+    updated_at = models.DateTimeField(auto_now=True, verbose_name="Последний чекпоинт")
+
+    # параметры прогона — при возобновлении берём их, а не новые
+    page_size = models.IntegerField(default=25, verbose_name="Размер страницы")
+    max_items = models.IntegerField(null=True, blank=True, verbose_name="Лимит объявлений")
+    delta = models.BooleanField(default=True, verbose_name="Дельта по листингу")
+
+    # курсор: последняя полностью обработанная страница листинга
+    page = models.IntegerField(default=0, verbose_name="Обработано страниц")
+    listing_done = models.BooleanField(default=False, verbose_name="Листинг пройден целиком")
+    resumed = models.IntegerField(default=0, verbose_name="Сколько раз возобновляли")
+
+    counters = models.JSONField(default=dict, blank=True, verbose_name="Счётчики")
+    error = models.TextField(blank=True, default="", verbose_name="Ошибка")
+
+    class Meta:
+        verbose_name = "Прогон синка"
+        verbose_name_plural = "Прогоны синка"
+        ordering = ["-started_at"]
+
+    def __str__(self):
+        return f"SyncRun {self.id} {self.source}/{self.kind} {self.status} page={self.page}"
+
+
+class FailedAdvert(models.Model):
+    """
+    Dead-letter для объявлений 999.md, на которых импорт падает
+    (HTTP после всех ретраев, ошибка разбора). Синк такое объявление
+    пропускает и идёт дальше, а повторяет его отдельная задача
+    (retry_failed_adverts_999_task) с экспоненциальным интервалом.
+    """
+
+    class Status(models.TextChoices):
+        PENDING = "pending", "Pending"
+        RESOLVED = "resolved", "Resolved"
+        GIVEN_UP = "given_up", "Given up"
+
+    source = models.CharField(max_length=32, default="999", verbose_name="Источник")
+    external_id = models.CharField(max_length=64, verbose_name="ID объявления")
+    status = models.CharField(
+        max_length=16,
+        choices=Status.choices,
+        default=Status.PENDING,
+        verbose_name="Статус",
+    )
+
+    error_class = models.CharField(max_length=128, blank=True, default="", verbose_name="Класс ошибки")
+    error = models.TextField(blank=True, default="", verbose_name="Ошибка")
+    attempts = models.IntegerField(default=1, verbose_name="Попыток")
+
+    first_failed_at = models.DateTimeField(default=timezone.now, verbose_name="Первая ошибка")
+    last_failed_at = models.DateTimeField(default=timezone.now, verbose_name="Последняя ошибка")
+    next_retry_at = models.DateTimeField(null=True, blank=True, verbose_name="Следующая попытка")
+    resolved_at = models.DateTimeField(null=True, blank=True, verbose_name="Импортировано")
+
+    class Meta:
+        verbose_name = "Упавшее объявление"
+        verbose_name_plural = "Упавшие объявления"
+        ordering = ["-last_failed_at"]
+        constraints = [
+            models.UniqueConstraint(fields=["source", "external_id"], name="failedadvert_source_external_id_uniq"),
+        ]
+        indexes = [
+            # выборка задачи повторов: status=pending и next_retry_at <= now
+            models.Index(fields=["status", "next_retry_at"], name="failedadvert_due_idx"),
+        ]
+
+    def __str__(self):
+        return f"FailedAdvert {self.source}/{self.external_id} {self.status} x{self.attempts}"
@@ -0,0 +1,464 @@
+"""
+Бэкенды разбора публичной страницы 999.md.
+
+Импорту от страницы нужно немного: мета-теги (цена, og:*), пары
+«ключ — значение» из таблицы характеристик (классы вида
+styles_group__row__AbCdE / group__key__ / group__value__) и кандидаты
+в фотки. Это и есть интерфейс ParsedPage; за ним три реализации:
+
+  selectolax — C-парсер (lexbor), CSS [class*="group__row__"]
+  lxml       — libxml2, XPath contains(@class, ...)
+  bs4        — BeautifulSoup(html.parser), чистый Python, эталон и fallback
+
+N999_HTML_PARSER: auto (по умолчанию — первый доступный из selectolax,
+lxml, bs4) | selectolax | lxml | bs4. Быстрые бэкенды — опциональные
+зависимости: нет пакета — берём следующий. Если быстрый бэкенд упал на
+конкретной странице — в конструкторе или в любом из методов, — этот вызов
+отвечает bs4 по той же странице (FallbackPage), в лог — предупреждение.
+
+На вход обычно приходит не вся страница, а её нарезка (app.integrations.html_slice):
+meta, ссылки на фотки и блок характеристик — разбор тот же.
+
+Паритет с bs4 на корпусе — manage.py bench_html_parsers (с --slice —
+нарезка против целой страницы), скорость — app/cars/tests/test_bench_html_parsers.py.
+"""
+import logging
+import os
+from typing import Callable, Dict, List, Optional, Tuple
+
+from bs4 import BeautifulSoup
+
+from app.integrations.html_slice import script_image_urls
+
+try:
+    from lxml import html as lxml_html
+except ImportError:  # pragma: no cover - опциональная зависимость
+    lxml_html = None
+
+try:
+    from selectolax.lexbor import LexborHTMLParser as SelectolaxParser
+except ImportError:  # pragma: no cover - опциональная зависимость
+    try:
+        # selectolax < 0.3.13: только modest
+        from selectolax.parser import HTMLParser as SelectolaxParser
+    except ImportError:
+        SelectolaxParser = None
+
+BACKEND = os.getenv("N999_HTML_PARSER", "auto").lower()
+
+logger = logging.getLogger(__name__)
+
+ROW, KEY, VALUE = "group__row__", "group__key__", "group__value__"
+IMAGE_META = ("og:image", "og:image:secure_url")
+
+
+def _is_image_link(v: Optional[str]) -> bool:
+    return bool(v) and ("BoardImages" in v or "999.md" in v)
+
+
+class ParsedPage:
+    """Разобранная страница. Все методы — в порядке документа, как у bs4."""
+
+    backend = ""
+
+    def meta(self, prop: str) -> Optional[str]:
+        """content первого <meta property=prop> (как есть, без strip)."""
+        raise NotImplementedError
+
+    def spec_pairs(self) -> List[Tuple[str, str]]:
+        """(ключ, значение) из таблицы характеристик: сначала по row, если пусто — по key."""
+        raise NotImplementedError
+
+    def image_candidates(self) -> List[str]:
+        """og:image, затем img/a со ссылкой на BoardImages / 999.md, затем url картинок из <script>."""
+        raise NotImplementedError
+
+
+# =========================
+# bs4 (эталон)
+# =========================
+
+def _has_class_part(el, needle_substr: str) -> bool:
+    """
+    Возвращает True если у тега есть класс, содержащий needle_substr.
+    Например, needle_substr="group__row__" поймает styles_group__row__AbCdE
+    """
+    for cls in el.get("class", []):
+        if needle_substr in cls:
+            return True
+    return False
+
+
+class Bs4Page(ParsedPage):
+    backend = "bs4"
+
+    def __init__(self, html: str):
+        self.soup = BeautifulSoup(html, "html.parser")
+
+    def meta(self, prop: str) -> Optional[str]:
+        m = self.soup.find("meta", {"property": prop})
+        return m.get("content") if m else None
+
+    def spec_pairs(self) -> List[Tuple[str, str]]:
+        soup = self.soup
+        pairs: List[Tuple[str, str]] = []
+
+        # pass 1: искать строки-характеристики по row-контейнеру
+        for row in soup.find_all(lambda tag: _has_class_part(tag, ROW)):
+            key_el = None
+            val_el = None
+
+            # ищем внутри row элементы с классами содержащими 'group__key__' и 'group__value__'
+            for child in row.find_all(recursive=False):
+                if _has_class_part(child, KEY):
+                    key_el = child
+                if _has_class_part(child, VALUE):
+                    val_el = child
+
+            # иногда value / key лежат глубже
+            if val_el is None:
+                val_el = row.find(lambda t: _has_class_part(t, VALUE))
+            if key_el is None:
+                key_el = row.find(lambda t: _has_class_part(t, KEY))
+
+            if not key_el or not val_el:
+                continue
+
+            raw_label = key_el.get_text(" ", strip=True)
+            raw_value = val_el.get_text(" ", strip=True)
+            if raw_label and raw_value:
+                pairs.append((raw_label, raw_value))
+
+        if pairs:
+            return pairs
+
+        # pass 2 (fallback): напрямую по ключам
+        for key_el in soup.find_all(lambda tag: _has_class_part(tag, KEY)):
+            raw_label = key_el.get_text(" ", strip=True)
+            if not raw_label:
+                continue
+
+            # value может быть соседом или во всём родителе
+            parent = key_el.parent
+            val_el = None
+
+            # прямые дети родителя
+            for child in parent.find_all(recursive=False):
+                if _has_class_part(child, VALUE):
+                    val_el = child
+                    break
+
+            # соседи
+            if not val_el:
+                sib = key_el.next_sibling
+                while sib and not val_el:
+                    if getattr(sib, "get", None) and _has_class_part(sib, VALUE):
+                        val_el = sib
+                        break
+                    sib = sib.next_sibling
+
+            # любой потомок
+            if not val_el:
+                val_el = parent.find(lambda t: _has_class_part(t, VALUE))
+
+            if not val_el:
+                continue
+
+            raw_value = val_el.get_text(" ", strip=True)
+            if raw_value:
+                pairs.append((raw_label, raw_value))
+        return pairs
+
+    def image_candidates(self) -> List[str]:
+        imgs: List[str] = []
+        for m in self.soup.find_all("meta"):
+            if m.get("property") in IMAGE_META and m.get("content"):
+                imgs.append(m.get("content"))
+        for el in self.soup.select("img, a"):
+            for key in ("src", "data-src", "href"):
+                v = el.get(key)
+                if _is_image_link(v):
+                    imgs.append(v)
+        for script in self.soup.find_all("script"):
+            imgs.extend(script_image_urls(script.string or ""))
+        return imgs
+
+
+# =========================
+# lxml
+# =========================
+
+def _xp_class(needle: str) -> str:
+    return f"contains(@class, '{needle}')"
+
+
+def _lxml_text(el) -> str:
+    """get_text(" ", strip=True): текстовые узлы потомков (без комментариев), стрипнутые, через пробел."""
+    return " ".join(t for t in (s.strip() for s in el.xpath(".//text()")) if t)
+
+
+def _lxml_has(el, needle: str) -> bool:
+    return needle in (el.get("class") or "")
+
+
+class LxmlPage(ParsedPage):
+    backend = "lxml"
+
+    def __init__(self, html: str):
+        self.doc = lxml_html.document_fromstring(html)
+
+    def meta(self, prop: str) -> Optional[str]:
+        # берём первый тег, а не первый @content: meta без content -> None, как у bs4
+        found = self.doc.xpath("//meta[@property=$p]", p=prop)
+        return found[0].get("content") if found else None
+
+    def spec_pairs(self) -> List[Tuple[str, str]]:
+        pairs: List[Tuple[str, str]] = []
+        for row in self.doc.xpath(f"//*[{_xp_class(ROW)}]"):
+            key_el = None
+            val_el = None
+            for child in row.iterchildren():
+                if not isinstance(child.tag, str):
+                    continue  # комментарии / PI
+                if _lxml_has(child, KEY):
+                    key_el = child
+                if _lxml_has(child, VALUE):
+                    val_el = child
+            if val_el is None:
+                found = row.xpath(f".//*[{_xp_class(VALUE)}][1]")
+                val_el = found[0] if found else None
+            if key_el is None:
+                found = row.xpath(f".//*[{_xp_class(KEY)}][1]")
+                key_el = found[0] if found else None
+            if key_el is None or val_el is None:
+                continue
+            raw_label, raw_value = _lxml_text(key_el), _lxml_text(val_el)
+            if raw_label and raw_value:
+                pairs.append((raw_label, raw_value))
+
+        if pairs:
+            return pairs
+
+        for key_el in self.doc.xpath(f"//*[{_xp_class(KEY)}]"):
+            raw_label = _lxml_text(key_el)
+            if not raw_label:
+                continue
+            parent = key_el.getparent()
+            if parent is None:
+                continue
+            val_el = next(
+                (c for c in parent.iterchildren() if isinstance(c.tag, str) and _lxml_has(c, VALUE)),
+                None,
+            )
+            if val_el is None:
+                val_el = next((s for s in key_el.itersiblings() if isinstance(s.tag, str) and _lxml_has(s, VALUE)), None)
+            if val_el is None:
+                found = parent.xpath(f".//*[{_xp_class(VALUE)}][1]")
+                val_el = found[0] if found else None
+            if val_el is None:
+                continue
+            raw_value = _lxml_text(val_el)
+            if raw_value:
+                pairs.append((raw_label, raw_value))
+        return pairs
+
+    def image_candidates(self) -> List[str]:
+        imgs: List[str] = [
+            str(c) for c in self.doc.xpath("//meta[@property='og:image' or @property='og:image:secure_url']/@content") if c
+        ]
+        for el in self.doc.xpath("//img | //a"):
+            for key in ("src", "data-src", "href"):
+                v = el.get(key)
+                if _is_image_link(v):
+                    imgs.append(v)
+        for script in self.doc.xpath("//script"):
+            imgs.extend(script_image_urls(script.text or ""))
+        return imgs
+
+
+# =========================
+# selectolax
+# =========================
+
+def _sx_css(needle: str) -> str:
+    return f'[class*="{needle}"]'
+
+
+def _sx_has(node, needle: str) -> bool:
+    # текст / комментарии (-text, -comment) классов не имеют
+    return not node.tag.startswith("-") and needle in (node.attributes.get("class") or "")
+
+
+def _sx_text(node) -> str:
+    return " ".join(t for t in (s.strip() for s in _sx_strings(node)) if t)
+
+
+def _sx_strings(node):
+    for child in node.traverse(include_text=True):
+        if child.tag == "-text":
+            yield child.text_content or ""
+
+
+class SelectolaxPage(ParsedPage):
+    backend = "selectolax"
+
+    def __init__(self, html: str):
+        self.tree = SelectolaxParser(html)
+
+    def meta(self, prop: str) -> Optional[str]:
+        for node in self.tree.css("meta[property]"):
+            if node.attributes.get("property") == prop:
+                return node.attributes.get("content")
+        return None
+
+    def spec_pairs(self) -> List[Tuple[str, str]]:
+        pairs: List[Tuple[str, str]] = []
+        for row in self.tree.css(_sx_css(ROW)):
+            key_el = None
+            val_el = None
+            for child in row.iter():
+                if _sx_has(child, KEY):
+                    key_el = child
+                if _sx_has(child, VALUE):
+                    val_el = child
+            if val_el is None:
+                val_el = row.css_first(_sx_css(VALUE))
+            if key_el is None:
+                key_el = row.css_first(_sx_css(KEY))
+            if key_el is None or val_el is None:
+                continue
+            raw_label, raw_value = _sx_text(key_el), _sx_text(val_el)
+            if raw_label and raw_value:
+                pairs.append((raw_label, raw_value))
+
+        if pairs:
+            return pairs
+
+        for key_el in self.tree.css(_sx_css(KEY)):
+            raw_label = _sx_text(key_el)
+            if not raw_label:
+                continue
+            parent = key_el.parent
+            if parent is None:
+                continue
+            val_el = next((c for c in parent.iter() if _sx_has(c, VALUE)), None)
+            if val_el is None:
+                sib = key_el.next
+                while sib is not None and val_el is None:
+                    if _sx_has(sib, VALUE):
+                        val_el = sib
+                    sib = sib.next
+            if val_el is None:
+                val_el = parent.css_first(_sx_css(VALUE))
+            if val_el is None:
+                continue
+            raw_value = _sx_text(val_el)
+            if raw_value:
+                pairs.append((raw_label, raw_value))
+        return pairs
+
+    def image_candidates(self) -> List[str]:
+        imgs: List[str] = []
+        for node in self.tree.css("meta[property]"):
+            if node.attributes.get("property") in IMAGE_META and node.attributes.get("content"):
+                imgs.append(node.attributes["content"])
+        root = self.tree.root
+        if root is not None:
+            # обход в порядке документа: css("img, a") у selectolax группирует по селектору
+            for el in root.traverse():
+                if el.tag not in ("img", "a"):
+                    continue
+                for key in ("src", "data-src", "href"):
+                    v = el.attributes.get(key)
+                    if _is_image_link(v):
+                        imgs.append(v)
+        for script in self.tree.css("script"):
+            imgs.extend(script_image_urls(script.text(deep=True) or ""))
+        return imgs
+
+
+# =========================
+# Выбор бэкенда
+# =========================
+
+BACKENDS: Dict[str, Optional[Callable[[str], ParsedPage]]] = {
+    "selectolax": SelectolaxPage if SelectolaxParser is not None else None,
+    "lxml": LxmlPage if lxml_html is not None else None,
+    "bs4": Bs4Page,
+}
+
+
+def available_backends() -> List[str]:
+    return [name for name, cls in BACKENDS.items() if cls is not None]
+
+
+def resolve_backend(name: str = BACKEND) -> str:
+    """auto -> первый доступный; недоступный явно заданный -> тоже первый доступный."""
+    if name != "auto" and BACKENDS.get(name) is not None:
+        return name
+    return available_backends()[0]
+
+
+_active = resolve_backend()
+
+
+def configure_html_parser(name: str) -> str:
+    """Подменить бэкенд (бенчмарк, отладка): auto | selectolax | lxml | bs4."""
+    global _active
+    _active = resolve_backend(name)
+    return _active
+
+
+def active_backend() -> str:
+    return _active
+
+
+class FallbackPage(ParsedPage):
+    """
+    Быстрый бэкенд с подстраховкой bs4 на уровне методов: упал meta /
+    spec_pairs / image_candidates — отвечает bs4 по той же странице
+    (дерево bs4 строим один раз, при первом падении).
+    """
+
+    def __init__(self, page: ParsedPage, html: str):
+        self.page = page
+        self.backend = page.backend
+        self._html = html
+        self._bs4: Optional[Bs4Page] = None
+
+    def _fallback(self, method: str) -> ParsedPage:
+        logger.warning("html_parsers: %s.%s упал, разбираем bs4", self.backend, method, exc_info=True)
+        if self._bs4 is None:
+            self._bs4 = Bs4Page(self._html)
+        return self._bs4
+
+    def meta(self, prop: str) -> Optional[str]:
+        try:
+            return self.page.meta(prop)
+        except Exception:
+            return self._fallback("meta").meta(prop)
+
+    def spec_pairs(self) -> List[Tuple[str, str]]:
+        try:
+            return self.page.spec_pairs()
+        except Exception:
+            return self._fallback("spec_pairs").spec_pairs()
+
+    def image_candidates(self) -> List[str]:
+        try:
+            return self.page.image_candidates()
+        except Exception:
+            return self._fallback("image_candidates").image_candidates()
+
+
+def parse_page(html: str, backend: Optional[str] = None) -> ParsedPage:
+    """Разобрать страницу выбранным бэкендом; что у быстрого упадёт — разберёт bs4."""
+    name = backend or _active
+    if name == "bs4":
+        return Bs4Page(html)
+    try:
+        page = BACKENDS[name](html)
+    except Exception:
+        logger.warning("html_parsers: %s не разобрал страницу, разбираем bs4", name, exc_info=True)
+        return Bs4Page(html)
+    return FallbackPage(page, html)
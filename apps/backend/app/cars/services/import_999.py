@@ -1,22 +1,33 @@
 import os
 import time
 import re
+import json
+import hashlib
 import datetime
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
 from decimal import Decimal, ROUND_HALF_UP
-from typing import Dict, Any, Tuple, Optional, List, Union
+from typing import Callable, Dict, Any, Iterator, Tuple, Optional, List, Union
 
 from django.db import transaction
+from django.db.models import Q
 from django.utils import timezone
 from requests import HTTPError
-from bs4 import BeautifulSoup
 
-from app.cars.models import Car, Photo
+from app.cars.models import Car, FailedAdvert, Photo, SyncRun
+from app.cars.services.html_parsers import ParsedPage, parse_page
+from app.cars.services.import_metrics import NULL_METRICS, ImportMetrics
+from app.cars.services.import_pipeline import ImportPipeline
 from app.integrations.partners999 import (
     get_adverts,
     get_advert,
     get_advert_features,
     get_public_ad_html,
+    client_stats,
+    concurrency_stats,
+    reset_client_stats,
 )
+from app.integrations.partners999_async import CONCURRENCY, fetch_advert_bundles, fetch_public_htmls
 
 # =========================
 # Конфиг
@@ -24,10 +35,41 @@ from app.integrations.partners999 import (
 LANG = os.getenv("N999_LANG", "ru")  # парсим ru, чтобы ключи были типа "Тип топлива"
 STATES = os.getenv("N999_STATES", "public")
 
+# когда качать публичную HTML-страницу объявления:
+#   auto   — только если API не дал нужных полей (или дал ненадёжные), см. plan_fetch
+#   always — всегда (старое поведение)
+#   never  — никогда, только API
+HTML_MODE = os.getenv("N999_HTML_MODE", "auto").lower()
+
 FEATURE_RETRIES = int(os.getenv("N999_FEATURE_RETRIES", "5"))
 FEATURE_RETRY_SLEEP = float(os.getenv("N999_FEATURE_RETRY_SLEEP", "1.5"))
-PER_ADVERT_SLEEP = float(os.getenv("N999_PER_ADVERT_SLEEP", "0.4"))
-PER_PAGE_SLEEP = float(os.getenv("N999_PER_PAGE_SLEEP", "1.0"))
+# темп запросов задаёт глобальный token-bucket (app.integrations.ratelimit, N999_RATE_*);
+# фиксированные паузы оставлены только как ручной тормоз, по умолчанию выключены
+PER_ADVERT_SLEEP = float(os.getenv("N999_PER_ADVERT_SLEEP", "0"))
+PER_PAGE_SLEEP = float(os.getenv("N999_PER_PAGE_SLEEP", "0"))
+
+# пока обрабатываем страницу листинга N, страница N+1 качается в фоне
+LISTING_PREFETCH = os.getenv("N999_LISTING_PREFETCH", "1") == "1"
+
+# полный синк конвейером (листинг -> скачивание -> разбор -> запись, см. import_pipeline)
+PIPELINE = os.getenv("N999_PIPELINE", "0") == "1"
+
+# дельта по листингу: полный импорт (advert/features/HTML) только если запись
+# в листинге поменялась или последний полный импорт старше N часов
+LISTING_DELTA = os.getenv("N999_LISTING_DELTA", "1") == "1"
+DETAIL_MAX_AGE_HOURS = float(os.getenv("N999_DETAIL_MAX_AGE_HOURS", "24"))
+
+# архивация пачками: сколько машин снимаем с витрины за один UPDATE
+ARCHIVE_BATCH_SIZE = int(os.getenv("N999_ARCHIVE_BATCH_SIZE", "500"))
+
+# незавершённый SyncRun старше этого не продолжаем, а начинаем заново
+RESUME_MAX_AGE_HOURS = float(os.getenv("N999_RESUME_MAX_AGE_HOURS", "6"))
+
+# dead-letter: упавшее объявление повторяем через BASE * 2^(попытка-1) минут
+# (не дольше MAX_DELAY), после MAX_ATTEMPTS попыток — сдаёмся
+RETRY_BASE_MINUTES = float(os.getenv("N999_RETRY_BASE_MINUTES", "15"))
+RETRY_MAX_DELAY_HOURS = float(os.getenv("N999_RETRY_MAX_DELAY_HOURS", "24"))
+RETRY_MAX_ATTEMPTS = int(os.getenv("N999_RETRY_MAX_ATTEMPTS", "6"))
 
 # =========================
 # Человеко-читаемые лейблы
@@ -799,11 +841,11 @@ def caplen(field_name: str, value: Optional[str]) -> Optional[str]:
 # Доступ к API 999 (features)
 # =========================
 
-def _get_features_with_retry(advert_id: str) -> Dict[str, Any]:
+def _get_features_with_retry(advert_id: str, revalidate: bool = False) -> Dict[str, Any]:
     last_err = None
     for attempt in range(1, FEATURE_RETRIES + 1):
         try:
-            return get_advert_features(advert_id, lang=LANG)
+            return get_advert_features(advert_id, lang=LANG, revalidate=revalidate)
         except HTTPError as e:
             status = getattr(e.response, "status_code", None)
             last_err = e
@@ -911,9 +953,22 @@ def derive_make_model_from_title(title: str) -> Tuple[str, str, str]:
     return make, model, generation
 
 
-def _extract_images(ad: Dict[str, Any], features: List[Dict[str, Any]], advert_id: str) -> List[str]:
+def _is_image_feature(f: Dict[str, Any]) -> bool:
+    t = str(f.get("type", "")).lower()
+    return t in ("upload_images", "images") or str(f.get("id")) in ("14", "images")
+
+
+def _has_api_images(ad: Dict[str, Any], features: List[Dict[str, Any]]) -> bool:
+    """Есть ли фотки в самом API (без похода на HTML-страницу)."""
+    if isinstance(ad.get("images"), list) and ad["images"]:
+        return True
+    return any(_is_image_feature(f) and f.get("value") for f in features)
+
+
+def _extract_images(ad: Dict[str, Any], features: List[Dict[str, Any]], ctx: "AdvertFetchContext") -> List[str]:
     """
     Собираем фотки (API -> features -> HTML og:image).
+    HTML берём из ctx — страница уже скачана и распарсена для таблицы характеристик.
     """
     imgs: List[str] = []
 
@@ -935,8 +990,7 @@ def _extract_images(ad: Dict[str, Any], features: List[Dict[str, Any]], advert_i
     # 2) из features (если есть блок картинок)
     if not imgs:
         for f in features:
-            t = str(f.get("type", "")).lower()
-            if t in ("upload_images", "images") or str(f.get("id")) in ("14", "images"):
+            if _is_image_feature(f):
                 val = f.get("value")
                 if isinstance(val, list):
                     for it in val:
@@ -945,34 +999,12 @@ def _extract_images(ad: Dict[str, Any], features: List[Dict[str, Any]], advert_i
                     push(val)
 
     # 3) из HTML og:image и т.п.
-    if not imgs:
-        try:
-            html = get_public_ad_html(advert_id, lang="ru")
-            soup = BeautifulSoup(html, "html.parser")
-
-            for m in soup.find_all("meta"):
-                if m.get("property") in ("og:image", "og:image:secure_url"):
-                    cval = m.get("content")
-                    if cval:
-                        imgs.append(cval)
-
-            for el in soup.select("img, a"):
-                for key in ("src", "data-src", "href"):
-                    v = el.get(key)
-                    if v and ("BoardImages" in v or "999.md" in v):
-                        imgs.append(v)
-
-            for script in soup.find_all("script"):
-                txt = script.string or ""
-                if not txt:
-                    continue
-                for m in re.findall(
-                    r'(https?://[^\s"\']*?(?:BoardImages|999\.md)[^\s"\']*\.(?:jpg|jpeg|png))',
-                    txt, flags=re.I
-                ):
-                    imgs.append(m)
-        except Exception:
-            pass
+    # HTML только если планировщик его разрешил (N999_HTML_MODE=never — не ходим)
+    allow_html = ctx.plan is None or ctx.plan.need_html
+    # (упавший быстрый бэкенд уже подменён bs4 — см. html_parsers.FallbackPage)
+    page = ctx.page if (not imgs and allow_html) else None
+    if page is not None:
+        imgs.extend(page.image_candidates())
 
     # нормализуем урлы
     base_full = "https://i.simpalsmedia.com/999.md/BoardImages/900x900/"
@@ -999,18 +1031,71 @@ def _extract_images(ad: Dict[str, Any], features: List[Dict[str, Any]], advert_i
 # SCRAPE публичной страницы 999.md
 # =========================
 
-def _has_class_part(el, needle_substr: str) -> bool:
+class AdvertFetchContext:
     """
-    Возвращает True если у тега есть класс, содержащий needle_substr.
-    Например, needle_substr="group__row__" поймает styles_group__row__AbCdE
+    Всё, что тянем по одному объявлению за синк. Публичную страницу
+    скачиваем не больше одного раза и парсим не больше одного раза —
+    одно и то же дерево отдаём и таблице характеристик, и фоткам.
     """
-    for cls in el.get("class", []):
-        if needle_substr in cls:
-            return True
-    return False
 
+    def __init__(
+        self,
+        advert_id: str,
+        html: Optional[str] = None,
+        html_failed: bool = False,
+        metrics: ImportMetrics = NULL_METRICS,
+    ):
+        self.advert_id = str(advert_id)
+        self.metrics = metrics
+        self.plan: Optional["FetchPlan"] = None
+        # ответы API (заполняет fetch_advert_from_999)
+        self.ad: Dict[str, Any] = {}
+        self.features: List[Dict[str, Any]] = []
+        self.api_values: Dict[str, str] = {}
+        # поле -> откуда взяли значение ("html" / "api" / "title")
+        self.sources: Dict[str, str] = {}
+        self._html = html
+        # True -> страницу уже пытались скачать (успешно или нет), второй раз не идём
+        self._html_done = html is not None or html_failed
+        self._page: Optional[ParsedPage] = None
+        self._page_done = False
+
+    @classmethod
+    def from_bundle(cls, advert_id: str, bundle: Dict[str, Any], metrics: ImportMetrics = NULL_METRICS) -> "AdvertFetchContext":
+        return cls(
+            advert_id,
+            html=bundle.get("html"),
+            html_failed="html" in (bundle.get("errors") or {}),
+            metrics=metrics,
+        )
 
-def _scrape_public_html(advert_id: str) -> Dict[str, str]:
+    @property
+    def html(self) -> Optional[str]:
+        if not self._html_done:
+            self._html_done = True
+            with self.metrics.stage("html_fetch"):
+                try:
+                    # фотки в API есть -> со страницы нужны только характеристики
+                    self._html = get_public_ad_html(
+                        self.advert_id, lang="ru", images=not _has_api_images(self.ad, self.features),
+                    )
+                except Exception:
+                    self._html = None
+        return self._html
+
+    @property
+    def page(self) -> Optional[ParsedPage]:
+        """Разобранная страница (бэкенд — N999_HTML_PARSER, см. html_parsers)."""
+        if not self._page_done:
+            self._page_done = True
+            html = self.html
+            if html:
+                with self.metrics.stage("html_parse"):
+                    self._page = parse_page(html)
+        return self._page
+
+
+def _scrape_public_html(ctx: AdvertFetchContext) -> Dict[str, str]:
     """
     Достаём:
       - таблицу характеристик:
@@ -1027,33 +1112,21 @@ def _scrape_public_html(advert_id: str) -> Dict[str, str]:
 
     result: Dict[str, str] = {}
 
-    try:
-        html = get_public_ad_html(advert_id, lang="ru")
-    except Exception:
+    page = ctx.page
+    if page is None:
         return result
 
-    soup = BeautifulSoup(html, "html.parser")
-
     # ---- META (цена и витрина) ----
-    m_price = soup.find("meta", {"property": "product:price:amount"})
-    if m_price and m_price.get("content"):
-        result["price_amount"] = m_price.get("content").strip()
-
-    m_curr = soup.find("meta", {"property": "product:price:currency"})
-    if m_curr and m_curr.get("content"):
-        result["currency"] = m_curr.get("content").strip()
-
-    m_title = soup.find("meta", {"property": "og:title"})
-    if m_title and m_title.get("content"):
-        result["title"] = m_title.get("content").strip()
-
-    m_desc = soup.find("meta", {"property": "og:description"})
-    if m_desc and m_desc.get("content"):
-        result["description"] = m_desc.get("content").strip()
-
-    m_img = soup.find("meta", {"property": "og:image"})
-    if m_img and m_img.get("content"):
-        result["main_photo_url"] = m_img.get("content").strip()
+    for prop, field in (
+        ("product:price:amount", "price_amount"),
+        ("product:price:currency", "currency"),
+        ("og:title", "title"),
+        ("og:description", "description"),
+        ("og:image", "main_photo_url"),
+    ):
+        content = page.meta(prop)
+        if content:
+            result[field] = content.strip()
 
     # ---- словарь синонимов ключей ----
     KEY_SYNONYMS = {
@@ -1115,80 +1188,7 @@ def _scrape_public_html(advert_id: str) -> Dict[str, str]:
         for s_text in syns:
             inv_map[s_text.lower().strip(" :")] = canon
 
-    pairs: List[Tuple[str, str]] = []
-
-    # pass 1: искать строки-характеристики по row-контейнеру
-    for row in soup.find_all(lambda tag: _has_class_part(tag, "group__row__")):
-        key_el = None
-        val_el = None
-
-        # ищем внутри row элементы с классами содержащими 'group__key__' и 'group__value__'
-        for child in row.find_all(recursive=False):
-            if _has_class_part(child, "group__key__"):
-                key_el = child
-            if _has_class_part(child, "group__value__"):
-                val_el = child
-
-        # иногда value лежит глубже
-        if val_el is None:
-            cand = row.find(lambda t: _has_class_part(t, "group__value__"))
-            if cand:
-                val_el = cand
-
-        # иногда key лежит глубже
-        if key_el is None:
-            cand = row.find(lambda t: _has_class_part(t, "group__key__"))
-            if cand:
-                key_el = cand
-
-        if not key_el or not val_el:
-            continue
-
-        raw_label = key_el.get_text(" ", strip=True)
-        raw_value = val_el.get_text(" ", strip=True)
-
-        if raw_label and raw_value:
-            pairs.append((raw_label, raw_value))
-
-    # pass 2 (fallback): если вдруг что-то не нашлось через row,
-    # пройдём напрямую по ключам
-    if not pairs:
-        for key_el in soup.find_all(lambda tag: _has_class_part(tag, "group__key__")):
-            raw_label = key_el.get_text(" ", strip=True)
-            if not raw_label:
-                continue
-
-            # value может быть соседом или во всём родителе
-            parent = key_el.parent
-            val_el = None
-
-            # прямые дети родителя
-            for child in parent.find_all(recursive=False):
-                if _has_class_part(child, "group__value__"):
-                    val_el = child
-                    break
-
-            # соседи
-            if not val_el:
-                sib = key_el.next_sibling
-                while sib and not val_el:
-                    if getattr(sib, "get", None) and _has_class_part(sib, "group__value__"):
-                        val_el = sib
-                        break
-                    sib = sib.next_sibling
-
-            # любой потомок
-            if not val_el:
-                cand = parent.find(lambda t: _has_class_part(t, "group__value__"))
-                if cand:
-                    val_el = cand
-
-            if not val_el:
-                continue
-
-            raw_value = val_el.get_text(" ", strip=True)
-            if raw_value:
-                pairs.append((raw_label, raw_value))
+    pairs = page.spec_pairs()
 
     # теперь мапим пары в канонические имена
     for (label, value) in pairs:
@@ -1302,6 +1302,118 @@ def reconcile_logic(
     return fuel_code, transm_code, year_val
 
 
+# =========================
+# Планировщик: нужен ли HTML
+# =========================
+
+# поля, которые без HTML должны прийти из API, иначе идём на страницу
+PLAN_SPEC_FIELDS = (
+    "make", "model", "year", "seats", "body_type", "mileage_km",
+    "engine_cc", "power_hp", "fuel_type", "transmission", "drive",
+    "color", "location_city",
+)
+# то же для полей, которые раньше брались с мета-тегов страницы: со
+# страницей цена и витрина идут из HTML (как было), без неё — из advert,
+# поэтому пропускаем HTML, только если в advert они есть
+PLAN_META_FIELDS = ("price_amount", "currency", "title", "description")
+
+
+def _api_fuel_unreliable(raw: str) -> bool:
+    """
+    API часто отдаёт топливо общим словом ("Гибрид", "Другое"), а на странице
+    уточнение (плагин/мягкий, бензин/дизель). Такой ответ считаем ненадёжным.
+    """
+    return normalize_fuel_code(raw) in ("other", "hybrid")
+
+
+# поле -> проверка "значение из API есть, но верить ему нельзя"
+API_UNRELIABLE_CHECKS = {
+    "fuel_type": _api_fuel_unreliable,
+}
+
+
+class FetchPlan:
+    """Решение по одному объявлению: качать ли HTML и почему."""
+
+    def __init__(self, need_html: bool, missing: List[str], unreliable: List[str], reason: str = ""):
+        self.need_html = need_html
+        self.missing = missing
+        self.unreliable = unreliable
+        self.reason = reason
+
+    def __repr__(self):
+        return f"FetchPlan(need_html={self.need_html}, missing={self.missing}, unreliable={self.unreliable})"
+
+
+def plan_fetch(api_values: Dict[str, str], has_images: bool, mode: str = HTML_MODE) -> FetchPlan:
+    """
+    api_values — текстовые значения полей из API (features / advert).
+    HTML нужен, если чего-то из PLAN_SPEC_FIELDS / PLAN_META_FIELDS нет,
+    если значение из API в списке ненадёжных, или если у объявления нет
+    фоток в API. Страницу не качали — цена, валюта, title и описание в
+    Car из advert (extract_price_from_api), а не из мета-тегов.
+    """
+    if mode == "always":
+        return FetchPlan(True, [], [], reason="mode=always")
+    if mode == "never":
+        return FetchPlan(False, [], [], reason="mode=never")
+
+    fuel_code = normalize_fuel_code(api_values.get("fuel_type", ""))
+    missing: List[str] = []
+    for key in PLAN_SPEC_FIELDS + PLAN_META_FIELDS:
+        if key == "engine_cc" and fuel_code == "electric":
+            continue  # у электро объёма нет — и на странице его не будет
+        if not api_values.get(key):
+            missing.append(key)
+
+    unreliable = [
+        key for key, check in API_UNRELIABLE_CHECKS.items()
+        if key not in missing and check(api_values.get(key, ""))
+    ]
+    if not has_images:
+        missing.append("images")
+
+    need = bool(missing or unreliable)
+    return FetchPlan(need, missing, unreliable, reason="incomplete" if need else "api_complete")
+
+
+def _api_values(ad: Dict[str, Any], features: List[Dict[str, Any]]) -> Dict[str, str]:
+    """
+    Текстовые значения PLAN_SPEC_FIELDS (features, КПП ещё и из advert) и
+    PLAN_META_FIELDS (advert). Нулевая цена и валюта, которую
+    extract_price_from_api не знает (он бы молча поставил EUR), — «нет».
+    """
+    values = {key: to_text(find_feature_value(features, FEATURE_MAP[key])) for key in PLAN_SPEC_FIELDS}
+    if not values["transmission"]:
+        values["transmission"] = to_text(ad.get("transmission"))
+
+    price = ad.get("price") or {}
+    amount, currency = extract_price_from_api(ad)
+    unit = to_text(price.get("unit")).lower()
+    values["price_amount"] = str(amount) if amount else ""
+    values["currency"] = currency if currency.lower() in unit else ""
+    values["title"] = to_text(ad.get("title")).strip()
+    values["description"] = to_text(ad.get("body")).strip()
+    return values
+
+
+def new_plan_stats() -> Dict[str, Any]:
+    return {"html_fetched": 0, "html_skipped": 0, "missing": {}, "unreliable": {}, "field_sources": {}}
+
+
+def _record_plan(plan_stats: Optional[Dict[str, Any]], ctx: AdvertFetchContext) -> None:
+    if plan_stats is None or ctx.plan is None:
+        return
+    plan_stats["html_fetched" if ctx.plan.need_html else "html_skipped"] += 1
+    for key in ctx.plan.missing:
+        plan_stats["missing"][key] = plan_stats["missing"].get(key, 0) + 1
+    for key in ctx.plan.unreliable:
+        plan_stats["unreliable"][key] = plan_stats["unreliable"].get(key, 0) + 1
+    for field, src in ctx.sources.items():
+        per_field = plan_stats["field_sources"].setdefault(field, {})
+        per_field[src] = per_field.get(src, 0) + 1
+
+
 from django.utils import timezone
 from django.db import transaction
 from app.cars.models import Car, Photo
@@ -1310,53 +1422,104 @@ from app.cars.models import Car, Photo
 # upsert_car_from_999
 # =========================
 
-@transaction.atomic
-def upsert_car_from_999(advert_id: str, seen_at: timezone.datetime | None = None) -> Car:
+# =========================
+# Апсерт одной машины: fetch -> transform -> persist
+# =========================
+# Сеть и разбор идут вне транзакции; в transaction.atomic — только запись
+# Car + Photo, чтобы соединение с Postgres не висело idle-in-transaction
+# (с блокировками строк), пока мы ждём 999.md, ретраи и sleep.
+
+def fetch_advert_from_999(
+    advert_id: str,
+    bundle: Optional[Dict[str, Any]] = None,
+    metrics: ImportMetrics = NULL_METRICS,
+    revalidate: bool = False,
+) -> AdvertFetchContext:
     """
-    Импорт / апсерт одной машины с 999.md.
-
-    ВАЖНО:
-    - seen_at -> отметка синхронизации (один и тот же timestamp для всей синхры)
-      мы пишем её в Car.last_seen_at
-    - active всегда True (если объявление найдено на 999 сейчас)
-    - sold_at сбрасываем в None (если тачка вдруг вернулась в актив)
+    Фаза 1 — сеть, без БД.
+    advert + features берём из bundle (параллельная предвыборка) или тянем
+    синхронно; HTML страницы качаем, только если его требует plan_fetch.
+    revalidate=True — объявление поменялось (дельта, --full): тело без
+    валидаторов из HTTP-кеша не берём.
     """
+    bundle = bundle or {}
 
-    if seen_at is None:
-        seen_at = timezone.now()
-
-    # ---------- 1. API ----------
-    ad = get_advert(advert_id, lang=LANG)
-    feat_resp = _get_features_with_retry(advert_id)
-    features = flatten_features(feat_resp)
+    if "advert" in bundle:
+        ad = bundle["advert"]
+    else:
+        with metrics.stage("advert_fetch"):
+            ad = get_advert(advert_id, lang=LANG, revalidate=revalidate)
+    if "features" in bundle:
+        feat_resp = bundle["features"]
+    else:
+        with metrics.stage("features_fetch"):
+            feat_resp = _get_features_with_retry(advert_id, revalidate=revalidate)
+
+    ctx = AdvertFetchContext.from_bundle(advert_id, bundle, metrics=metrics)
+    ctx.ad = ad
+    ctx.features = flatten_features(feat_resp)
+    ctx.api_values = _api_values(ad, ctx.features)
+    ctx.plan = plan_fetch(ctx.api_values, has_images=_has_api_images(ad, ctx.features))
+    if ctx.plan.need_html:
+        ctx.html  # скачать, если не пришло в bundle (замер внутри ctx)
+    return ctx
+
+
+def build_car_fields(
+    ctx: AdvertFetchContext,
+    seen_at: timezone.datetime,
+    plan_stats: Optional[Dict[str, Any]] = None,
+    metrics: ImportMetrics = NULL_METRICS,
+) -> Tuple[Dict[str, Any], List[str]]:
+    """
+    Фаза 2 — разбор и нормализация, без сети и без БД.
+    Возвращает (поля Car для update_or_create без external_id, url фото).
+    """
+    ad = ctx.ad
+    features = ctx.features
+    api_values = ctx.api_values
 
     def get_text_from_features(key: str) -> str:
         return to_text(find_feature_value(features, FEATURE_MAP[key]))
 
-    # ---------- 2. HTML ----------
-    page_data = _scrape_public_html(advert_id)
+    # ---------- 2. HTML (только если API не хватило) ----------
+    page_data: Dict[str, str] = {}
+    if ctx.plan is not None and ctx.plan.need_html:
+        ctx.page  # распарсить один раз (замер внутри ctx)
+        with metrics.stage("html_extract"):
+            page_data = _scrape_public_html(ctx)
 
-    def pick_spec(key: str) -> str:
-        v_html = page_data.get(key, "")
+    t_normalize = time.perf_counter()
+
+    def pick(key: str, v_html: Any, v_api: Any) -> str:
         if v_html:
+            ctx.sources[key] = "html"
             return v_html
-        return get_text_from_features(key)
+        if v_api:
+            ctx.sources[key] = "api"
+            return v_api
+        return ""
+
+    def pick_spec(key: str) -> str:
+        return pick(key, page_data.get(key, ""), api_values.get(key) or get_text_from_features(key))
 
     # ---------- 3. Базовое инфо ----------
-    title_text = (page_data.get("title") or ad.get("title") or "").strip()
-    body_text = (page_data.get("description") or ad.get("body") or "").strip()
+    title_text = pick("title", page_data.get("title"), ad.get("title")).strip()
+    body_text = pick("description", page_data.get("description"), ad.get("body")).strip()
 
-    make = page_data.get("make") or get_text_from_features("make")
-    model = page_data.get("model") or get_text_from_features("model")
+    make = pick_spec("make")
+    model = pick_spec("model")
     generation = get_text_from_features("generation")
 
     # fallback марка/модель из title
     if title_text:
         dm, mdl, gen = derive_make_model_from_title(title_text)
-        if not make:
+        if not make and dm:
             make = dm
-        if not model:
+            ctx.sources["make"] = "title"
+        if not model and mdl:
             model = mdl
+            ctx.sources["model"] = "title"
         if not generation:
             generation = gen
 
@@ -1383,25 +1546,14 @@ def upsert_car_from_999(advert_id: str, seen_at: timezone.datetime | None = None
         power_hp_val = kw_to_hp_kwstr(power_raw)
 
     # топливо
-    fuel_raw_html = page_data.get("fuel_type")
-    fuel_raw_api = get_text_from_features("fuel_type")
-    if fuel_raw_html:
-        fuel_raw = fuel_raw_html
-        fuel_source = "html"
-    else:
-        fuel_raw = fuel_raw_api
-        fuel_source = "api"
+    fuel_raw = pick_spec("fuel_type")
+    fuel_source = ctx.sources.get("fuel_type", "api")
 
     fuel_code = normalize_fuel_code(fuel_raw)
     fuel_label_text = FUEL_LABELS.get(fuel_code, "Другое")
 
     # кпп
-    transmission_raw = (
-        page_data.get("transmission")
-        or get_text_from_features("transmission")
-        or ad.get("transmission")
-        or ""
-    )
+    transmission_raw = pick_spec("transmission")
     transm_code = normalize_transmission_code(transmission_raw)
     transm_label_text = TRANSMISSION_LABELS.get(transm_code, "Другое")
 
@@ -1413,16 +1565,17 @@ def upsert_car_from_999(advert_id: str, seen_at: timezone.datetime | None = None
     location_city_val = pick_spec("location_city")
 
     # ---------- 5. доуточнить топливо / кпп / год
-    fuel_code, transm_code, year_val = reconcile_logic(
-        fuel_code_in=fuel_code,
-        transm_code_in=transm_code,
-        year_in=year_val,
-        title_text=title_text,
-        body_text=body_text,
-        make=make,
-        model=model,
-        fuel_source=fuel_source,
-    )
+    with metrics.stage("reconcile"):
+        fuel_code, transm_code, year_val = reconcile_logic(
+            fuel_code_in=fuel_code,
+            transm_code_in=transm_code,
+            year_in=year_val,
+            title_text=title_text,
+            body_text=body_text,
+            make=make,
+            model=model,
+            fuel_source=fuel_source,
+        )
 
     # пересчитать лейблы после уточнения
     fuel_label_text = FUEL_LABELS.get(fuel_code, fuel_label_text)
@@ -1438,12 +1591,14 @@ def upsert_car_from_999(advert_id: str, seen_at: timezone.datetime | None = None
             clean_num = re.sub(r"[^\d.]", "", str(price_amount_raw))
             if clean_num:
                 price_eur_val = Decimal(clean_num)
+                ctx.sources["price"] = "html"
         except Exception:
             price_eur_val = None
 
     if not price_eur_val:
         api_price_val, api_curr = extract_price_from_api(ad)
         price_eur_val = api_price_val
+        ctx.sources["price"] = "api"
         if not currency_val:
             currency_val = api_curr
 
@@ -1451,8 +1606,9 @@ def upsert_car_from_999(advert_id: str, seen_at: timezone.datetime | None = None
         currency_val = "EUR"
 
     # ---------- 7. Фото ----------
-    images = _extract_images(ad, features, advert_id)
+    images = _extract_images(ad, features, ctx)
     main_photo_url = page_data.get("main_photo_url") or (images[0] if images else "")
+    _record_plan(plan_stats, ctx)
 
     # ---------- 8. Безопасное обрезание строк
     make = caplen("make", make or "")
@@ -1477,127 +1633,888 @@ def upsert_car_from_999(advert_id: str, seen_at: timezone.datetime | None = None
     location_city_val = caplen("location_city", location_city_val or "")
     main_photo_url = caplen("main_photo_url", main_photo_url or "")
 
-    # ---------- 9. Запись в БД ----------
+    # ---------- 9. Поля для записи в БД ----------
     first_registration_val = None  # пока точной даты нет
 
     now_ts = timezone.now()
+    fields = dict(
+        source="999",
 
-    car, _created = Car.objects.update_or_create(
-        external_id=str(advert_id),
-        defaults=dict(
-            source="999",
+        make=make,
+        model=model,
+        generation=generation,
 
-            make=make,
-            model=model,
-            generation=generation,
+        year=year_val,
+        first_registration=first_registration_val,
+        seats=seats_val,
+        body_type=body_type_norm,
+        mileage_km=mileage_km_val,
+        engine_cc=engine_cc_val,
+        power_hp=power_hp_val,
+
+        fuel_type_code=fuel_code,
+        fuel_type_label=fuel_label_text,
+        fuel_type_raw=(fuel_raw or ""),
 
-            year=year_val,
-            first_registration=first_registration_val,
-            seats=seats_val,
-            body_type=body_type_norm,
-            mileage_km=mileage_km_val,
-            engine_cc=engine_cc_val,
-            power_hp=power_hp_val,
+        transmission_code=transm_code,
+        transmission_label=transm_label_text,
+        transmission_raw=(transmission_raw or ""),
 
-            fuel_type_code=fuel_code,
-            fuel_type_label=fuel_label_text,
-            fuel_type_raw=(fuel_raw or ""),
+        drive=drive_norm,
 
-            transmission_code=transm_code,
-            transmission_label=transm_label_text,
-            transmission_raw=(transmission_raw or ""),
+        registration_country=registration_country,
+        origin_country=origin_country,
+        condition=norm_condition(condition_raw),
+        availability=norm_availability(availability_raw),
+        location_city=location_city_val,
 
-            drive=drive_norm,
+        price_eur=price_eur_val,
+        currency=currency_val,
 
-            registration_country=registration_country,
-            origin_country=origin_country,
-            condition=norm_condition(condition_raw),
-            availability=norm_availability(availability_raw),
-            location_city=location_city_val,
+        title=title_text,
+        description=body_text,
+        color=color_val,
 
-            price_eur=price_eur_val,
-            currency=currency_val,
+        # витрина
+        main_photo_url=main_photo_url,
 
-            title=title_text,
-            description=body_text,
-            color=color_val,
+        # статусная часть
+        status="published",
+        active=True,                # <-- объявление считается активным
+        last_seen_at=seen_at,       # <-- мы видели это объявление в этом цикле синка
+        sold_at=None,               # <-- если вдруг тачка вернулась, снимаем sold_at
 
-            # витрина
-            main_photo_url=main_photo_url,
+        updated_at=now_ts,
+    )
+    metrics.add("normalize", time.perf_counter() - t_normalize)
+    return fields, images
 
-            # статусная часть
-            status="published",
-            active=True,                # <-- объявление считается активным
-            last_seen_at=seen_at,       # <-- мы видели это объявление в этом цикле синка
-            sold_at=None,               # <-- если вдруг тачка вернулась, снимаем sold_at
 
-            updated_at=now_ts,
-        ),
+@transaction.atomic
+def persist_car_from_999(
+    advert_id: str,
+    fields: Dict[str, Any],
+    images: List[str],
+    metrics: ImportMetrics = NULL_METRICS,
+) -> Car:
+    """
+    Фаза 3 — короткая транзакция: апсерт Car и синк его Photo.
+    Если отпечаток не поменялся — только last_seen_at, без UPDATE строки и фото.
+    """
+    fingerprint = content_fingerprint(fields, images)
+    source = fields.get("source", "999")
+    t_db = time.perf_counter()
+    current = (
+        Car.objects
+        .filter(source=source, external_id=str(advert_id), active=True, status=Car.Status.PUBLISHED)
+        .first()
     )
+    if current is not None and current.content_hash == fingerprint:
+        current.last_seen_at = fields.get("last_seen_at")
+        Car.objects.filter(pk=current.pk).update(last_seen_at=current.last_seen_at)
+        metrics.add("update_or_create", time.perf_counter() - t_db)
+        metrics.incr("unchanged")
+        return current
+
+    car, _created = Car.objects.update_or_create(
+        source=source,
+        external_id=str(advert_id),
+        defaults={**fields, "content_hash": fingerprint},
+    )
+    metrics.add("update_or_create", time.perf_counter() - t_db)
+    metrics.incr("created" if _created else "updated")
 
     # ---------- 10. Фото ----------
-    Photo.objects.filter(car=car).delete()
-    for idx, img in enumerate(images[:30]):
-        Photo.objects.create(
-            car=car,
-            image_url=img,
-            sort_order=idx,
-            is_primary=(idx == 0),
+    with metrics.stage("photo_sync"):
+        sync_photos({car.pk: images}, metrics=metrics)
+    return car
+
+
+MAX_PHOTOS = 30
+
+# меняются каждый синк / при архивации — в отпечаток не входят
+FINGERPRINT_VOLATILE = frozenset({
+    "last_seen_at", "updated_at", "sold_at", "active", "status",
+    "content_hash", "listing_hash", "detail_synced_at",
+})
+
+
+def content_fingerprint(fields: Dict[str, Any], images: List[str]) -> str:
+    """Стабильный sha1 нормализованных полей Car (без служебных) и списка фото."""
+    payload = {k: ("" if v is None else str(v)) for k, v in fields.items() if k not in FINGERPRINT_VOLATILE}
+    payload["__photos__"] = list(images[:MAX_PHOTOS])
+    raw = json.dumps(payload, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha1(raw.encode("utf-8")).hexdigest()
+
+
+def sync_photos(desired: Dict[int, List[str]], metrics: ImportMetrics = NULL_METRICS) -> Dict[str, int]:
+    """
+    Привести Photo машин к спискам url: desired = {car_id: [url, ...]}.
+
+    Вместо delete + create на каждое фото сравниваем со старым списком и
+    трогаем только разницу; на всю пачку машин — максимум один SELECT,
+    один DELETE, один bulk_update (порядок / главное фото) и один bulk_create.
+    Фото, которые не поменялись (почти всегда — все), не пишем вовсе.
+    """
+    stats = {"created": 0, "updated": 0, "deleted": 0, "unchanged": 0}
+    if not desired:
+        return stats
+
+    existing: Dict[int, Dict[str, List[Photo]]] = {}
+    for photo in (
+        Photo.objects
+        .filter(car_id__in=list(desired))
+        .only("id", "car_id", "image_url", "sort_order", "is_primary")
+        .order_by("car_id", "sort_order", "id")
+    ):
+        existing.setdefault(photo.car_id, {}).setdefault(photo.image_url, []).append(photo)
+
+    to_create: List[Photo] = []
+    to_update: List[Photo] = []
+    to_delete: List[int] = []
+    for car_id, urls in desired.items():
+        by_url = existing.get(car_id, {})
+        for idx, url in enumerate(urls[:MAX_PHOTOS]):
+            same = by_url.get(url)
+            if same:
+                photo = same.pop(0)
+                if photo.sort_order != idx or photo.is_primary != (idx == 0):
+                    photo.sort_order = idx
+                    photo.is_primary = idx == 0
+                    to_update.append(photo)
+                else:
+                    stats["unchanged"] += 1
+            else:
+                to_create.append(Photo(car_id=car_id, image_url=url, sort_order=idx, is_primary=(idx == 0)))
+        # всё, что не нашлось в новом списке (и дубли url) — удаляем
+        to_delete.extend(photo.id for left in by_url.values() for photo in left)
+
+    if to_delete:
+        Photo.objects.filter(id__in=to_delete).delete()
+    if to_update:
+        Photo.objects.bulk_update(to_update, ["sort_order", "is_primary"])
+    if to_create:
+        Photo.objects.bulk_create(to_create)
+
+    stats.update(created=len(to_create), updated=len(to_update), deleted=len(to_delete))
+    for key, value in stats.items():
+        metrics.incr(f"photos_{key}", value)
+    return stats
+
+
+def _car_for_bulk(advert_id: str, fields: Dict[str, Any]) -> Car:
+    car = Car(external_id=str(advert_id), **fields)
+    # bulk_create не зовёт Car.save() — канон топлива считаем сами и, как
+    # Car.save(), не роняем из-за него запись (здесь — всю пачку)
+    try:
+        car.fuel_type_canonical = car._compute_fuel_canonical() or ""
+    except Exception:
+        car.fuel_type_canonical = ""
+    return car
+
+
+@transaction.atomic
+def persist_cars_from_999(
+    records: List[Tuple[str, Dict[str, Any], List[str]]],
+    metrics: ImportMetrics = NULL_METRICS,
+) -> Dict[str, int]:
+    """
+    Фаза 3 для целой страницы: records = [(advert_id, fields, images), ...]
+    (fields/images — из build_car_fields).
+
+    Все машины пишем одним INSERT ... ON CONFLICT (source, external_id) DO UPDATE,
+    фото — через sync_photos (только разница, пачкой на страницу). Вместо
+    ~2×page_size запросов — несколько на страницу, транзакция одна и короткая.
+
+    Машины, у которых content_fingerprint совпал с сохранённым (и которые
+    сейчас на витрине), не переписываем вовсе: одним UPDATE двигаем им
+    last_seen_at, updated_at остаётся честным «когда реально поменялось».
+
+    Как и у update_or_create, у существующей строки не трогаем created_at;
+    fuel_type_canonical пересчитываем и пишем вместе с топливом.
+    Возвращает {external_id: car.id}.
+    """
+    # один id дважды в одном ON CONFLICT Postgres не примет — берём последний
+    by_id: Dict[str, Tuple[Dict[str, Any], List[str]]] = {}
+    for advert_id, fields, images in records:
+        by_id[str(advert_id)] = (fields, images)
+    if not by_id:
+        return {}
+
+    hashes = {advert_id: content_fingerprint(fields, images) for advert_id, (fields, images) in by_id.items()}
+
+    t_db = time.perf_counter()
+    # ---------- без изменений: только last_seen_at ----------
+    stored = (
+        Car.objects
+        .filter(source="999", external_id__in=list(by_id), active=True, status=Car.Status.PUBLISHED)
+        .values_list("external_id", "id", "content_hash")
+    )
+    car_ids: Dict[str, int] = {}
+    seen_groups: Dict[Any, List[int]] = {}
+    for external_id, pk, content_hash in stored:
+        if content_hash and content_hash == hashes[external_id]:
+            car_ids[external_id] = pk
+            seen_groups.setdefault(by_id[external_id][0].get("last_seen_at"), []).append(pk)
+    for seen_at, pks in seen_groups.items():
+        Car.objects.filter(pk__in=pks).update(last_seen_at=seen_at)
+    metrics.incr("unchanged", len(car_ids))
+
+    # ---------- новые / изменившиеся: один INSERT ... ON CONFLICT ----------
+    changed = [advert_id for advert_id in by_id if advert_id not in car_ids]
+    cars = [
+        _car_for_bulk(advert_id, {**by_id[advert_id][0], "content_hash": hashes[advert_id]})
+        for advert_id in changed
+    ]
+    if cars:
+        update_fields = sorted(
+            {k for fields, _images in by_id.values() for k in fields} - {"source"} | {"content_hash", "fuel_type_canonical"}
+        )
+        Car.objects.bulk_create(
+            cars,
+            update_conflicts=True,
+            unique_fields=["source", "external_id"],
+            update_fields=update_fields,
         )
+        missing = [car.external_id for car in cars if not car.pk]
+        car_ids.update({car.external_id: car.pk for car in cars if car.pk})
+        if missing:
+            # бэкенд не вернул pk из ON CONFLICT — доберём одним SELECT
+            car_ids.update(
+                Car.objects.filter(source="999", external_id__in=missing).values_list("external_id", "id")
+            )
+    metrics.add("bulk_upsert", time.perf_counter() - t_db)
+    metrics.incr("upserted", len(cars))
+
+    # ---------- Фото (только у изменившихся) ----------
+    with metrics.stage("photo_sync"):
+        sync_photos(
+            {car_ids[advert_id]: by_id[advert_id][1] for advert_id in changed if advert_id in car_ids},
+            metrics=metrics,
+        )
+    return car_ids
+
+
+def upsert_car_from_999(
+    advert_id: str,
+    seen_at: timezone.datetime | None = None,
+    bundle: Optional[Dict[str, Any]] = None,
+    plan_stats: Optional[Dict[str, Any]] = None,
+    metrics: ImportMetrics = NULL_METRICS,
+) -> Car:
+    """
+    Импорт / апсерт одной машины с 999.md.
+
+    ВАЖНО:
+    - seen_at -> отметка синхронизации (один и тот же timestamp для всей синхры)
+      мы пишем её в Car.last_seen_at
+    - active всегда True (если объявление найдено на 999 сейчас)
+    - sold_at сбрасываем в None (если тачка вдруг вернулась в актив)
+    - bundle -> результат fetch_advert_bundles (advert/features/html уже скачаны
+      параллельно); чего в нём нет — дотягиваем синхронно, как раньше
+    - HTML страницы качаем только если API не хватило (plan_fetch);
+      откуда пришло каждое поле — в ctx.sources, сводка — в plan_stats
+    - metrics -> замеры по стадиям (см. import_metrics.ImportMetrics)
+    - транзакция только вокруг записи в БД (persist_car_from_999),
+      сеть и разбор — снаружи
+    """
+    if seen_at is None:
+        seen_at = timezone.now()
+
+    ctx = fetch_advert_from_999(advert_id, bundle=bundle, metrics=metrics)
+    fields, images = build_car_fields(ctx, seen_at, plan_stats=plan_stats, metrics=metrics)
+    car = persist_car_from_999(advert_id, fields, images, metrics=metrics)
 
-    if PER_ADVERT_SLEEP > 0:
+    # при параллельной предвыборке темп задаёт N999_CONCURRENCY, а не sleep
+    if PER_ADVERT_SLEEP > 0 and not bundle:
         time.sleep(PER_ADVERT_SLEEP)
 
     return car
 
 
+def _prefetch_bundles(advert_ids: List[str], revalidate: bool = False) -> Dict[str, Dict[str, Any]]:
+    """
+    Параллельно тянем advert/features для страницы объявлений, затем —
+    тоже параллельно — HTML только тех, кому он нужен по plan_fetch.
+    При N999_CONCURRENCY <= 1 — ничего не делаем (старый последовательный режим).
+    """
+    if CONCURRENCY <= 1 or not advert_ids:
+        return {}
+    bundles = fetch_advert_bundles(
+        advert_ids, lang=LANG, concurrency=CONCURRENCY, with_html=(HTML_MODE == "always"), revalidate=revalidate,
+    )
+    if HTML_MODE != "auto":
+        return bundles
+
+    need_html: List[str] = []
+    with_api_images: List[str] = []
+    for advert_id, b in bundles.items():
+        if "advert" not in b or "features" not in b:
+            continue  # upsert дотянет синхронно и сам решит
+        features = flatten_features(b["features"])
+        has_images = _has_api_images(b["advert"], features)
+        if plan_fetch(_api_values(b["advert"], features), has_images).need_html:
+            need_html.append(advert_id)
+            if has_images:
+                with_api_images.append(advert_id)
+
+    htmls = fetch_public_htmls(need_html, concurrency=CONCURRENCY, without_images=with_api_images)
+    for advert_id, html in htmls.items():
+        if isinstance(html, BaseException):
+            bundles[advert_id].setdefault("errors", {})["html"] = html
+        else:
+            bundles[advert_id]["html"] = html
+    return bundles
+
+
+def _import_page(
+    page_ids: List[str],
+    bundles: Dict[str, Dict[str, Any]],
+    seen_at: timezone.datetime,
+    plan_stats: Optional[Dict[str, Any]] = None,
+    metrics: ImportMetrics = NULL_METRICS,
+    listing_hashes: Optional[Dict[str, str]] = None,
+    failed: Optional[List[str]] = None,
+    revalidate: bool = False,
+    guard: Optional[Callable[[], None]] = None,
+) -> int:
+    """
+    Страница листинга: скачать и разобрать каждое объявление (вне транзакции),
+    потом записать всю страницу одним persist_cars_from_999 и отметить
+    detail_synced_at / listing_hash (см. _mark_detail_synced).
+    revalidate — см. fetch_advert_from_999; guard() зовём перед записью
+    (бросает, если лок синка потерян — тогда не пишем).
+
+    Объявление, на котором скачивание/разбор падает, не роняет страницу:
+    оно уходит в dead-letter (FailedAdvert, см. record_failed_adverts),
+    его id дописываются в failed, остальные пишутся как обычно.
+    """
+    records: List[Tuple[str, Dict[str, Any], List[str]]] = []
+    durations: List[float] = []
+    failures: Dict[str, Exception] = {}
+    for advert_id in page_ids:
+        t_advert = time.perf_counter()
+        bundle = bundles.get(advert_id)
+        try:
+            ctx = fetch_advert_from_999(advert_id, bundle=bundle, metrics=metrics, revalidate=revalidate)
+            fields, images = build_car_fields(ctx, seen_at, plan_stats=plan_stats, metrics=metrics)
+        except Exception as e:
+            failures[advert_id] = e
+            metrics.incr("failed_adverts")
+            continue
+        records.append((advert_id, fields, images))
+        durations.append(time.perf_counter() - t_advert)
+
+        # при параллельной предвыборке темп задаёт N999_CONCURRENCY, а не sleep
+        if PER_ADVERT_SLEEP > 0 and not bundle:
+            time.sleep(PER_ADVERT_SLEEP)
+
+    if guard is not None:
+        guard()
+    t_persist = time.perf_counter()
+    _write_batch(records, failures, seen_at, listing_hashes or {}, metrics=metrics)
+    if failed is not None:
+        failed.extend(failures)
+    # запись страницы делим поровну между её объявлениями
+    share = (time.perf_counter() - t_persist) / len(records) if records else 0.0
+    for d in durations:
+        metrics.advert_done(d + share)
+    return len(records)
+
+
+def _write_batch(
+    records: List[Tuple[str, Dict[str, Any], List[str]]],
+    failures: Dict[str, Exception],
+    seen_at: timezone.datetime,
+    listing_hashes: Dict[str, str],
+    metrics: ImportMetrics = NULL_METRICS,
+) -> Dict[str, int]:
+    """
+    Фаза 3 для пачки: записать машины (persist_cars_from_999), отметить
+    detail_synced_at / listing_hash, закрыть их dead-letter записи,
+    упавшие — в dead-letter. Возвращает {external_id: car_id}.
+    """
+    car_ids = persist_cars_from_999(records, metrics=metrics) if records else {}
+    _mark_detail_synced(car_ids, seen_at, listing_hashes)
+    resolve_failed_adverts(list(car_ids))
+    if failures:
+        record_failed_adverts(failures, seen_at)
+    return car_ids
+
+
 # =========================
-# Массовый импорт (без архивирования)
+# Dead-letter: упавшие объявления
 # =========================
 
-def sync_all_from_999(page_size: int = 25, max_items: Optional[int] = None) -> int:
+def _retry_delay(attempts: int) -> datetime.timedelta:
+    minutes = RETRY_BASE_MINUTES * (2 ** max(0, attempts - 1))
+    return min(datetime.timedelta(minutes=minutes), datetime.timedelta(hours=RETRY_MAX_DELAY_HOURS))
+
+
+def _is_gone(exc: Exception) -> bool:
+    """Объявление сняли с 999.md (404/410) — повторять бессмысленно."""
+    response = getattr(exc, "response", None)
+    return isinstance(exc, HTTPError) and response is not None and response.status_code in (404, 410)
+
+
+def record_failed_adverts(failures: Dict[str, Exception], seen_at: timezone.datetime) -> None:
     """
-    Простой импорт без деактивации отсутствующих.
-    Оставляем на случай отладки.
+    Записать упавшие объявления в FailedAdvert: новым — attempts=1,
+    уже известным — attempts+1; следующая попытка через _retry_delay.
+    Уже известные активные машины с этими id остаются «увиденными»
+    (last_seen_at = seen_at), чтобы их не сняло архивацией прогона.
     """
-    page = 1
-    imported = 0
-    processed_total = 0
+    if not failures:
+        return
+    now_ts = timezone.now()
+    ids = list(failures)
+    existing = {fa.external_id: fa for fa in FailedAdvert.objects.filter(source="999", external_id__in=ids)}
+
+    to_create: List[FailedAdvert] = []
+    to_update: List[FailedAdvert] = []
+    for advert_id, exc in failures.items():
+        fa = existing.get(advert_id)
+        if fa is None:
+            fa = FailedAdvert(source="999", external_id=advert_id, attempts=0, first_failed_at=now_ts)
+            to_create.append(fa)
+        else:
+            to_update.append(fa)
+        fa.attempts += 1
+        fa.error_class = f"{type(exc).__module__}.{type(exc).__name__}"[:128]
+        fa.error = repr(exc)[:2000]
+        fa.last_failed_at = now_ts
+        fa.resolved_at = None
+        if _is_gone(exc) or fa.attempts >= RETRY_MAX_ATTEMPTS:
+            fa.status = FailedAdvert.Status.GIVEN_UP
+            fa.next_retry_at = None
+        else:
+            fa.status = FailedAdvert.Status.PENDING
+            fa.next_retry_at = now_ts + _retry_delay(fa.attempts)
+
+    with transaction.atomic():
+        if to_create:
+            FailedAdvert.objects.bulk_create(to_create)
+        if to_update:
+            FailedAdvert.objects.bulk_update(
+                to_update,
+                ["attempts", "error_class", "error", "last_failed_at", "resolved_at", "status", "next_retry_at"],
+            )
+        Car.objects.filter(source="999", external_id__in=ids, active=True).update(last_seen_at=seen_at)
 
-    # один timestamp для всего запуска
-    sync_started_at = timezone.now()
 
-    while True:
-        data = get_adverts(page=page, page_size=page_size, states=STATES, lang=LANG)
-        adverts = data.get("adverts", [])
-        if not adverts:
-            break
+def resolve_failed_adverts(external_ids: List[str]) -> int:
+    """Объявления импортировались — закрыть их записи в dead-letter (если были)."""
+    if not external_ids:
+        return 0
+    return FailedAdvert.objects.filter(
+        source="999",
+        external_id__in=external_ids,
+        status__in=(FailedAdvert.Status.PENDING, FailedAdvert.Status.GIVEN_UP),
+    ).update(status=FailedAdvert.Status.RESOLVED, next_retry_at=None, resolved_at=timezone.now())
 
-        for a in adverts:
-            subcat = ((a.get("categories") or {}).get("subcategory") or {}).get("id")
-            if str(subcat) != "659":
-                continue
 
-            advert_id = a.get("id")
-            if not advert_id:
-                continue
+# =========================
+# Дельта по листингу
+# =========================
+# в отпечаток записи листинга цена не входит: её меняем прямо из листинга
+LISTING_FINGERPRINT_SKIP = frozenset({"price"})
+
+
+def listing_fingerprint(entry: Dict[str, Any]) -> str:
+    """sha1 записи объявления из get_adverts без цены."""
+    payload = {k: v for k, v in entry.items() if k not in LISTING_FINGERPRINT_SKIP}
+    raw = json.dumps(payload, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha1(raw.encode("utf-8")).hexdigest()
+
+
+def new_delta_stats() -> Dict[str, int]:
+    return {"full": 0, "skipped": 0, "price_only": 0, "new": 0, "changed": 0, "stale": 0}
+
+
+def _apply_listing_delta(
+    entries: Dict[str, Dict[str, Any]],
+    listing_hashes: Dict[str, str],
+    seen_at: timezone.datetime,
+    delta_stats: Dict[str, int],
+) -> List[str]:
+    """
+    Решить по листингу, кому нужен полный импорт. Возвращает эти id.
+
+    Остальным (запись в листинге не менялась, полный импорт свежее
+    DETAIL_MAX_AGE_HOURS) одним UPDATE двигаем last_seen_at, а если
+    по листингу поменялась только цена — пишем её в price_eur пачкой,
+    без похода за advert/features/HTML.
+    """
+    max_age = datetime.timedelta(hours=DETAIL_MAX_AGE_HOURS)
+    stored = {
+        external_id: (pk, listing_hash, detail_synced_at, price_eur, currency)
+        for external_id, pk, listing_hash, detail_synced_at, price_eur, currency in (
+            Car.objects
+            .filter(source="999", external_id__in=list(entries), active=True, status=Car.Status.PUBLISHED)
+            .values_list("external_id", "id", "listing_hash", "detail_synced_at", "price_eur", "currency")
+        )
+    }
+
+    full_ids: List[str] = []
+    skipped_pks: List[int] = []
+    price_updates: List[Car] = []
+    for advert_id, entry in entries.items():
+        row = stored.get(advert_id)
+        if row is None:
+            delta_stats["new"] += 1
+            full_ids.append(advert_id)
+            continue
+        pk, listing_hash, detail_synced_at, price_eur, currency = row
+        if listing_hash != listing_hashes[advert_id]:
+            delta_stats["changed"] += 1
+            full_ids.append(advert_id)
+            continue
+        if detail_synced_at is None or seen_at - detail_synced_at > max_age:
+            delta_stats["stale"] += 1
+            full_ids.append(advert_id)
+            continue
+
+        skipped_pks.append(pk)
+        listing_price, listing_currency = extract_price_from_api(entry)
+        if listing_price and listing_currency == currency and listing_price != price_eur:
+            price_updates.append(Car(pk=pk, price_eur=listing_price, updated_at=seen_at))
+
+    if skipped_pks:
+        Car.objects.filter(pk__in=skipped_pks).update(last_seen_at=seen_at)
+    if price_updates:
+        Car.objects.bulk_update(price_updates, ["price_eur", "updated_at"])
+
+    delta_stats["full"] += len(full_ids)
+    delta_stats["skipped"] += len(skipped_pks)
+    delta_stats["price_only"] += len(price_updates)
+    return full_ids
+
+
+def _mark_detail_synced(car_ids: Dict[str, int], seen_at: timezone.datetime, listing_hashes: Dict[str, str]) -> None:
+    """После полного импорта: detail_synced_at = seen_at и (если знаем) listing_hash."""
+    with_hash = [
+        Car(pk=pk, listing_hash=listing_hashes[external_id], detail_synced_at=seen_at)
+        for external_id, pk in car_ids.items()
+        if external_id in listing_hashes
+    ]
+    without_hash = [pk for external_id, pk in car_ids.items() if external_id not in listing_hashes]
+    if with_hash:
+        Car.objects.bulk_update(with_hash, ["listing_hash", "detail_synced_at"])
+    if without_hash:
+        Car.objects.filter(pk__in=without_hash).update(detail_synced_at=seen_at)
+
+
+def _page_car_ids(adverts: List[Dict[str, Any]]) -> List[str]:
+    """id легковых (subcategory.id == 659) со страницы листинга."""
+    ids: List[str] = []
+    for a in adverts:
+        subcat = ((a.get("categories") or {}).get("subcategory") or {}).get("id")
+        if str(subcat) != "659":
+            continue
+        advert_id = a.get("id")
+        if not advert_id:
+            continue
+        ids.append(str(advert_id))
+    return ids
+
+
+# =========================
+# Листинг: поток объявлений
+# =========================
+
+class AdvertStub:
+    """Объявление из листинга: id, запись get_adverts как есть и номер страницы."""
+
+    __slots__ = ("id", "entry", "page")
+
+    def __init__(self, advert_id: str, entry: Dict[str, Any], page: int):
+        self.id = advert_id
+        self.entry = entry
+        self.page = page
+
+    def __repr__(self):
+        return f"AdvertStub({self.id}, page={self.page})"
+
+
+class ListingPage:
+    """Страница листинга после фильтра легковых, дедупликации и max_items."""
 
-            upsert_car_from_999(str(advert_id), seen_at=sync_started_at)
-            imported += 1
-            processed_total += 1
+    __slots__ = ("page", "adverts")
 
-            if max_items and processed_total >= max_items:
-                return imported
+    def __init__(self, page: int, adverts: List[AdvertStub]):
+        self.page = page
+        self.adverts = adverts
 
-        if PER_PAGE_SLEEP > 0:
+    @property
+    def ids(self) -> List[str]:
+        return [a.id for a in self.adverts]
+
+    @property
+    def entries(self) -> Dict[str, Dict[str, Any]]:
+        return {a.id: a.entry for a in self.adverts}
+
+
+class CarAdvertStream:
+    """
+    Единственный обход листинга 999.md для всех синков (см. iter_car_adverts):
+    пагинация, фильтр легковых (subcategory 659), повторы между страницами
+    (листинг сдвинулся), max_items, max_pages, PER_PAGE_SLEEP и проверка subtotal.
+
+    for stub in stream — по объявлению; stream.pages() — по страницам (синкам
+    нужен чекпоинт на страницу). Страница N+1 качается в фоновом потоке, пока
+    потребитель обрабатывает N; PER_PAGE_SLEEP выдерживается между запросами
+    листинга, а не добавляется к обработке.
+
+    После обхода: listing_done — листинг пройден до конца (пустая страница или
+    subtotal), а не оборван по max_items / max_pages; seen — сколько объявлений
+    отдали; page — последняя отданная страница.
+    """
+
+    def __init__(
+        self,
+        page_size: int = 25,
+        max_items: Optional[int] = None,
+        start_page: int = 1,
+        max_pages: Optional[int] = None,
+        prefetch: Optional[bool] = None,
+        metrics: ImportMetrics = NULL_METRICS,
+    ):
+        self.page_size = page_size
+        self.max_items = max_items
+        self.start_page = max(1, start_page)
+        self.max_pages = max_pages
+        self.prefetch = LISTING_PREFETCH if prefetch is None else prefetch
+        self.metrics = metrics
+        self.listing_done = False
+        self.seen = 0
+        self.page = self.start_page - 1
+
+    def __iter__(self) -> Iterator[AdvertStub]:
+        for listing_page in self.pages():
+            yield from listing_page.adverts
+
+    def _fetch(self, page: int, throttle: bool = False) -> Dict[str, Any]:
+        if throttle and PER_PAGE_SLEEP > 0:
             time.sleep(PER_PAGE_SLEEP)
+        with self.metrics.stage("listing"):
+            return get_adverts(page=page, page_size=self.page_size, states=STATES, lang=LANG)
+
+    def pages(self) -> Iterator[ListingPage]:
+        if self.max_items is not None and self.max_items <= 0:
+            return
+        executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="n999-listing") if self.prefetch else None
+        seen_ids: set = set()
+        page = self.start_page
+        try:
+            data = self._fetch(page)
+            while True:
+                adverts = data.get("adverts") or []
+                if not adverts:
+                    self.listing_done = True
+                    return
+
+                stubs: List[AdvertStub] = []
+                entries = {str(a.get("id")): a for a in adverts}
+                for advert_id in _page_car_ids(adverts):
+                    if advert_id in seen_ids:
+                        continue
+                    seen_ids.add(advert_id)
+                    stubs.append(AdvertStub(advert_id, entries[advert_id], page))
+                if self.max_items is not None:
+                    stubs = stubs[:max(0, self.max_items - self.seen)]
+                self.seen += len(stubs)
+
+                subtotal = data.get("subtotal") or 0
+                current_ps = data.get("page_size") or self.page_size
+                last_page = page * current_ps >= subtotal
+                limit_hit = self.max_items is not None and self.seen >= self.max_items
+                pages_hit = self.max_pages is not None and page - self.start_page + 1 >= self.max_pages
+                more = not (last_page or limit_hit or pages_hit)
+
+                future: Optional[Future] = None
+                if more and executor is not None:
+                    future = executor.submit(self._fetch, page + 1, True)
+
+                self.page = page
+                yield ListingPage(page, stubs)
+
+                if not more:
+                    # по max_items/max_pages листинг не пройден — архивировать нельзя
+                    self.listing_done = last_page and not limit_hit
+                    return
+                if future is not None:
+                    with self.metrics.stage("listing_wait"):
+                        data = future.result()
+                else:
+                    data = self._fetch(page + 1, True)
+                page += 1
+        finally:
+            if executor is not None:
+                executor.shutdown(wait=False, cancel_futures=True)
+
+
+def iter_car_adverts(
+    page_size: int = 25,
+    max_items: Optional[int] = None,
+    start_page: int = 1,
+    max_pages: Optional[int] = None,
+    prefetch: Optional[bool] = None,
+    metrics: ImportMetrics = NULL_METRICS,
+) -> CarAdvertStream:
+    """
+    Поток легковых объявлений из листинга (см. CarAdvertStream):
+
+        stream = iter_car_adverts(page_size=50, max_items=500)
+        for listing_page in stream.pages():
+            ...  # listing_page.ids / listing_page.entries
+        stream.listing_done
+
+    max_items=None — без лимита; prefetch=None — по N999_LISTING_PREFETCH.
+    """
+    return CarAdvertStream(
+        page_size=page_size,
+        max_items=max_items,
+        start_page=start_page,
+        max_pages=max_pages,
+        prefetch=prefetch,
+        metrics=metrics,
+    )
+
+
+# =========================
+# Архивация по водяному знаку
+# =========================
+
+def archive_unseen_cars(sync_started_at: timezone.datetime, batch_size: int = ARCHIVE_BATCH_SIZE) -> int:
+    """
+    Снять с витрины активные машины source='999', которых синк не видел:
+    все пути синка ставят last_seen_at = sync_started_at (общий на прогон),
+    значит «не видели» == last_seen_at < sync_started_at (или NULL).
 
-        subtotal = data.get("subtotal") or 0
-        current_ps = data.get("page_size") or page_size
-        if page * current_ps >= subtotal:
+    Без огромного NOT IN по id: выборка идёт по индексу
+    (source, active, last_seen_at), UPDATE — пачками по batch_size,
+    каждая пачка — своя короткая транзакция.
+    """
+    now_ts = timezone.now()
+    unseen = (
+        Car.objects
+        .filter(source="999", active=True)
+        .filter(Q(last_seen_at__lt=sync_started_at) | Q(last_seen_at__isnull=True))
+        .order_by()
+    )
+    archived = 0
+    while True:
+        pks = list(unseen.values_list("pk", flat=True)[:batch_size])
+        if not pks:
             break
+        archived += Car.objects.filter(pk__in=pks, active=True).update(
+            active=False,
+            status="archived",
+            sold_at=now_ts,
+            updated_at=now_ts,
+        )
+    return archived
+
+
+# =========================
+# SyncRun: чекпоинты прогона
+# =========================
+
+def start_sync_run(
+    kind: str,
+    page_size: int,
+    max_items: Optional[int] = None,
+    delta: bool = True,
+    resume: bool = False,
+) -> SyncRun:
+    """
+    resume=True -> продолжить последний незавершённый прогон этого вида
+    (если он не старше RESUME_MAX_AGE_HOURS), иначе — новый SyncRun.
+    Слишком старый незавершённый прогон помечаем abandoned.
+    """
+    if resume:
+        unfinished = (
+            SyncRun.objects
+            .filter(
+                source="999",
+                kind=kind,
+                status__in=[SyncRun.Status.RUNNING, SyncRun.Status.FAILED],
+                finished_at__isnull=True,
+            )
+            .order_by("-started_at")
+            .first()
+        )
+        if unfinished is not None:
+            if timezone.now() - unfinished.started_at <= datetime.timedelta(hours=RESUME_MAX_AGE_HOURS):
+                unfinished.status = SyncRun.Status.RUNNING
+                unfinished.resumed += 1
+                unfinished.error = ""
+                unfinished.save(update_fields=["status", "resumed", "error", "updated_at"])
+                return unfinished
+            unfinished.status = SyncRun.Status.ABANDONED
+            unfinished.save(update_fields=["status", "updated_at"])
+
+    return SyncRun.objects.create(
+        source="999",
+        kind=kind,
+        page_size=page_size,
+        max_items=max_items,
+        delta=delta,
+    )
+
+
+def _checkpoint_sync_run(run: SyncRun, page: int, counters: Dict[str, Any]) -> None:
+    """Страница обработана целиком — сдвигаем курсор (одна строка, один UPDATE)."""
+    run.page = page
+    run.counters.update(counters)
+    run.save(update_fields=["page", "counters", "updated_at"])
+
 
-        page += 1
+def _count_listing_page(counters: Dict[str, Any], run: SyncRun, page: int, ids: List[str]) -> None:
+    """
+    processed / active_seen за страницу листинга. Страницу последнего чекпоинта
+    resume проходит ещё раз — её объявления уже посчитаны (page_ids в
+    чекпоинте), добавляем только новые на ней (листинг сдвинулся).
+    """
+    fresh = ids
+    if page == run.page:
+        counted = set(run.counters.get("page_ids") or ())
+        fresh = [advert_id for advert_id in ids if advert_id not in counted]
+    counters["processed"] += len(fresh)
+    counters["active_seen"] += len(fresh)
+    counters["page_ids"] = list(ids)
+
+
+def finish_sync_run(run: SyncRun) -> None:
+    run.status = SyncRun.Status.COMPLETED
+    run.finished_at = timezone.now()
+    run.save(update_fields=["status", "finished_at", "listing_done", "counters", "error", "updated_at"])
+
+
+# =========================
+# Массовый импорт (без архивирования)
+# =========================
+
+def sync_all_from_999(
+    page_size: int = 25,
+    max_items: Optional[int] = None,
+    metrics: ImportMetrics = NULL_METRICS,
+    guard: Optional[Callable[[], None]] = None,
+) -> int:
+    """
+    Простой импорт без деактивации отсутствующих.
+    Оставляем на случай отладки. guard — см. _import_page.
+    """
+    imported = 0
+
+    # один timestamp для всего запуска
+    sync_started_at = timezone.now()
+
+    for listing_page in iter_car_adverts(page_size=page_size, max_items=max_items or None, metrics=metrics).pages():
+        page_ids = listing_page.ids
+        with metrics.stage("prefetch"):
+            bundles = _prefetch_bundles(page_ids, revalidate=True)
+        imported += _import_page(page_ids, bundles, sync_started_at, metrics=metrics, revalidate=True, guard=guard)
 
     return imported
 
@@ -1606,7 +2523,15 @@ def sync_all_from_999(page_size: int = 25, max_items: Optional[int] = None) -> i
 # Массовый импорт с авто-архивацией исчезнувших
 # =========================
 
-def sync_all_from_999_with_archive(page_size: int = 25, max_items: Optional[int] = None) -> dict:
+def sync_all_from_999_with_archive(
+    page_size: int = 25,
+    max_items: Optional[int] = None,
+    metrics: Optional[ImportMetrics] = None,
+    delta: Optional[bool] = None,
+    resume: bool = False,
+    pipeline: Optional[bool] = None,
+    guard: Optional[Callable[[], None]] = None,
+) -> dict:
     """
     Полная синхронизация стока:
     - обходим активные объявления на 999.md (subcategory 659),
@@ -1622,84 +2547,545 @@ def sync_all_from_999_with_archive(page_size: int = 25, max_items: Optional[int]
               status="archived"
               sold_at=now()
           (то есть они ушли с 999.md -> больше не показываем на сайте)
+    - delta (по умолчанию N999_LISTING_DELTA): полный импорт только для новых,
+      изменившихся в листинге или давно не обновлявшихся (N999_DETAIL_MAX_AGE_HOURS);
+      остальным — last_seen_at и, если в листинге сменилась цена, price_eur
+    - прогон пишется в SyncRun (курсор страниц, счётчики); resume=True продолжает
+      последний незавершённый прогон (не старше N999_RESUME_MAX_AGE_HOURS) с его
+      водяным знаком и параметрами, а не начинает со страницы 1
+    - архивация — только если листинг пройден до конца (не при обрыве и не при max_items)
+    - pipeline (по умолчанию N999_PIPELINE): страницы идут через ImportPipeline —
+      скачивание, разбор и запись работают параллельно, а не по очереди на странице
+    - guard (SyncLock.ensure_held) зовём перед каждой страницей и каждой записью:
+      лок потерян -> исключение, прогон FAILED, resume продолжит с чекпоинта
 
     Возвращаем статистику:
     {
         "imported": <сколько мы сейчас апсертнули/обновили>,
+        "failed": <сколько объявлений упало и ушло в dead-letter (FailedAdvert)>,
         "archived": <сколько мы деактивировали>,
-        "active_seen": <сколько уникальных объявлений реально увидели на 999>
+        "active_seen": <сколько уникальных объявлений реально увидели на 999>,
+        "http": <счётчики пула соединений: рукопожатия, reuse, латентность по эндпоинтам>,
+        "concurrency": <окно AIMD-контроллера и история его изменений за синк>,
+        "fetch_plan": <сколько HTML-страниц скачали/пропустили и откуда взяли каждое поле>,
+        "timings": <время по стадиям (HTTP, парсинг, reconcile, запись, фото) с p50/p95,
+                    время на объявление, ретраи и 429 — см. ImportMetrics.summary()>,
+        "delta": <сколько объявлений импортировали полностью / пропустили / обновили только цену>,
+        "run": <id прогона SyncRun, сколько раз возобновляли, пройден ли листинг целиком>,
+        "pipeline": <только в режиме конвейера: загрузка стадий, глубина очередей, узкое место>
     }
     """
 
-    sync_started_at = timezone.now()
-    seen_ids: set[str] = set()
+    if delta is None:
+        delta = LISTING_DELTA
+    if pipeline is None:
+        pipeline = PIPELINE
+    run = start_sync_run("full", page_size=page_size, max_items=max_items, delta=delta, resume=resume)
+    # при возобновлении — параметры и водяной знак упавшего прогона
+    page_size, max_items, delta = run.page_size, run.max_items, run.delta
+    sync_started_at = run.started_at
+
+    metrics = metrics or ImportMetrics()
+    delta_stats = run.counters.get("delta") or new_delta_stats()
+    reset_client_stats()
+    plan_stats = new_plan_stats()
+
+    counters = {
+        "imported": run.counters.get("imported", 0),
+        "failed": run.counters.get("failed", 0),
+        "processed": run.counters.get("processed", 0),
+        "active_seen": run.counters.get("active_seen", 0),
+        "delta": delta_stats,
+    }
+    # последнюю обработанную страницу проходим ещё раз: если листинг сдвинулся,
+    # объявления с границы страниц не потеряются (и не уйдут в архив);
+    # посчитаны они уже были — в max_items и счётчики второй раз не идут
+    replayed = len(run.counters.get("page_ids") or ()) if run.page else 0
+    stream = iter_car_adverts(
+        page_size=page_size,
+        max_items=max(0, max_items - counters["processed"] + replayed) if max_items else None,
+        start_page=max(1, run.page),
+        metrics=metrics,
+    )
 
-    page = 1
-    imported = 0
-    processed_total = 0
+    pipeline_stats = None
+    try:
+        if pipeline:
+            pipeline_stats = _sync_pages_pipeline(
+                stream, run, sync_started_at, delta, counters, plan_stats, metrics, guard=guard,
+            )
+        else:
+            for listing_page in stream.pages():
+                if guard is not None:
+                    guard()
+                page_ids = listing_page.ids
+                entries = listing_page.entries
+                listing_hashes = {advert_id: listing_fingerprint(entries[advert_id]) for advert_id in page_ids}
+                full_ids = page_ids
+                if delta:
+                    with metrics.stage("delta"):
+                        full_ids = _apply_listing_delta(entries, listing_hashes, sync_started_at, delta_stats)
+
+                # полный импорт здесь — всегда потому, что объявление поменялось (или --full):
+                # тела без валидаторов из HTTP-кеша не берём, иначе запишем старое под новый listing_hash
+                with metrics.stage("prefetch"):
+                    bundles = _prefetch_bundles(full_ids, revalidate=True)
+
+                # апсерт страницы (build_car_fields сам ставит active=True и last_seen_at=sync_started_at);
+                # упавшие объявления уходят в dead-letter, синк идёт дальше
+                failed: List[str] = []
+                counters["imported"] += _import_page(
+                    full_ids,
+                    bundles,
+                    sync_started_at,
+                    plan_stats=plan_stats,
+                    metrics=metrics,
+                    listing_hashes=listing_hashes,
+                    failed=failed,
+                    revalidate=True,
+                    guard=guard,
+                )
+                counters["failed"] += len(failed)
+                _count_listing_page(counters, run, listing_page.page, page_ids)
+                _checkpoint_sync_run(run, listing_page.page, counters)
+        run.listing_done = stream.listing_done
+        if guard is not None:
+            guard()  # архивировать можно, только если лок всё ещё наш
+    except BaseException as e:
+        # воркер убили / API лёг: курсор уже в БД, следующий resume продолжит отсюда
+        run.status = SyncRun.Status.FAILED
+        run.error = repr(e)[:2000]
+        run.save(update_fields=["status", "error", "updated_at"])
+        raise
 
-    while True:
-        data = get_adverts(page=page, page_size=page_size, states=STATES, lang=LANG)
-        adverts = data.get("adverts", [])
-        if not adverts:
-            break
+    # ---------- DEACTIVATE / ARCHIVE отсутствующие ----------
+    # все объявы source="999", которым этот прогон не поставил last_seen_at,
+    # считаем что они ушли с 999 -> больше не показываем на сайте.
+    # Только если листинг пройден целиком и в нём что-то было.
+    archived_count = 0
+    if run.listing_done and counters["active_seen"]:
+        with metrics.stage("archive"):
+            archived_count = archive_unseen_cars(sync_started_at)
+
+    http = client_stats()
+    for ep in http["endpoints"].values():
+        metrics.incr("http_retries", ep["retries"])
+        metrics.incr("http_429", ep["status_429"])
+
+    run.counters["archived"] = archived_count
+    finish_sync_run(run)
 
-        for a in adverts:
-            subcat = ((a.get("categories") or {}).get("subcategory") or {}).get("id")
-            # берём только легковые: subcategory.id == 659
-            if str(subcat) != "659":
-                continue
+    return {
+        "imported": counters["imported"],
+        "failed": counters["failed"],
+        "archived": archived_count,
+        "active_seen": counters["active_seen"],
+        "http": http,
+        "concurrency": concurrency_stats(),
+        "fetch_plan": plan_stats,
+        "timings": metrics.summary(),
+        "delta": delta_stats if delta else None,
+        "run": {"id": run.pk, "resumed": run.resumed, "listing_done": run.listing_done, "pages": run.page},
+        "pipeline": pipeline_stats,
+    }
 
-            advert_id = a.get("id")
-            if not advert_id:
-                continue
 
-            advert_id = str(advert_id)
+def _sync_pages_pipeline(
+    stream: CarAdvertStream,
+    run: SyncRun,
+    seen_at: timezone.datetime,
+    delta: bool,
+    counters: Dict[str, Any],
+    plan_stats: Dict[str, Any],
+    metrics: ImportMetrics,
+    guard: Optional[Callable[[], None]] = None,
+) -> Dict[str, Any]:
+    """
+    Страницы синка через ImportPipeline: листинг + дельта в своём потоке,
+    fetch_advert_from_999 (после _prefetch_bundles) — в пуле скачивания,
+    build_car_fields — в пуле разбора, _write_batch — в этом потоке.
+    Чекпоинт SyncRun — по последней странице, записанной целиком вместе
+    со всеми предыдущими. Возвращает статистику конвейера.
+    """
+    delta_stats = counters["delta"]
+    listing_hashes: Dict[str, str] = {}
+    page_ids: Dict[int, List[str]] = {}
+    plan_lock = threading.Lock()
+
+    def batches():
+        for listing_page in stream.pages():
+            if guard is not None:
+                guard()
+            entries = listing_page.entries
+            hashes = {advert_id: listing_fingerprint(entry) for advert_id, entry in entries.items()}
+            full_ids = listing_page.ids
+            if delta:
+                with metrics.stage("delta"):
+                    full_ids = _apply_listing_delta(entries, hashes, seen_at, delta_stats)
+            listing_hashes.update((advert_id, hashes[advert_id]) for advert_id in full_ids)
+            page_ids[listing_page.page] = listing_page.ids
+            yield listing_page.page, full_ids
+
+    def fetch(ids: List[str]):
+        with metrics.stage("prefetch"):
+            bundles = _prefetch_bundles(ids, revalidate=True)
+        for advert_id in ids:
+            try:
+                yield advert_id, fetch_advert_from_999(
+                    advert_id, bundle=bundles.get(advert_id), metrics=metrics, revalidate=True,
+                )
+            except Exception as e:
+                yield advert_id, e
+
+    def parse(advert_id: str, ctx: AdvertFetchContext):
+        fields, images = build_car_fields(ctx, seen_at, metrics=metrics)
+        with plan_lock:
+            _record_plan(plan_stats, ctx)
+        return fields, images
+
+    def write(records, failures):
+        if guard is not None:
+            guard()
+        hashes = {}
+        for advert_id in [a for a, _ in records] + list(failures):
+            if advert_id in listing_hashes:
+                hashes[advert_id] = listing_hashes.pop(advert_id)
+        _write_batch([(a, f, i) for a, (f, i) in records], failures, seen_at, hashes, metrics=metrics)
+        counters["imported"] += len(records)
+        counters["failed"] += len(failures)
+
+    def page_done(page: int):
+        for done_page in sorted(p for p in list(page_ids) if p <= page):
+            _count_listing_page(counters, run, done_page, page_ids.pop(done_page))
+        _checkpoint_sync_run(run, page, counters)
+
+    return ImportPipeline(fetch, parse, write, metrics=metrics).run(batches(), on_page_done=page_done)
 
-            # апсерт машины (эта функция сама ставит active=True и last_seen_at=sync_started_at)
-            upsert_car_from_999(advert_id, seen_at=sync_started_at)
 
-            imported += 1
-            processed_total += 1
-            seen_ids.add(advert_id)
+# =========================
+# Полный импорт заданного списка объявлений
+# =========================
 
-            if max_items and processed_total >= max_items:
-                break
+def import_adverts_from_999(
+    advert_ids: List[str],
+    chunk_size: int = 25,
+    metrics: Optional[ImportMetrics] = None,
+    guard: Optional[Callable[[], None]] = None,
+) -> dict:
+    """
+    Полный импорт (advert + features + HTML по плану) конкретных объявлений —
+    тем же конвейером, что и синк: предвыборка, разбор, запись пачкой.
+    Листинг не ходим и ничего не архивируем. guard — см. _import_page.
+    """
+    metrics = metrics or ImportMetrics()
+    seen_at = timezone.now()
+    plan_stats = new_plan_stats()
+    ids = [str(a) for a in advert_ids]
+    imported = 0
+    failed: List[str] = []
+
+    for start in range(0, len(ids), max(1, chunk_size)):
+        chunk = ids[start:start + chunk_size]
+        with metrics.stage("prefetch"):
+            bundles = _prefetch_bundles(chunk)
+        imported += _import_page(
+            chunk, bundles, seen_at, plan_stats=plan_stats, metrics=metrics, failed=failed, guard=guard,
+        )
 
-        if max_items and processed_total >= max_items:
-            break
+    return {
+        "imported": imported,
+        "failed": failed,
+        "fetch_plan": plan_stats,
+        "timings": metrics.summary(),
+    }
 
-        if PER_PAGE_SLEEP > 0:
-            time.sleep(PER_PAGE_SLEEP)
 
-        subtotal = data.get("subtotal") or 0
-        current_ps = data.get("page_size") or page_size
-        if page * current_ps >= subtotal:
-            break
+def retry_failed_adverts_from_999(
+    limit: int = 100,
+    metrics: Optional[ImportMetrics] = None,
+    guard: Optional[Callable[[], None]] = None,
+) -> dict:
+    """
+    Повторить объявления из dead-letter, у которых подошло next_retry_at
+    (самые «просроченные» первыми, не больше limit за раз). Импорт — тот же
+    import_adverts_from_999: удачные закрываются (resolved), упавшие
+    получают attempts+1 и следующий, вдвое больший интервал.
+
+    Машину, которую синк архивировал уже после первой ошибки (ушла из
+    листинга), не повторяем, а закрываем: API может ещё отдавать снятое
+    объявление, и импорт вернул бы проданную машину на витрину.
+    """
+    due_rows = list(
+        FailedAdvert.objects
+        .filter(source="999", status=FailedAdvert.Status.PENDING, next_retry_at__lte=timezone.now())
+        .order_by("next_retry_at")
+        .values_list("external_id", "first_failed_at")[:limit]
+    )
+    if not due_rows:
+        return {"due": 0, "imported": 0, "failed": 0, "given_up": 0, "archived": 0}
+
+    first_failed = dict(due_rows)
+    archived_ids = [
+        external_id
+        for external_id, sold_at in Car.objects.filter(
+            source="999", external_id__in=list(first_failed), active=False, status="archived", sold_at__isnull=False,
+        ).values_list("external_id", "sold_at")
+        if sold_at >= first_failed[external_id]
+    ]
+    resolve_failed_adverts(archived_ids)
+    skip = set(archived_ids)
+    due = [external_id for external_id, _ in due_rows if external_id not in skip]
+
+    stats = import_adverts_from_999(due, metrics=metrics, guard=guard) if due else {
+        "imported": 0, "failed": [], "timings": {},
+    }
+    failed = stats["failed"]
+    given_up = FailedAdvert.objects.filter(
+        source="999", external_id__in=failed, status=FailedAdvert.Status.GIVEN_UP,
+    ).count() if failed else 0
+    return {
+        "due": len(due_rows),
+        "archived": len(archived_ids),
+        "imported": stats["imported"],
+        "failed": len(failed),
+        "given_up": given_up,
+        "timings": stats["timings"],
+    }
 
-        page += 1
 
-    # ---------- DEACTIVATE / ARCHIVE отсутствующие ----------
-    # все объявы source="999", которые НЕ попали в seen_ids при этом прогоне,
-    # считаем что они ушли с 999 -> больше не показываем на сайте
-    now_ts = timezone.now()
-    archived_qs = (
-        Car.objects
-        .filter(source="999", active=True)
-        .exclude(external_id__in=list(seen_ids))
-    )
+# =========================
+# Fan-out по воркерам Celery: листинг -> пачки -> финал
+# =========================
+# Один воркер идёт по листингу и режет полные импорты на пачки, пачки
+# разлетаются по пулу воркеров (import_999_chunk_task), chord-колбэк
+# архивирует и сводит статистику. Общий темп к API держит Redis-лимитер.
+
+def plan_fanout_from_999(
+    page_size: int = 50,
+    chunk_size: int = 25,
+    max_items: Optional[int] = None,
+    delta: Optional[bool] = None,
+    guard: Optional[Callable[[], None]] = None,
+) -> Tuple[SyncRun, List[Dict[str, Any]]]:
+    """
+    Пройти листинг и подготовить пачки для полного импорта.
 
-    archived_count = archived_qs.update(
-        active=False,
-        status="archived",
-        sold_at=now_ts,
-        updated_at=now_ts,
+    Всем увиденным уже известным машинам сразу ставим last_seen_at = водяной
+    знак прогона — тогда упавшая пачка не приведёт к ложной архивации.
+    Объявления без изменений (дельта) и смена цены обрабатываются здесь же.
+    Возвращает (SyncRun, [{"ids": [...], "listing_hashes": {...}}, ...]).
+    """
+    if delta is None:
+        delta = LISTING_DELTA
+    run = start_sync_run("fanout", page_size=page_size, max_items=max_items, delta=delta)
+    seen_at = run.started_at
+    delta_stats = new_delta_stats()
+    metrics = ImportMetrics()
+
+    pending: List[str] = []
+    pending_hashes: Dict[str, str] = {}
+    processed_total = 0
+    stream = iter_car_adverts(page_size=page_size, max_items=max_items or None, metrics=metrics)
+    try:
+        for listing_page in stream.pages():
+            if guard is not None:
+                guard()
+            page_ids = listing_page.ids
+            entries = listing_page.entries
+            listing_hashes = {advert_id: listing_fingerprint(entries[advert_id]) for advert_id in page_ids}
+
+            with metrics.stage("delta"):
+                full_ids = page_ids
+                if delta:
+                    full_ids = _apply_listing_delta(entries, listing_hashes, seen_at, delta_stats)
+                if full_ids:
+                    Car.objects.filter(source="999", external_id__in=full_ids, active=True).update(last_seen_at=seen_at)
+
+            for advert_id in full_ids:
+                if advert_id not in pending_hashes:
+                    pending.append(advert_id)
+                pending_hashes[advert_id] = listing_hashes[advert_id]
+            processed_total += len(page_ids)
+            _checkpoint_sync_run(run, listing_page.page, {
+                "processed": processed_total,
+                "active_seen": processed_total,
+                "delta": delta_stats,
+            })
+        run.listing_done = stream.listing_done
+    except BaseException as e:
+        run.status = SyncRun.Status.FAILED
+        run.error = repr(e)[:2000]
+        run.save(update_fields=["status", "error", "updated_at"])
+        raise
+
+    chunks = [
+        {
+            "ids": pending[start:start + chunk_size],
+            "listing_hashes": {a: pending_hashes[a] for a in pending[start:start + chunk_size]},
+        }
+        for start in range(0, len(pending), max(1, chunk_size))
+    ]
+    run.counters.update(chunks=len(chunks), queued=len(pending), listing=metrics.summary()["stages"])
+    run.save(update_fields=["listing_done", "counters", "updated_at"])
+    return run, chunks
+
+
+def import_chunk_from_999(
+    run_id: int,
+    advert_ids: List[str],
+    listing_hashes: Optional[Dict[str, str]] = None,
+    guard: Optional[Callable[[], None]] = None,
+) -> dict:
+    """Полный импорт одной пачки fan-out прогона с его водяным знаком. guard — см. _import_page."""
+    run = SyncRun.objects.get(pk=run_id)
+    metrics = ImportMetrics()
+    plan_stats = new_plan_stats()
+    ids = [str(a) for a in advert_ids]
+    failed: List[str] = []
+    with metrics.stage("prefetch"):
+        bundles = _prefetch_bundles(ids, revalidate=True)
+    imported = _import_page(
+        ids,
+        bundles,
+        run.started_at,
+        plan_stats=plan_stats,
+        metrics=metrics,
+        listing_hashes=listing_hashes or {},
+        failed=failed,
+        revalidate=True,
+        guard=guard,
     )
+    return {"ok": True, "imported": imported, "failed": failed, "advert_ids": ids, "timings": metrics.summary()}
+
+
+def _merge_chunk_timings(results: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """Сводка по пачкам: суммы по стадиям и счётчикам, худший p95."""
+    stages: Dict[str, Dict[str, float]] = {}
+    counters: Dict[str, int] = {}
+    adverts = 0
+    for res in results:
+        timings = res.get("timings") or {}
+        adverts += timings.get("adverts", 0)
+        for name, st in (timings.get("stages") or {}).items():
+            agg = stages.setdefault(name, {"count": 0, "total_s": 0.0, "max_p95_ms": 0.0})
+            agg["count"] += st.get("count", 0)
+            agg["total_s"] = round(agg["total_s"] + st.get("total_s", 0.0), 4)
+            agg["max_p95_ms"] = max(agg["max_p95_ms"], st.get("p95_ms", 0.0))
+        for name, value in (timings.get("counters") or {}).items():
+            counters[name] = counters.get(name, 0) + value
+    return {"adverts": adverts, "stages": stages, "counters": counters}
+
+
+def finish_fanout_from_999(
+    run_id: int,
+    results: List[Dict[str, Any]],
+    guard: Optional[Callable[[], None]] = None,
+) -> dict:
+    """
+    Chord-колбэк: сводим результаты пачек, архивируем (если листинг пройден
+    целиком) и закрываем SyncRun. Упавшие пачки не роняют прогон — их id
+    лежат в "failed_ids" (last_seen_at им уже поставил листинг).
+    guard() зовём перед архивацией: лок потерян -> прогон FAILED, не архивируем.
+    """
+    run = SyncRun.objects.get(pk=run_id)
+    if guard is not None:
+        try:
+            guard()
+        except BaseException as e:
+            run.status = SyncRun.Status.FAILED
+            run.error = repr(e)[:2000]
+            run.save(update_fields=["status", "error", "updated_at"])
+            raise
+    results = [r for r in results if isinstance(r, dict)]
+    failed = [r for r in results if not r.get("ok")]
+    failed_ids = [a for r in failed for a in r.get("advert_ids", [])]
+    imported = sum(r.get("imported", 0) for r in results if r.get("ok"))
+    dead_letters = sum(len(r.get("failed") or []) for r in results if r.get("ok"))
+
+    archived_count = 0
+    if run.listing_done and run.counters.get("active_seen"):
+        archived_count = archive_unseen_cars(run.started_at)
+
+    run.counters.update(
+        imported=imported,
+        archived=archived_count,
+        failed=dead_letters,
+        failed_chunks=len(failed),
+        failed_ids=len(failed_ids),
+    )
+    if failed:
+        run.error = "; ".join(str(r.get("error", ""))[:200] for r in failed[:10])
+    finish_sync_run(run)
 
     return {
+        "run": {"id": run.pk, "listing_done": run.listing_done, "pages": run.page},
         "imported": imported,
+        "failed": dead_letters,
         "archived": archived_count,
-        "active_seen": len(seen_ids),
+        "active_seen": run.counters.get("active_seen", 0),
+        "chunks": len(results),
+        "failed_chunks": len(failed),
+        "failed_ids": failed_ids,
+        "delta": run.counters.get("delta"),
+        "timings": _merge_chunk_timings(results),
     }
 
 
+# =========================
+# Быстрый синк «живости»: только листинг
+# =========================
+
+def sync_liveness_from_999(
+    page_size: int = 50,
+    metrics: Optional[ImportMetrics] = None,
+    guard: Optional[Callable[[], None]] = None,
+) -> dict:
+    """
+    Лёгкий синк для частого запуска (раз в несколько минут):
+    - ходим только по страницам get_adverts (никаких advert/features/HTML),
+    - всем уже известным активным машинам со страницы пачкой двигаем last_seen_at,
+    - после полного обхода архивируем активные source='999', которых не было в листинге,
+    - новые id (и вернувшиеся из архива) не импортируем, а отдаём наверх в "new_ids" —
+      их догоняет полный импорт (import_adverts_from_999 / import_999_adverts_task).
+
+    Глубокое обновление полей — по-прежнему sync_all_from_999_with_archive, но редко.
+    """
+    metrics = metrics or ImportMetrics()
+    sync_started_at = timezone.now()
+    seen_ids: set[str] = set()
+    new_ids: List[str] = []
+    touched = 0
+
+    stream = iter_car_adverts(page_size=page_size, metrics=metrics)
+    for listing_page in stream.pages():
+        if guard is not None:
+            guard()
+        page_ids = listing_page.ids
+        seen_ids.update(page_ids)
+
+        with metrics.stage("touch"):
+            known = set(
+                Car.objects
+                .filter(source="999", external_id__in=page_ids, active=True)
+                .values_list("external_id", flat=True)
+            )
+            if known:
+                touched += Car.objects.filter(source="999", external_id__in=known).update(last_seen_at=sync_started_at)
+        new_ids.extend(a for a in page_ids if a not in known)
+
+    # ---------- ARCHIVE отсутствующие ----------
+    # пустой листинг (сбой API) не должен снять с витрины весь сток
+    archived_count = 0
+    if seen_ids:
+        if guard is not None:
+            guard()
+        with metrics.stage("archive"):
+            archived_count = archive_unseen_cars(sync_started_at)
+
+    return {
+        "active_seen": len(seen_ids),
+        "touched": touched,
+        "archived": archived_count,
+        "new_ids": new_ids,
+        "timings": metrics.summary(),
+    }
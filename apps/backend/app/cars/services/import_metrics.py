@@ -0,0 +1,99 @@
+"""
+Лёгкие замеры импорта 999.md: время по стадиям, счётчики, время на объявление.
+
+    metrics = ImportMetrics()
+    with metrics.stage("db_write"):
+        ...
+    metrics.summary()  # -> dict для статистики синка / бенчмарка
+"""
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List
+
+
+def _percentile(sorted_vals: List[float], q: float) -> float:
+    if not sorted_vals:
+        return 0.0
+    idx = min(len(sorted_vals) - 1, int(round(q * (len(sorted_vals) - 1))))
+    return sorted_vals[idx]
+
+
+def _summarize(samples: List[float]) -> Dict[str, float]:
+    vals = sorted(samples)
+    total = sum(vals)
+    return {
+        "count": len(vals),
+        "total_s": round(total, 4),
+        "avg_ms": round(total / len(vals) * 1000, 2) if vals else 0.0,
+        "p50_ms": round(_percentile(vals, 0.50) * 1000, 2),
+        "p95_ms": round(_percentile(vals, 0.95) * 1000, 2),
+        "max_ms": round((vals[-1] if vals else 0.0) * 1000, 2),
+    }
+
+
+class ImportMetrics:
+    """Потокобезопасный сборщик замеров одного прогона импорта."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._started = time.perf_counter()
+        self._stages: Dict[str, List[float]] = defaultdict(list)
+        self._adverts: List[float] = []
+        self.counters: Dict[str, int] = defaultdict(int)
+
+    @contextmanager
+    def stage(self, name: str) -> Iterator[None]:
+        t0 = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(name, time.perf_counter() - t0)
+
+    def add(self, name: str, seconds: float) -> None:
+        with self._lock:
+            self._stages[name].append(seconds)
+
+    def incr(self, name: str, n: int = 1) -> None:
+        with self._lock:
+            self.counters[name] += n
+
+    def advert_done(self, seconds: float) -> None:
+        with self._lock:
+            self._adverts.append(seconds)
+
+    @property
+    def elapsed(self) -> float:
+        return time.perf_counter() - self._started
+
+    def summary(self) -> Dict[str, Any]:
+        with self._lock:
+            stages = {name: _summarize(vals) for name, vals in self._stages.items()}
+            adverts = _summarize(self._adverts)
+            counters = dict(self.counters)
+        elapsed = self.elapsed
+        return {
+            "elapsed_s": round(elapsed, 3),
+            "adverts": adverts["count"],
+            "adverts_per_sec": round(adverts["count"] / elapsed, 2) if elapsed > 0 else 0.0,
+            "per_advert": adverts,
+            "stages": stages,
+            "counters": counters,
+        }
+
+
+class NullMetrics(ImportMetrics):
+    """Заглушка: когда замеры не нужны, код импорта не проверяет `if metrics`."""
+
+    def add(self, name: str, seconds: float) -> None:
+        pass
+
+    def incr(self, name: str, n: int = 1) -> None:
+        pass
+
+    def advert_done(self, seconds: float) -> None:
+        pass
+
+
+NULL_METRICS = NullMetrics()
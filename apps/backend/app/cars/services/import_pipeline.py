@@ -0,0 +1,391 @@
+"""
+Конвейер импорта: явные стадии, связанные ограниченными очередями.
+
+    листинг ──q_fetch──▶ скачивание ──q_parse──▶ разбор ──q_write──▶ запись пачками
+    1 поток              fetch_workers           parse_workers       вызывающий поток
+
+- листинг: итерируемое (page, [id, ...]) — страница листинга после дельты;
+- скачивание: fetch(ids) -> [(id, ctx | исключение)] — только сеть;
+- разбор: parse(id, ctx) -> запись — только CPU, без сети и БД;
+- запись: write(records, failures) — пачками по write_batch, в потоке,
+  который вызвал run() (транзакции и соединение с БД — как у обычного синка).
+
+Все очереди ограничены: если стадия не успевает, очередь перед ней
+заполняется и предыдущая стадия ждёт на put (backpressure). В памяти
+одновременно не больше queue_size страниц id, 2 * queue_adverts
+объявлений в очередях и по странице на воркер скачивания — сколько бы
+ни было объявлений в стоке.
+
+Упавшее объявление (исключение в fetch/parse) идёт в write как failure,
+конвейер не останавливается. Ошибка листинга — дописываем то, что уже
+в полёте, и пробрасываем её из run(). Ошибка записи — останавливаем всё
+и пробрасываем.
+
+run() возвращает загрузку стадий (доля времени, когда воркеры работали,
+а не ждали очередь), время блокировки на заполненной очереди и глубину
+очередей — по ним видно узкое место.
+"""
+import os
+import queue
+import threading
+import time
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+from django.db import connections
+
+from app.cars.services.import_metrics import NULL_METRICS, ImportMetrics
+
+FETCH_WORKERS = int(os.getenv("N999_PIPELINE_FETCH_WORKERS", "2"))
+PARSE_WORKERS = int(os.getenv("N999_PIPELINE_PARSE_WORKERS", "2"))
+# сколько страниц id может ждать скачивания
+QUEUE_SIZE = int(os.getenv("N999_PIPELINE_QUEUE_SIZE", "4"))
+# сколько объявлений может ждать разбора / записи (в каждой из двух очередей)
+QUEUE_ADVERTS = int(os.getenv("N999_PIPELINE_QUEUE_ADVERTS", "100"))
+WRITE_BATCH = int(os.getenv("N999_PIPELINE_WRITE_BATCH", "50"))
+
+_POLL_S = 0.1
+_SAMPLE_S = 0.05
+_DONE = object()
+
+FetchFn = Callable[[List[str]], Iterable[Tuple[str, Any]]]
+ParseFn = Callable[[str, Any], Any]
+WriteFn = Callable[[List[Tuple[str, Any]], Dict[str, Exception]], None]
+
+
+class _StageStats:
+    def __init__(self, workers: int):
+        self.workers = workers
+        self.items = 0
+        self.busy = 0.0
+        self.blocked = 0.0
+        self._lock = threading.Lock()
+
+    def add(self, busy: float = 0.0, blocked: float = 0.0, items: int = 0) -> None:
+        with self._lock:
+            self.busy += busy
+            self.blocked += blocked
+            self.items += items
+
+    def summary(self, elapsed: float) -> Dict[str, Any]:
+        capacity = self.workers * elapsed
+        return {
+            "workers": self.workers,
+            "items": self.items,
+            "busy_s": round(self.busy, 3),
+            "blocked_s": round(self.blocked, 3),
+            "utilisation": round(self.busy / capacity, 3) if capacity > 0 else 0.0,
+        }
+
+
+class _QueueStats:
+    def __init__(self, q: queue.Queue):
+        self.q = q
+        self.samples = 0
+        self.total = 0
+        self.max = 0
+
+    def sample(self) -> None:
+        depth = self.q.qsize()
+        self.samples += 1
+        self.total += depth
+        self.max = max(self.max, depth)
+
+    def summary(self) -> Dict[str, Any]:
+        return {
+            "maxsize": self.q.maxsize,
+            "avg_depth": round(self.total / self.samples, 2) if self.samples else 0.0,
+            "max_depth": self.max,
+        }
+
+
+class ImportPipeline:
+    """
+    pipeline = ImportPipeline(fetch, parse, write, metrics=metrics)
+    stats = pipeline.run(batches, on_page_done=checkpoint)
+
+    on_page_done(page) зовётся из потока записи, когда записаны все
+    объявления этой страницы и всех страниц до неё (по порядку листинга) —
+    это безопасная точка для чекпоинта.
+    """
+
+    def __init__(
+        self,
+        fetch: FetchFn,
+        parse: ParseFn,
+        write: WriteFn,
+        fetch_workers: int = FETCH_WORKERS,
+        parse_workers: int = PARSE_WORKERS,
+        queue_size: int = QUEUE_SIZE,
+        queue_adverts: int = QUEUE_ADVERTS,
+        write_batch: int = WRITE_BATCH,
+        metrics: ImportMetrics = NULL_METRICS,
+    ):
+        self.fetch = fetch
+        self.parse = parse
+        self.write = write
+        self.fetch_workers = max(1, fetch_workers)
+        self.parse_workers = max(1, parse_workers)
+        self.write_batch = max(1, write_batch)
+        self.metrics = metrics
+
+        self.q_fetch: queue.Queue = queue.Queue(maxsize=max(1, queue_size))
+        self.q_parse: queue.Queue = queue.Queue(maxsize=max(1, queue_adverts))
+        self.q_write: queue.Queue = queue.Queue(maxsize=max(1, queue_adverts))
+        self.stages = {
+            "listing": _StageStats(1),
+            "fetch": _StageStats(self.fetch_workers),
+            "parse": _StageStats(self.parse_workers),
+            "write": _StageStats(1),
+        }
+        self.queues = {
+            "fetch": _QueueStats(self.q_fetch),
+            "parse": _QueueStats(self.q_parse),
+            "write": _QueueStats(self.q_write),
+        }
+
+        self._stop = threading.Event()
+        self._finished = threading.Event()
+        self._lock = threading.Lock()
+        self._exited = {"fetch": 0, "parse": 0}
+        self._fatal: Optional[BaseException] = None
+        self.listing_error: Optional[BaseException] = None
+
+        # учёт страниц для чекпоинта: сколько объявлений страницы ещё не записано
+        self._pending: Dict[int, int] = {}
+        self._page_order: List[int] = []
+        self._cursor = 0
+        self._on_page_done: Optional[Callable[[int], None]] = None
+
+    # ---------- очереди с остановкой ----------
+
+    def _put(self, q: queue.Queue, item: Any) -> float:
+        """put с ожиданием места; возвращает, сколько ждали. При остановке — -1."""
+        t0 = time.perf_counter()
+        while not self._stop.is_set():
+            try:
+                q.put(item, timeout=_POLL_S)
+                return time.perf_counter() - t0
+            except queue.Full:
+                continue
+        return -1.0
+
+    def _get(self, q: queue.Queue) -> Any:
+        while not self._stop.is_set():
+            try:
+                return q.get(timeout=_POLL_S)
+            except queue.Empty:
+                continue
+        return _DONE
+
+    def _fail(self, exc: BaseException) -> None:
+        with self._lock:
+            if self._fatal is None:
+                self._fatal = exc
+        self._stop.set()
+
+    def _worker_exit(self, stage: str) -> None:
+        """Последний воркер стадии передаёт «конец» следующей стадии."""
+        with self._lock:
+            self._exited[stage] += 1
+            last = self._exited[stage] == (self.fetch_workers if stage == "fetch" else self.parse_workers)
+        if not last:
+            return
+        if stage == "fetch":
+            for _ in range(self.parse_workers):
+                self._put(self.q_parse, _DONE)
+        else:
+            self._put(self.q_write, _DONE)
+
+    # ---------- стадии ----------
+
+    def _listing(self, batches: Iterable[Tuple[int, List[str]]]) -> None:
+        stats = self.stages["listing"]
+        it = iter(batches)
+        try:
+            while not self._stop.is_set():
+                t0 = time.perf_counter()
+                try:
+                    page, ids = next(it)
+                except StopIteration:
+                    break
+                stats.add(busy=time.perf_counter() - t0, items=1)
+                with self._lock:
+                    self._pending[page] = self._pending.get(page, 0) + len(ids)
+                    if page not in self._page_order:
+                        self._page_order.append(page)
+                if ids:
+                    waited = self._put(self.q_fetch, (page, list(ids)))
+                    if waited < 0:
+                        break
+                    stats.add(blocked=waited)
+        except Exception as e:
+            # листинг упал: что уже в полёте — дописываем, ошибку отдаём из run()
+            self.listing_error = e
+        except BaseException as e:
+            self._fail(e)
+        finally:
+            close = getattr(it, "close", None)
+            if close is not None:
+                close()
+            for _ in range(self.fetch_workers):
+                self._put(self.q_fetch, _DONE)
+            connections.close_all()
+
+    def _fetch_worker(self) -> None:
+        stats = self.stages["fetch"]
+        try:
+            while True:
+                item = self._get(self.q_fetch)
+                if item is _DONE:
+                    break
+                page, ids = item
+                t0 = time.perf_counter()
+                blocked = 0.0
+                done: set = set()
+                try:
+                    for advert_id, ctx in self.fetch(ids):
+                        done.add(advert_id)
+                        target = self.q_write if isinstance(ctx, Exception) else self.q_parse
+                        waited = self._put(target, (page, advert_id, ctx, t0))
+                        if waited < 0:
+                            return
+                        blocked += waited
+                except Exception as e:
+                    # упала вся пачка (а не отдельное объявление) — каждому её id по failure
+                    for advert_id in ids:
+                        if advert_id not in done and self._put(self.q_write, (page, advert_id, e, t0)) < 0:
+                            return
+                stats.add(busy=time.perf_counter() - t0 - blocked, blocked=blocked, items=len(ids))
+        except BaseException as e:
+            self._fail(e)
+        finally:
+            self._worker_exit("fetch")
+            connections.close_all()
+
+    def _parse_worker(self) -> None:
+        stats = self.stages["parse"]
+        try:
+            while True:
+                item = self._get(self.q_parse)
+                if item is _DONE:
+                    break
+                page, advert_id, ctx, t_start = item
+                t0 = time.perf_counter()
+                try:
+                    result = self.parse(advert_id, ctx)
+                except Exception as e:
+                    result = e
+                busy = time.perf_counter() - t0
+                waited = self._put(self.q_write, (page, advert_id, result, t_start))
+                if waited < 0:
+                    return
+                stats.add(busy=busy, blocked=waited, items=1)
+        except BaseException as e:
+            self._fail(e)
+        finally:
+            self._worker_exit("parse")
+            connections.close_all()
+
+    def _sampler(self) -> None:
+        while not self._finished.wait(_SAMPLE_S):
+            for qs in self.queues.values():
+                qs.sample()
+
+    # ---------- запись (вызывающий поток) ----------
+
+    def _flush(self, buffer: List[Tuple[int, str, Any, float]]) -> None:
+        if not buffer:
+            return
+        records = [(advert_id, result) for _, advert_id, result, _ in buffer if not isinstance(result, Exception)]
+        failures = {advert_id: result for _, advert_id, result, _ in buffer if isinstance(result, Exception)}
+        t0 = time.perf_counter()
+        self.write(records, failures)
+        done_at = time.perf_counter()
+        self.stages["write"].add(busy=done_at - t0, items=len(buffer))
+
+        for page, _, result, t_start in buffer:
+            if not isinstance(result, Exception):
+                # от начала скачивания до записи — задержка объявления в конвейере
+                self.metrics.advert_done(done_at - t_start)
+            with self._lock:
+                self._pending[page] -= 1
+        buffer.clear()
+        self._advance_checkpoint()
+
+    def _advance_checkpoint(self) -> None:
+        last_done = None
+        with self._lock:
+            while self._cursor < len(self._page_order) and self._pending[self._page_order[self._cursor]] <= 0:
+                last_done = self._page_order[self._cursor]
+                self._cursor += 1
+        if last_done is not None and self._on_page_done is not None:
+            self._on_page_done(last_done)
+
+    def _writer(self) -> None:
+        buffer: List[Tuple[int, str, Any, float]] = []
+        while True:
+            try:
+                item = self.q_write.get(timeout=_POLL_S)
+            except queue.Empty:
+                # простой — дописываем накопленное, чтобы чекпоинт не отставал
+                self._flush(buffer)
+                self._advance_checkpoint()
+                if self._stop.is_set():
+                    return
+                continue
+            if item is _DONE:
+                break
+            buffer.append(item)
+            if len(buffer) >= self.write_batch:
+                self._flush(buffer)
+        self._flush(buffer)
+        self._advance_checkpoint()
+
+    # ---------- запуск ----------
+
+    def run(
+        self,
+        batches: Iterable[Tuple[int, List[str]]],
+        on_page_done: Optional[Callable[[int], None]] = None,
+    ) -> Dict[str, Any]:
+        self._on_page_done = on_page_done
+        started = time.perf_counter()
+        threads = [threading.Thread(target=self._listing, args=(batches,), name="n999-pipe-listing", daemon=True)]
+        threads += [
+            threading.Thread(target=self._fetch_worker, name=f"n999-pipe-fetch-{n}", daemon=True)
+            for n in range(self.fetch_workers)
+        ]
+        threads += [
+            threading.Thread(target=self._parse_worker, name=f"n999-pipe-parse-{n}", daemon=True)
+            for n in range(self.parse_workers)
+        ]
+        sampler = threading.Thread(target=self._sampler, name="n999-pipe-sampler", daemon=True)
+        for t in threads:
+            t.start()
+        sampler.start()
+
+        try:
+            self._writer()
+        except BaseException as e:
+            self._fail(e)
+        finally:
+            # при ошибке _fail уже выставил _stop — воркеры выйдут на ближайшем опросе очереди
+            for t in threads:
+                t.join()
+            self._finished.set()
+            sampler.join()
+
+        if self._fatal is not None:
+            raise self._fatal
+        if self.listing_error is not None:
+            raise self.listing_error
+        return self.summary(time.perf_counter() - started)
+
+    def summary(self, elapsed: float) -> Dict[str, Any]:
+        stages = {name: st.summary(elapsed) for name, st in self.stages.items()}
+        return {
+            "elapsed_s": round(elapsed, 3),
+            "stages": stages,
+            "queues": {name: qs.summary() for name, qs in self.queues.items()},
+            "bottleneck": max(stages, key=lambda name: stages[name]["utilisation"]),
+        }
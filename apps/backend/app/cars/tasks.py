@@ -1,20 +1,276 @@
-from celery import shared_task
+import datetime
+import os
+
+from celery import chord, shared_task
 from django.core.management import call_command
+from django.utils import timezone
+
+from app.cars.services.import_999 import (
+    finish_fanout_from_999,
+    import_adverts_from_999,
+    import_chunk_from_999,
+    plan_fanout_from_999,
+    retry_failed_adverts_from_999,
+    sync_all_from_999_with_archive,
+    sync_liveness_from_999,
+)
+from app.cars.models import SyncRun
+from app.integrations.sync_lock import FANOUT_TTL, SyncLock, SyncLockLost, SyncLockUnavailable, get_lock_store, sync_lock
+
+# один лок на все синки и импорты 999 (полный, живость, fan-out, пачки новых id,
+# повтор dead-letter): они пишут в одни и те же строки и архивируют по водяному
+# знаку — параллельно им ходить нельзя
+SYNC_LOCK_NAME = "sync-999"
+# как часто продлевать аренду fan-out лока, пока пачки стоят в очереди
+FANOUT_KEEPALIVE_S = max(1, FANOUT_TTL // 3)
+# дольше прогон fan-out не держит лок: воркер убили посреди пачки — chord-колбэк
+# не придёт никогда, а без предела keepalive держал бы лок вечно
+FANOUT_MAX_AGE_S = int(os.getenv("N999_FANOUT_MAX_AGE_S", str(FANOUT_TTL * 8)))
 
-@shared_task(name="app.cars.tasks.import_999_task")
-def import_999_task(page_size=40, max_items=100, with_archive=True, verbosity=1):
+
+def _skipped(lock: SyncLock) -> dict:
+    """
+    Лок не взяли: занят (прогон «слился» с идущим) или Redis не отвечает —
+    ничего не делаем, beat запустит задачу в свой срок; в результате видно почему.
     """
-    Обёртка над manage.py import_999, чтобы гонять импорт из Celery.
+    reason = "sync lock unavailable" if lock.error else "sync already running"
+    return {"ok": True, "skipped": True, "reason": reason, "lock": lock.state()}
+
+@shared_task(bind=True, name="app.cars.tasks.import_999_task")
+def import_999_task(
+    self, page_size=40, max_items=100, with_archive=True, verbosity=1, full=False, resume=True, pipeline=None,
+):
     """
+    Импорт из Celery.
+    С архивацией зовём сервис напрямую, чтобы в результат задачи попала
+    статистика синка (timings, http, concurrency) — медленный синк можно
+    разобрать по одному результату задачи (result backend — тот же Redis).
+    Без архивации — обёртка над manage.py import_999, как раньше.
+    full=True — без дельты по листингу (всё тянем заново).
+    resume=True — если прошлый прогон упал (рестарт воркера, деплой),
+    продолжаем его с сохранённой страницы (см. SyncRun).
+    pipeline=True — конвейером (см. import_pipeline), None — по N999_PIPELINE.
+    Пока идёт другой синк 999 — не запускаемся ({"skipped": True, "lock": ...}).
+    """
+    with sync_lock(SYNC_LOCK_NAME, "full" if with_archive else "import", self.request.id) as lock:
+        if not lock.acquired:
+            return _skipped(lock)
+        result = _run_import_999(page_size, max_items, with_archive, verbosity, full, resume, pipeline, lock)
+    result["lock"] = lock.state()
+    return result
+
+
+def _run_import_999(page_size, max_items, with_archive, verbosity, full, resume, pipeline, lock: SyncLock) -> dict:
+    if with_archive:
+        stats = sync_all_from_999_with_archive(
+            page_size=page_size,
+            max_items=max_items,
+            delta=False if full else None,
+            resume=resume,
+            pipeline=pipeline,
+            guard=lock.ensure_held,
+        )
+        return {
+            "ok": True,
+            "page_size": page_size,
+            "max_items": max_items,
+            "with_archive": with_archive,
+            "stats": stats,
+        }
+
     args = [
         "import_999",
         f"--page-size={page_size}",
         f"--max-items={max_items}",
+        "--no-lock",  # лок уже держит эта задача
     ]
-    if with_archive:
-        args.append("--with-archive")
     if verbosity and int(verbosity) > 1:
         args.append(f"--verbosity={int(verbosity)}")
 
     call_command(*args)
     return {"ok": True, "page_size": page_size, "max_items": max_items, "with_archive": with_archive}
+
+
+@shared_task(bind=True, name="app.cars.tasks.sync_999_liveness_task")
+def sync_999_liveness_task(self, page_size=50, chunk_size=25):
+    """
+    Быстрый синк «живости» — можно ставить в beat раз в несколько минут:
+    листинг -> last_seen_at / архивация, новые id уходят в import_999_adverts_task
+    пачками по chunk_size. Глубокое обновление — import_999_task, редко.
+    Во время полного синка пропускается: тот и так двигает last_seen_at.
+    """
+    with sync_lock(SYNC_LOCK_NAME, "liveness", self.request.id) as lock:
+        if not lock.acquired:
+            return _skipped(lock)
+        stats = sync_liveness_from_999(page_size=page_size, guard=lock.ensure_held)
+    new_ids = stats.pop("new_ids")
+    queued = 0
+    for start in range(0, len(new_ids), max(1, chunk_size)):
+        import_999_adverts_task.delay(new_ids[start:start + chunk_size])
+        queued += 1
+    return {"ok": True, "new": len(new_ids), "queued_chunks": queued, "stats": stats, "lock": lock.state()}
+
+
+@shared_task(bind=True, name="app.cars.tasks.import_999_adverts_task")
+def import_999_adverts_task(self, advert_ids):
+    """
+    Полный импорт конкретных объявлений (новые id из синка живости).
+    Пока идёт другой синк 999 — пропускаем: полный синк их и так импортирует,
+    а не импортированные id следующий синк живости найдёт снова.
+    """
+    with sync_lock(SYNC_LOCK_NAME, "adverts", self.request.id) as lock:
+        if not lock.acquired:
+            return _skipped(lock)
+        stats = import_adverts_from_999(advert_ids, guard=lock.ensure_held)
+    return {"ok": True, "advert_ids": len(advert_ids), "stats": stats, "lock": lock.state()}
+
+
+@shared_task(bind=True, name="app.cars.tasks.retry_failed_adverts_999_task")
+def retry_failed_adverts_999_task(self, limit=100):
+    """
+    Повтор объявлений из dead-letter (FailedAdvert), у которых подошло
+    next_retry_at; интервал растёт экспоненциально (N999_RETRY_BASE_MINUTES).
+    Ставим в beat с периодом порядка базового интервала — основной синк
+    упавшие объявления не ждёт. Пока идёт другой синк 999 — пропускаем до следующего раза.
+    """
+    with sync_lock(SYNC_LOCK_NAME, "retry", self.request.id) as lock:
+        if not lock.acquired:
+            return _skipped(lock)
+        stats = retry_failed_adverts_from_999(limit=limit, guard=lock.ensure_held)
+    return {"ok": True, "stats": stats, "lock": lock.state()}
+
+
+# =========================
+# Fan-out синк: листинг -> пачки по пулу воркеров -> chord-колбэк
+# =========================
+
+@shared_task(bind=True, name="app.cars.tasks.sync_999_fanout_task")
+def sync_999_fanout_task(self, page_size=50, chunk_size=25, max_items=None, full=False):
+    """
+    Полный синк, распараллеленный по воркерам: эта задача только идёт по
+    листингу (дельта, last_seen_at) и раздаёт пачки import_999_chunk_task;
+    архивацию и сводку делает finish_999_fanout_task, когда отработают все пачки.
+    Пропускная способность растёт с числом воркеров (темп к API держит лимитер).
+
+    Лок синка держится до колбэка: пока идёт листинг, аренду продлевает
+    heartbeat этой задачи; потом значение лока уезжает в keep_999_fanout_lock_task
+    (продлевает аренду, пока прогон не закрыт, — пачки могут долго стоять
+    в очереди), в пачки (каждая продлевает её, пока работает) и в колбэк,
+    который его снимает.
+    """
+    lock = SyncLock(SYNC_LOCK_NAME, ttl=FANOUT_TTL, store=get_lock_store())
+    if not lock.acquire("fanout", self.request.id):
+        return _skipped(lock)
+    lock.start_heartbeat()
+    try:
+        run, chunks = plan_fanout_from_999(
+            page_size=page_size,
+            chunk_size=chunk_size,
+            max_items=max_items,
+            delta=False if full else None,
+            guard=lock.ensure_held,
+        )
+        lock.stop_heartbeat()
+        lock.ensure_held()
+        keep_999_fanout_lock_task.apply_async((run.pk, lock.value), countdown=FANOUT_KEEPALIVE_S)
+        if chunks:
+            header = [
+                import_999_chunk_task.s(run.pk, c["ids"], c["listing_hashes"], lock_value=lock.value)
+                for c in chunks
+            ]
+            chord(header)(finish_999_fanout_task.s(run.pk, lock_value=lock.value))
+        else:
+            # пустой chord Celery не запускает — колбэк зовём сами
+            finish_999_fanout_task.delay([], run.pk, lock_value=lock.value)
+    except BaseException:
+        lock.release()
+        raise
+    return {
+        "ok": True,
+        "run_id": run.pk,
+        "listing_done": run.listing_done,
+        "chunks": len(chunks),
+        "queued": run.counters.get("queued", 0),
+        "delta": run.counters.get("delta"),
+        "lock": lock.state(),
+    }
+
+
+@shared_task(
+    bind=True,
+    name="app.cars.tasks.import_999_chunk_task",
+    max_retries=2,
+    default_retry_delay=30,
+)
+def import_999_chunk_task(self, run_id, advert_ids, listing_hashes=None, lock_value=None):
+    """
+    Пачка полного импорта. Не падает наружу: после ретраев возвращает
+    {"ok": False, ...}, чтобы chord-колбэк всё равно отработал и прогон не пропал.
+    Пока пачка работает, аренду лока продлевает её heartbeat; лок потерян
+    (перехватили, Redis лежал дольше аренды) — пачка не пишет и не ретраится.
+    """
+    lock = SyncLock.from_value(SYNC_LOCK_NAME, lock_value, ttl=FANOUT_TTL) if lock_value else None
+    try:
+        if lock is not None:
+            if not lock.extend():
+                raise SyncLockLost(f"sync lock {SYNC_LOCK_NAME!r} lost before chunk")
+            lock.start_heartbeat()
+        return import_chunk_from_999(
+            run_id, advert_ids, listing_hashes, guard=lock.ensure_held if lock is not None else None,
+        )
+    except SyncLockLost as e:
+        return {"ok": False, "advert_ids": list(advert_ids), "error": repr(e)[:500]}
+    except Exception as e:
+        if self.request.retries < self.max_retries:
+            raise self.retry(exc=e)
+        return {"ok": False, "advert_ids": list(advert_ids), "error": repr(e)[:500]}
+    finally:
+        if lock is not None:
+            lock.stop_heartbeat()
+
+
+@shared_task(name="app.cars.tasks.finish_999_fanout_task")
+def finish_999_fanout_task(results, run_id, lock_value=None):
+    """
+    Chord-колбэк fan-out синка: архивация + сводная статистика в результате задачи, снятие лока.
+    Лок к этому моменту потерян — прогон FAILED без архивации (задача падает).
+    """
+    lock = SyncLock.from_value(SYNC_LOCK_NAME, lock_value, ttl=FANOUT_TTL)
+    try:
+        lock.extend()
+        stats = finish_fanout_from_999(run_id, results, guard=lock.ensure_held)
+    finally:
+        lock.release()
+    return {"ok": True, "stats": stats, "lock": lock.state()}
+
+
+@shared_task(
+    name="app.cars.tasks.keep_999_fanout_lock_task",
+    autoretry_for=(SyncLockUnavailable,),
+    retry_backoff=True,
+    max_retries=5,
+)
+def keep_999_fanout_lock_task(run_id, lock_value):
+    """
+    Heartbeat лока fan-out прогона, пока пачки стоят в очереди: продлеваем
+    аренду на FANOUT_TTL и ставим себя снова через FANOUT_KEEPALIVE_S —
+    пока колбэк не закроет прогон. Аренду перехватили — больше не продлеваем
+    (пачки и колбэк увидят это сами). Прогон старше FANOUT_MAX_AGE_S
+    (колбэк так и не пришёл) — ABANDONED и лок снимаем; опоздавший колбэк
+    лок уже не продлит и архивировать не станет.
+    """
+    run = SyncRun.objects.filter(pk=run_id).first()
+    if run is None or run.finished_at is not None:
+        return {"ok": True, "finished": True}
+    lock = SyncLock.from_value(SYNC_LOCK_NAME, lock_value, ttl=FANOUT_TTL)
+    if timezone.now() - run.started_at > datetime.timedelta(seconds=FANOUT_MAX_AGE_S):
+        run.status = SyncRun.Status.ABANDONED
+        run.error = f"fan-out не закрыт за {FANOUT_MAX_AGE_S} с (chord-колбэк не пришёл)"
+        run.finished_at = timezone.now()
+        run.save(update_fields=["status", "error", "finished_at", "updated_at"])
+        lock.release()
+        return {"ok": False, "abandoned": True, "lock": lock.state()}
+    if not lock.extend():
+        return {"ok": False, "lock": lock.state()}
+    keep_999_fanout_lock_task.apply_async((run_id, lock_value), countdown=FANOUT_KEEPALIVE_S)
+    return {"ok": True, "lock": lock.state()}
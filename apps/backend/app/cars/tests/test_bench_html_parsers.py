@@ -0,0 +1,52 @@
+"""
+Скорость бэкендов разбора (pytest-benchmark): мс на корпус страниц —
+разбор + извлечение того, что берёт импорт. Группа html_parsers —
+целые страницы (ускорение к bs4 видно в таблице), html_slice — нарезка
+с фотками и без плюс разбор документа нарезки.
+
+По умолчанию — fixtures/corpus; записанный корпус — N999_BENCH_CORPUS=DIR.
+Паритет — test_html_parsers.py (и bench_html_parsers на большом корпусе).
+
+  N999_BENCH_CORPUS=./corpus pytest app/cars/tests/test_bench_html_parsers.py --benchmark-json parsers.json
+"""
+import os
+
+import pytest
+
+from app.cars.management.commands.bench_html_parsers import _extract, _slice
+from app.cars.services import html_parsers
+from app.integrations.replay import Corpus
+
+CORPUS = os.getenv("N999_BENCH_CORPUS") or os.path.join(os.path.dirname(__file__), "fixtures", "corpus")
+PAGES = [html for _, html in sorted(Corpus.load(CORPUS).bodies["public_html"].items()) if html]
+BACKENDS = html_parsers.available_backends()
+
+
+def _parse_all(cls, pages):
+    return [_extract(cls(html)) for html in pages]
+
+
+@pytest.mark.parametrize("backend", BACKENDS)
+def test_parse_speed(benchmark, backend):
+    benchmark.group = "html_parsers"
+    benchmark.extra_info["pages"] = len(PAGES)
+
+    results = benchmark(_parse_all, html_parsers.BACKENDS[backend], PAGES)
+
+    assert len(results) == len(PAGES)
+
+
+@pytest.mark.parametrize("images", [True, False], ids=["with_images", "without_images"])
+@pytest.mark.parametrize("backend", BACKENDS)
+def test_slice_and_parse_speed(benchmark, backend, images):
+    cls = html_parsers.BACKENDS[backend]
+    benchmark.group = "html_slice"
+    benchmark.extra_info.update(
+        pages=len(PAGES),
+        chars_total=sum(len(html) for html in PAGES),
+        chars_parsed=sum(len(_slice(html, images=images).document()) for html in PAGES),
+    )
+
+    results = benchmark(lambda: [_extract(cls(_slice(html, images=images).document())) for html in PAGES])
+
+    assert len(results) == len(PAGES)
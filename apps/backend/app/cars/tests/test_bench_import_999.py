@@ -0,0 +1,47 @@
+"""
+Бенчмарк импорта (pytest-benchmark): sync_all_from_999_with_archive по
+синтетическому корпусу через replay, в транзакции с откатом — как
+manage.py bench_import_999. В JSON (--benchmark-json) кроме времени
+прогона — adverts/sec, p50/p95 на объявление и разбивка по стадиям
+(extra_info). Записанный корпус и стенд с задержкой — в самой команде.
+
+  pytest app/cars/tests/test_bench_import_999.py --benchmark-json bench.json
+  pytest ... --benchmark-compare    # с прошлым сохранённым прогоном
+"""
+import pytest
+
+from app.cars.management.commands.bench_import_999 import Command
+from app.cars.models import Car
+from app.integrations import partners999
+from app.integrations.replay import Corpus
+
+pytestmark = pytest.mark.django_db
+
+ADVERTS = 48
+PAGE_SIZE = 12
+
+
+@pytest.fixture
+def bench_corpus():
+    corpus = Corpus.synthetic(ADVERTS)
+    partners999.get_client().mount_replay(corpus)
+    return corpus
+
+
+@pytest.mark.parametrize("pipeline", [False, True], ids=["sequential", "pipeline"])
+def test_import_throughput(benchmark, bench_corpus, pipeline):
+    options = {"page_size": PAGE_SIZE, "max_items": None, "delta": False, "pipeline": pipeline, "keep": False}
+    benchmark.group = "import_999"
+
+    result = benchmark.pedantic(Command()._run_once, args=(options,), rounds=3, iterations=1)
+
+    assert result["adverts"] == ADVERTS
+    assert not Car.objects.exists()  # откат, как в команде
+    benchmark.extra_info.update(
+        adverts_per_sec=result["adverts_per_sec"],
+        p50_ms=result["per_advert"]["p50_ms"],
+        p95_ms=result["per_advert"]["p95_ms"],
+        stages={name: {k: st[k] for k in ("count", "total_s", "p50_ms", "p95_ms")} for name, st in result["stages"].items()},
+    )
+    for stage in ("listing", "prefetch", "html_parse", "normalize", "bulk_upsert"):
+        assert result["stages"][stage]["count"] > 0
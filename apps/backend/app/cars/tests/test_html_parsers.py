@@ -0,0 +1,97 @@
+"""
+Паритет бэкендов разбора (html_parsers) и нарезки (html_slice) с bs4
+на маленьком корпусе страниц: fixtures/corpus — реалистичные страницы
+(галерея и __NEXT_DATA__ вокруг блока характеристик) и краевые случаи.
+Большой корпус — manage.py bench_html_parsers --corpus DIR, скорость —
+test_bench_html_parsers.py.
+"""
+import logging
+import os
+
+import pytest
+
+from app.cars.management.commands.bench_html_parsers import _extract, _slice
+from app.cars.services import html_parsers
+from app.integrations.replay import Corpus
+
+FIXTURES = os.path.join(os.path.dirname(__file__), "fixtures", "corpus")
+PAGES = sorted(Corpus.load(FIXTURES).bodies["public_html"].items())
+FAST = [name for name in html_parsers.available_backends() if name != "bs4"]
+
+
+@pytest.fixture(params=PAGES, ids=[aid for aid, _ in PAGES])
+def page(request):
+    aid, html = request.param
+    return html, _extract(html_parsers.Bs4Page(html))
+
+
+def test_fixture_corpus_is_loaded():
+    assert len(PAGES) >= 10
+    assert sum(1 for aid, _ in PAGES if not aid.startswith("edge_")) >= 4
+
+
+@pytest.mark.parametrize("backend", FAST)
+def test_backend_matches_bs4(page, backend):
+    html, want = page
+    assert _extract(html_parsers.BACKENDS[backend](html)) == want
+
+
+@pytest.mark.parametrize("backend", html_parsers.available_backends())
+def test_slice_with_images_matches_full_page(page, backend):
+    html, want = page
+    assert _extract(html_parsers.BACKENDS[backend](_slice(html, images=True).document())) == want
+
+
+@pytest.mark.parametrize("backend", html_parsers.available_backends())
+def test_slice_without_images_keeps_meta_and_spec(page, backend):
+    html, want = page
+    got = _extract(html_parsers.BACKENDS[backend](_slice(html, images=False).document()))
+    assert got["meta"] == want["meta"]
+    assert got["spec_pairs"] == want["spec_pairs"]
+    assert want["images"][:len(got["images"])] == got["images"]
+
+
+# =========================
+# Fallback на bs4
+# =========================
+
+def _realistic_html() -> str:
+    return next(html for aid, html in PAGES if not aid.startswith("edge_"))
+
+
+@pytest.mark.parametrize("backend", FAST)
+def test_failing_method_falls_back_to_bs4(backend, monkeypatch, caplog):
+    html = _realistic_html()
+    want = _extract(html_parsers.Bs4Page(html))
+
+    def boom(self):
+        raise RuntimeError("parser bug")
+
+    monkeypatch.setattr(html_parsers.BACKENDS[backend], "spec_pairs", boom)
+    monkeypatch.setattr(html_parsers.BACKENDS[backend], "image_candidates", boom)
+    with caplog.at_level(logging.WARNING, logger=html_parsers.__name__):
+        page = html_parsers.parse_page(html, backend=backend)
+        got = _extract(page)
+
+    assert got == want
+    assert page.backend == backend  # мета — всё ещё быстрым бэкендом
+    assert [r.getMessage() for r in caplog.records] == [
+        f"html_parsers: {backend}.spec_pairs упал, разбираем bs4",
+        f"html_parsers: {backend}.image_candidates упал, разбираем bs4",
+    ]
+
+
+@pytest.mark.parametrize("backend", FAST)
+def test_failing_constructor_falls_back_to_bs4(backend, monkeypatch, caplog):
+    html = _realistic_html()
+
+    def boom(html):
+        raise RuntimeError("parser bug")
+
+    monkeypatch.setitem(html_parsers.BACKENDS, backend, boom)
+    with caplog.at_level(logging.WARNING, logger=html_parsers.__name__):
+        page = html_parsers.parse_page(html, backend=backend)
+
+    assert isinstance(page, html_parsers.Bs4Page)
+    assert _extract(page) == _extract(html_parsers.Bs4Page(html))
+    assert len(caplog.records) == 1
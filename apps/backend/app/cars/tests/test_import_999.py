@@ -0,0 +1,409 @@
+"""Импорт 999.md по синтетическому корпусу: дельта по листингу, resume, dead-letter."""
+import datetime
+import json
+
+import pytest
+from django.utils import timezone
+
+from app.cars.models import Car, FailedAdvert, SyncRun
+from app.cars.services import import_999
+from app.integrations.http_cache import configure_cache
+from app.integrations.replay import Corpus
+
+pytestmark = pytest.mark.django_db
+
+PAGE_SIZE = 4  # 12 объявлений корпуса -> 3 страницы листинга
+
+
+def _sync(**kwargs):
+    kwargs.setdefault("page_size", PAGE_SIZE)
+    kwargs.setdefault("pipeline", False)
+    return import_999.sync_all_from_999_with_archive(**kwargs)
+
+
+def _listing_entry(corpus, advert_id):
+    return next(e for e in corpus.listing_entries if str(e["id"]) == advert_id)
+
+
+# =========================
+# Дельта по листингу
+# =========================
+
+def test_first_sync_imports_everything(corpus):
+    stats = _sync(delta=True)
+
+    assert stats["imported"] == 12
+    assert stats["failed"] == 0
+    assert stats["active_seen"] == 12
+    assert stats["delta"]["new"] == 12
+    assert Car.objects.filter(source="999", active=True).count() == 12
+    assert not Car.objects.filter(listing_hash="").exists()
+    assert not Car.objects.filter(detail_synced_at__isnull=True).exists()
+
+
+def test_unchanged_listing_skips_full_import(corpus):
+    _sync(delta=True)
+    stats = _sync(delta=True)
+
+    assert stats["imported"] == 0
+    assert stats["delta"]["skipped"] == 12
+    assert stats["active_seen"] == 12
+    assert stats["http"]["endpoints"].get("advert", {}).get("calls", 0) == 0
+    # все остались активными: last_seen_at подвинули без полного импорта
+    assert stats["archived"] == 0
+    assert Car.objects.filter(source="999", active=True).count() == 12
+
+
+def test_price_only_change_is_written_from_listing(corpus):
+    _sync(delta=True)
+    advert_id = str(corpus.listing_entries[0]["id"])
+    _listing_entry(corpus, advert_id)["price"] = {"value": 123456, "unit": "eur"}
+
+    stats = _sync(delta=True)
+
+    assert stats["delta"]["price_only"] == 1
+    assert stats["imported"] == 0
+    assert Car.objects.get(source="999", external_id=advert_id).price_eur == 123456
+
+
+def test_changed_listing_entry_is_reimported(corpus):
+    _sync(delta=True)
+    advert_id = str(corpus.listing_entries[1]["id"])
+    _listing_entry(corpus, advert_id)["title"] = "Toyota RAV4 restyling"
+    old_hash = Car.objects.get(source="999", external_id=advert_id).listing_hash
+
+    stats = _sync(delta=True)
+
+    assert stats["delta"]["changed"] == 1
+    assert stats["imported"] == 1
+    car = Car.objects.get(source="999", external_id=advert_id)
+    assert car.listing_hash != old_hash
+    assert car.listing_hash == import_999.listing_fingerprint(_listing_entry(corpus, advert_id))
+
+
+def test_stale_detail_is_reimported(corpus):
+    _sync(delta=True)
+    advert_id = str(corpus.listing_entries[2]["id"])
+    old = timezone.now() - datetime.timedelta(hours=import_999.DETAIL_MAX_AGE_HOURS + 1)
+    Car.objects.filter(source="999", external_id=advert_id).update(detail_synced_at=old)
+
+    stats = _sync(delta=True)
+
+    assert stats["delta"]["stale"] == 1
+    assert stats["imported"] == 1
+
+
+def test_missing_advert_is_archived_after_full_listing(corpus):
+    _sync(delta=True)
+    gone = corpus.listing_entries.pop()
+
+    stats = _sync(delta=True)
+
+    assert stats["archived"] == 1
+    car = Car.objects.get(source="999", external_id=str(gone["id"]))
+    assert not car.active
+    assert car.status == Car.Status.ARCHIVED
+
+
+# =========================
+# Resume
+# =========================
+
+def test_resume_continues_interrupted_run(corpus, monkeypatch):
+    real_import_page = import_999._import_page
+    calls = []
+
+    def crash_on_second_page(*args, **kwargs):
+        calls.append(1)
+        if len(calls) == 2:
+            raise RuntimeError("worker killed")
+        return real_import_page(*args, **kwargs)
+
+    monkeypatch.setattr(import_999, "_import_page", crash_on_second_page)
+    with pytest.raises(RuntimeError):
+        _sync(delta=False)
+
+    run = SyncRun.objects.get()
+    assert run.status == SyncRun.Status.FAILED
+    assert run.page == 1
+    assert Car.objects.count() == PAGE_SIZE
+
+    monkeypatch.setattr(import_999, "_import_page", real_import_page)
+    stats = _sync(delta=False, resume=True)
+
+    run.refresh_from_db()
+    assert stats["run"]["id"] == run.pk
+    assert stats["run"]["resumed"] == 1
+    assert stats["run"]["listing_done"]
+    assert run.status == SyncRun.Status.COMPLETED
+    assert run.page == 3
+    # страницу 1 прошли ещё раз, но посчитана она один раз
+    assert stats["active_seen"] == 12
+    assert run.counters["processed"] == 12
+    assert Car.objects.filter(source="999", active=True).count() == 12
+    # водяной знак — от первого запуска: ничего из увиденного не архивируется
+    assert stats["archived"] == 0
+    assert not Car.objects.exclude(last_seen_at=run.started_at).exists()
+
+
+def _crash_on_second_page(monkeypatch, **kwargs):
+    real_import_page = import_999._import_page
+    calls = []
+
+    def crash_on_second_page(*args, **kw):
+        calls.append(1)
+        if len(calls) == 2:
+            raise RuntimeError("worker killed")
+        return real_import_page(*args, **kw)
+
+    monkeypatch.setattr(import_999, "_import_page", crash_on_second_page)
+    with pytest.raises(RuntimeError):
+        _sync(delta=False, **kwargs)
+    monkeypatch.setattr(import_999, "_import_page", real_import_page)
+
+
+def test_pipeline_resume_counts_replayed_page_once(corpus, monkeypatch):
+    _crash_on_second_page(monkeypatch)
+    run = SyncRun.objects.get()
+    assert run.page == 1
+
+    stats = _sync(delta=False, pipeline=True, resume=True)
+
+    run.refresh_from_db()
+    assert run.status == SyncRun.Status.COMPLETED
+    assert stats["active_seen"] == 12
+    assert run.counters["processed"] == 12
+
+
+def test_resume_keeps_max_items(corpus, monkeypatch):
+    _crash_on_second_page(monkeypatch, max_items=10)
+
+    stats = _sync(delta=False, max_items=10, resume=True)
+
+    assert stats["active_seen"] == 10
+    assert Car.objects.count() == 10
+
+
+def test_resume_ignores_completed_run(corpus):
+    first = _sync(delta=False)
+    second = _sync(delta=False, resume=True)
+
+    assert second["run"]["id"] != first["run"]["id"]
+    assert second["run"]["resumed"] == 0
+
+
+# =========================
+# Запись пачкой
+# =========================
+
+def test_bulk_upsert_refreshes_fuel_canonical(corpus):
+    advert_id = str(corpus.listing_entries[0]["id"])  # BMW 320d, "Дизель"
+    for name in ("features", "public_html"):
+        corpus.bodies[name][advert_id] = corpus.bodies[name][advert_id].replace("Дизель", "Diesel")
+    _sync(delta=False)
+    assert Car.objects.get(external_id=advert_id).fuel_type_canonical == "diesel"
+
+    # строка со старым каноном (до bulk-записи его не обновлял никто) и изменившимся содержимым
+    Car.objects.filter(external_id=advert_id).update(fuel_type_canonical="petrol", content_hash="")
+    _sync(delta=False)
+
+    assert Car.objects.get(external_id=advert_id).fuel_type_canonical == "diesel"
+
+
+def test_bad_fuel_canonical_does_not_fail_batch(corpus, monkeypatch):
+    bad_id = str(corpus.listing_entries[0]["id"])
+    real = Car._compute_fuel_canonical
+
+    def compute(self):
+        if self.external_id == bad_id:
+            raise ValueError("bad fuel")
+        return real(self)
+
+    monkeypatch.setattr(Car, "_compute_fuel_canonical", compute)
+    stats = _sync(delta=False)
+
+    assert stats["failed"] == 0
+    assert stats["imported"] == 12
+    assert Car.objects.get(external_id=bad_id).fuel_type_canonical == ""
+
+
+# =========================
+# Планировщик HTML
+# =========================
+
+FULL_SPEC = [
+    {"title": "Марка", "value": "Skoda"},
+    {"title": "Модель", "value": "Octavia"},
+    {"title": "Год выпуска", "value": "2018"},
+    {"title": "Количество мест", "value": "5"},
+    {"title": "Тип кузова", "value": "Универсал"},
+    {"title": "Пробег", "value": "120 000 км"},
+    {"title": "Объём двигателя", "value": "1.4 л"},
+    {"title": "Мощность", "value": "150 л.с."},
+    {"title": "Тип топлива", "value": "Бензин"},
+    {"title": "КПП", "value": "Автомат"},
+    {"title": "Привод", "value": "Передний"},
+    {"title": "Цвет", "value": "Серый"},
+    {"title": "Город", "value": "Кишинёв"},
+]
+
+
+def _complete_in_api(corpus, advert_id, price):
+    """Все характеристики и фотки — в API; цена в advert — price, на странице остаётся своя."""
+    corpus.bodies["features"][advert_id] = json.dumps(
+        {"features_groups": [{"features": FULL_SPEC}]}, ensure_ascii=False,
+    )
+    advert = json.loads(corpus.bodies["advert"][advert_id])
+    advert["images"] = [f"{advert_id}_0.jpg"]
+    advert["price"] = price
+    corpus.bodies["advert"][advert_id] = json.dumps(advert, ensure_ascii=False)
+
+
+def test_complete_api_skips_html_and_takes_price_from_advert(corpus):
+    advert_id = str(corpus.listing_entries[0]["id"])
+    _complete_in_api(corpus, advert_id, {"value": 4321, "unit": "usd"})
+
+    stats = _sync()
+
+    assert stats["fetch_plan"]["html_skipped"] == 1
+    assert stats["fetch_plan"]["field_sources"]["price"]["api"] == 1
+    car = Car.objects.get(source="999", external_id=advert_id)
+    assert car.price_eur == 4321
+    assert car.currency == "USD"
+
+
+@pytest.mark.parametrize("price", [None, {"value": 0, "unit": "eur"}, {"value": 4321, "unit": "lei"}])
+def test_missing_api_price_fetches_html_price(corpus, price):
+    advert_id = str(corpus.listing_entries[0]["id"])
+    _complete_in_api(corpus, advert_id, price)
+
+    stats = _sync()
+
+    assert stats["fetch_plan"]["html_skipped"] == 0
+    html_price = _listing_entry(corpus, advert_id)["price"]["value"]
+    car = Car.objects.get(source="999", external_id=advert_id)
+    assert car.price_eur == html_price
+    assert car.currency == "EUR"
+
+
+# =========================
+# Dead-letter
+# =========================
+
+def test_failed_advert_goes_to_dead_letter_and_retry_resolves_it(corpus):
+    advert_id = str(corpus.listing_entries[3]["id"])
+    good_body = corpus.bodies["advert"][advert_id]
+    corpus.bodies["advert"][advert_id] = "{not json"
+
+    stats = _sync(delta=False)
+
+    assert stats["failed"] == 1
+    assert stats["imported"] == 11
+    fa = FailedAdvert.objects.get(source="999", external_id=advert_id)
+    assert fa.status == FailedAdvert.Status.PENDING
+    assert fa.attempts == 1
+    assert fa.next_retry_at > timezone.now()
+
+    # ещё не время — повторять нечего
+    assert import_999.retry_failed_adverts_from_999()["due"] == 0
+
+    corpus.bodies["advert"][advert_id] = good_body
+    FailedAdvert.objects.filter(pk=fa.pk).update(next_retry_at=timezone.now() - datetime.timedelta(minutes=1))
+    retry = import_999.retry_failed_adverts_from_999()
+
+    assert retry["due"] == 1
+    assert retry["imported"] == 1
+    assert retry["failed"] == 0
+    fa.refresh_from_db()
+    assert fa.status == FailedAdvert.Status.RESOLVED
+    assert fa.resolved_at is not None
+    assert Car.objects.filter(source="999", external_id=advert_id, active=True).exists()
+
+
+def test_retry_does_not_republish_archived_car(corpus):
+    """Упало, потом ушло из листинга и архивировано — API ещё отдаёт объявление, но на витрину оно не вернётся."""
+    _sync(delta=False)
+    gone = corpus.listing_entries[-1]
+    advert_id = str(gone["id"])
+    good_body = corpus.bodies["advert"][advert_id]
+    corpus.bodies["advert"][advert_id] = "{not json"
+    _sync(delta=False)
+    assert FailedAdvert.objects.get(source="999", external_id=advert_id).status == FailedAdvert.Status.PENDING
+
+    corpus.listing_entries.remove(gone)
+    assert _sync(delta=False)["archived"] == 1
+
+    corpus.bodies["advert"][advert_id] = good_body
+    FailedAdvert.objects.filter(external_id=advert_id).update(next_retry_at=timezone.now() - datetime.timedelta(minutes=1))
+    retry = import_999.retry_failed_adverts_from_999()
+
+    assert retry["due"] == 1
+    assert retry["archived"] == 1
+    assert retry["imported"] == 0
+    assert FailedAdvert.objects.get(source="999", external_id=advert_id).status == FailedAdvert.Status.RESOLVED
+    car = Car.objects.get(source="999", external_id=advert_id)
+    assert not car.active
+    assert car.status == Car.Status.ARCHIVED
+
+
+def test_retry_failure_backs_off(corpus):
+    advert_id = str(corpus.listing_entries[0]["id"])
+    corpus.bodies["advert"][advert_id] = "{not json"
+    _sync(delta=False)
+    FailedAdvert.objects.update(next_retry_at=timezone.now() - datetime.timedelta(minutes=1))
+
+    before = timezone.now()
+    retry = import_999.retry_failed_adverts_from_999()
+
+    assert retry["failed"] == 1
+    fa = FailedAdvert.objects.get(source="999", external_id=advert_id)
+    assert fa.attempts == 2
+    assert fa.status == FailedAdvert.Status.PENDING
+    assert fa.next_retry_at >= before + import_999._retry_delay(2) - datetime.timedelta(seconds=5)
+
+
+def test_gone_advert_is_given_up(corpus):
+    advert_id = str(corpus.listing_entries[5]["id"])
+    del corpus.bodies["advert"][advert_id]  # replay отвечает 404
+
+    _sync(delta=False)
+
+    fa = FailedAdvert.objects.get(source="999", external_id=advert_id)
+    assert fa.status == FailedAdvert.Status.GIVEN_UP
+    assert fa.next_retry_at is None
+    # снятое объявление в следующий retry не попадает
+    assert import_999.retry_failed_adverts_from_999()["due"] == 0
+
+
+def test_corpus_round_trip(corpus, tmp_path):
+    """Корпус, сохранённый на диск, отдаёт те же ответы (N999_REPLAY_DIR)."""
+    corpus.save(str(tmp_path))
+    loaded = Corpus.load(str(tmp_path))
+
+    assert len(loaded) == len(corpus)
+    for name in ("advert", "features", "public_html"):
+        assert loaded.bodies[name] == corpus.bodies[name]
+    assert json.loads(loaded.body("advert", str(corpus.listing_entries[0]["id"])))["id"] == corpus.listing_entries[0]["id"]
+
+
+def test_changed_advert_bypasses_cached_body(corpus, monkeypatch):
+    """Тело без валидаторов в кеше свежее, но листинг сказал «поменялось» — берём новое."""
+    configure_cache("memory")
+    monkeypatch.setattr("app.integrations.replay.body_etag", lambda body: "")
+    _sync(delta=True)
+
+    advert_id = str(corpus.listing_entries[1]["id"])
+    advert = json.loads(corpus.bodies["advert"][advert_id])
+    old_desc, advert["body"] = advert["body"], "Toyota RAV4, после рестайлинга"
+    corpus.bodies["advert"][advert_id] = json.dumps(advert, ensure_ascii=False)
+    corpus.bodies["public_html"][advert_id] = corpus.bodies["public_html"][advert_id].replace(old_desc, advert["body"])
+    _listing_entry(corpus, advert_id)["title"] = "Toyota RAV4 restyling"
+
+    stats = _sync(delta=True)
+
+    assert stats["delta"]["changed"] == 1
+    assert stats["imported"] == 1
+    car = Car.objects.get(source="999", external_id=advert_id)
+    assert car.listing_hash == import_999.listing_fingerprint(_listing_entry(corpus, advert_id))
+    assert car.description == "Toyota RAV4, после рестайлинга"
+    assert stats["http"]["endpoints"]["advert"]["calls"] == 1
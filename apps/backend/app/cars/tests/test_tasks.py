@@ -0,0 +1,166 @@
+"""Задачи и команда импорта 999 под общим локом синка."""
+import datetime
+import io
+
+import pytest
+from django.core.management import CommandError, call_command
+from django.utils import timezone
+
+from app.cars import tasks
+from app.cars.models import Car, SyncRun
+from app.cars.services import import_999
+from app.integrations.sync_lock import (
+    RedisLockStore,
+    SyncLock,
+    SyncLockLost,
+    configure_sync_lock,
+    get_lock_store,
+)
+from app.integrations.tests.test_sync_lock import DownRedis
+
+pytestmark = pytest.mark.django_db
+
+
+@pytest.fixture
+def held_lock():
+    lock = SyncLock(tasks.SYNC_LOCK_NAME, store=get_lock_store())
+    assert lock.acquire("full", "other-task")
+    yield lock
+    lock.release()
+
+
+@pytest.fixture
+def redis_down(monkeypatch):
+    store = RedisLockStore(client=DownRedis())
+    monkeypatch.setattr("app.integrations.sync_lock._store_obj", store)
+    yield store
+    configure_sync_lock("memory")
+
+
+@pytest.mark.parametrize("task, args", [
+    (tasks.import_999_adverts_task, (["80000000"],)),
+    (tasks.retry_failed_adverts_999_task, ()),
+    (tasks.import_999_task, ()),
+    (tasks.sync_999_liveness_task, ()),
+])
+def test_tasks_skip_while_sync_runs(corpus, held_lock, task, args):
+    result = task.apply(args=args).get()
+
+    assert result["skipped"]
+    assert result["reason"] == "sync already running"
+    assert result["lock"]["holder"]["task_id"] == "other-task"
+    assert not Car.objects.exists()
+
+
+def test_tasks_refuse_to_start_without_lock_backend(corpus, redis_down):
+    result = tasks.import_999_task.apply().get()
+
+    assert result["skipped"]
+    assert result["reason"] == "sync lock unavailable"
+    assert not SyncRun.objects.exists()
+
+
+def test_adverts_task_imports_under_lock(corpus):
+    ids = [str(e["id"]) for e in corpus.listing_entries[:3]]
+    result = tasks.import_999_adverts_task.apply(args=(ids,)).get()
+
+    assert result["stats"]["imported"] == 3
+    assert result["lock"]["acquired"]
+    # лок снят
+    assert SyncLock(tasks.SYNC_LOCK_NAME, store=get_lock_store()).acquire("full")
+
+
+def test_command_refuses_while_sync_runs(corpus, held_lock):
+    with pytest.raises(CommandError, match="уже идёт"):
+        call_command("import_999", "--with-archive", "--page-size=4")
+    assert not Car.objects.exists()
+
+
+def test_command_refuses_without_lock_backend(corpus, redis_down):
+    with pytest.raises(CommandError, match="недоступен"):
+        call_command("import_999", "--with-archive", "--page-size=4")
+
+
+def test_command_no_lock(corpus, held_lock):
+    call_command("import_999", "--with-archive", "--page-size=4", "--no-lock", stdout=io.StringIO())
+    assert Car.objects.count() == 12
+
+
+def test_lost_lock_aborts_sync(corpus):
+    pages = []
+
+    def guard():
+        pages.append(1)
+        if len(pages) > 3:  # страница 1: начало + запись, страница 2: начало, затем запись
+            raise SyncLockLost("lease taken over")
+
+    with pytest.raises(SyncLockLost):
+        import_999.sync_all_from_999_with_archive(page_size=4, delta=False, pipeline=False, guard=guard)
+
+    run = SyncRun.objects.get()
+    assert run.status == SyncRun.Status.FAILED
+    assert "lease taken over" in run.error
+    # вторую страницу скачали, но не записали; архивации не было
+    assert Car.objects.count() == 4
+    assert run.page == 1
+
+
+def test_fanout_chunk_does_not_write_after_lock_is_lost(corpus):
+    run, chunks = import_999.plan_fanout_from_999(page_size=4, chunk_size=12, delta=False)
+    lock = SyncLock(tasks.SYNC_LOCK_NAME, ttl=tasks.FANOUT_TTL, store=get_lock_store())
+    assert lock.acquire("fanout", "fanout-task")
+    value = lock.value
+    lock.release()  # аренда истекла, лок взял кто-то другой
+    assert SyncLock(tasks.SYNC_LOCK_NAME, store=get_lock_store()).acquire("full", "other-task")
+
+    result = tasks.import_999_chunk_task.apply(
+        args=(run.pk, chunks[0]["ids"], chunks[0]["listing_hashes"]), kwargs={"lock_value": value},
+    ).get()
+
+    assert not result["ok"]
+    assert "SyncLockLost" in result["error"]
+    assert not Car.objects.exists()
+
+    with pytest.raises(SyncLockLost):
+        tasks.finish_999_fanout_task.apply(args=([result], run.pk), kwargs={"lock_value": value}).get()
+    run.refresh_from_db()
+    assert run.status == SyncRun.Status.FAILED
+
+
+def test_fanout_keepalive_extends_until_run_finishes(corpus, monkeypatch):
+    scheduled = []
+    monkeypatch.setattr(tasks.keep_999_fanout_lock_task, "apply_async", lambda *a, **kw: scheduled.append(kw))
+    run, chunks = import_999.plan_fanout_from_999(page_size=4, chunk_size=12, delta=False)
+    lock = SyncLock(tasks.SYNC_LOCK_NAME, ttl=tasks.FANOUT_TTL, store=get_lock_store())
+    assert lock.acquire("fanout", "fanout-task")
+
+    result = tasks.keep_999_fanout_lock_task.apply(args=(run.pk, lock.value)).get()
+    assert result["ok"]
+    assert result["lock"]["extends"] == 1
+    assert scheduled == [{"countdown": tasks.FANOUT_KEEPALIVE_S}]
+
+    tasks.finish_999_fanout_task.apply(args=([], run.pk), kwargs={"lock_value": lock.value}).get()
+    assert tasks.keep_999_fanout_lock_task.apply(args=(run.pk, lock.value)).get() == {"ok": True, "finished": True}
+    assert len(scheduled) == 1
+
+
+def test_fanout_keepalive_gives_up_when_callback_never_comes(corpus, monkeypatch):
+    """Воркер убили посреди пачки: колбэка нет — по возрасту прогона лок снимается."""
+    scheduled = []
+    monkeypatch.setattr(tasks.keep_999_fanout_lock_task, "apply_async", lambda *a, **kw: scheduled.append(kw))
+    run, chunks = import_999.plan_fanout_from_999(page_size=4, chunk_size=12, delta=False)
+    lock = SyncLock(tasks.SYNC_LOCK_NAME, ttl=tasks.FANOUT_TTL, store=get_lock_store())
+    assert lock.acquire("fanout", "fanout-task")
+    SyncRun.objects.filter(pk=run.pk).update(
+        started_at=timezone.now() - datetime.timedelta(seconds=tasks.FANOUT_MAX_AGE_S + 1),
+    )
+
+    result = tasks.keep_999_fanout_lock_task.apply(args=(run.pk, lock.value)).get()
+
+    assert result["abandoned"]
+    assert scheduled == []
+    run.refresh_from_db()
+    assert run.status == SyncRun.Status.ABANDONED
+    assert run.finished_at is not None
+    # лок свободен — следующий синк не пропускается
+    assert SyncLock(tasks.SYNC_LOCK_NAME, store=get_lock_store()).acquire("full", "next-task")
@@ -0,0 +1,163 @@
+"""
+Адаптивный лимит одновременных запросов к 999.md (AIMD).
+
+- пока ответы чистые — окно растёт аддитивно: +increase за «окно» успешных
+  ответов (примерно +1 за round-trip, как в TCP congestion avoidance)
+- на 429 / 5xx окно режется мультипликативно (window * decrease)
+- Retry-After из 429/503 дополнительно ставит паузу: новые запросы не
+  стартуют, пока она не истечёт
+
+Окно и история изменений попадают в статистику синка.
+"""
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from typing import Any, Deque, Dict, Iterator, List, Optional
+
+INITIAL = float(os.getenv("N999_CONCURRENCY_INITIAL", "2"))
+MINIMUM = float(os.getenv("N999_CONCURRENCY_MIN", "1"))
+MAXIMUM = float(os.getenv("N999_CONCURRENCY_MAX", os.getenv("N999_CONCURRENCY", "8")))
+INCREASE = float(os.getenv("N999_CONCURRENCY_INCREASE", "1"))
+DECREASE = float(os.getenv("N999_CONCURRENCY_DECREASE", "0.5"))
+
+# статусы, на которые режем окно; на этих двух ещё и уважаем Retry-After
+CONGESTION_STATUSES = (429, 502, 503, 504)
+RETRY_AFTER_STATUSES = (429, 503)
+
+HISTORY_SIZE = 200
+
+
+class AdaptiveConcurrency:
+    """
+    Семафор с плавающим размером окна. Использование:
+
+        with controller.slot() as feedback:
+            resp = session.get(...)
+            feedback(resp.status_code, retry_after=...)
+    """
+
+    def __init__(
+        self,
+        initial: float = INITIAL,
+        minimum: float = MINIMUM,
+        maximum: float = MAXIMUM,
+        increase: float = INCREASE,
+        decrease: float = DECREASE,
+    ):
+        self.minimum = max(1.0, minimum)
+        self.maximum = max(self.minimum, maximum)
+        self.increase = increase
+        self.decrease = decrease
+        self.window = min(self.maximum, max(self.minimum, initial))
+
+        self.in_flight = 0
+        self.paused_until = 0.0
+        self._last_decrease = 0.0
+        self._cond = threading.Condition()
+
+        self._started = time.monotonic()
+        self.history: Deque[Dict[str, Any]] = deque(maxlen=HISTORY_SIZE)
+        self.increases = 0
+        self.decreases = 0
+        self.wait_s = 0.0
+        self.peak_in_flight = 0
+
+    # ---------- слоты ----------
+
+    def acquire(self) -> float:
+        """Ждём свободный слот (и конец паузы Retry-After). Возвращаем, сколько ждали."""
+        t0 = time.monotonic()
+        with self._cond:
+            while True:
+                now = time.monotonic()
+                if now < self.paused_until:
+                    self._cond.wait(self.paused_until - now)
+                    continue
+                if self.in_flight < int(self.window):
+                    break
+                self._cond.wait(1.0)
+            self.in_flight += 1
+            self.peak_in_flight = max(self.peak_in_flight, self.in_flight)
+            waited = time.monotonic() - t0
+            self.wait_s += waited
+        return waited
+
+    def release(self) -> None:
+        with self._cond:
+            self.in_flight = max(0, self.in_flight - 1)
+            self._cond.notify_all()
+
+    @contextmanager
+    def slot(self) -> Iterator:
+        self.acquire()
+        try:
+            yield self.feedback
+        finally:
+            self.release()
+
+    # ---------- обратная связь ----------
+
+    def feedback(self, status: Optional[int], *, throttled: bool = False, retry_after: Optional[float] = None) -> None:
+        """
+        status — итоговый код ответа; throttled=True если по дороге (во
+        внутренних ретраях urllib3) уже были 429/5xx.
+        """
+        congested = throttled or (status in CONGESTION_STATUSES)
+        with self._cond:
+            now = time.monotonic()
+            if congested:
+                # одна «волна» 429 от сервера — одно сокращение окна
+                guard = max(1.0, retry_after or 0.0)
+                if now - self._last_decrease >= guard:
+                    self.window = max(self.minimum, self.window * self.decrease)
+                    self._last_decrease = now
+                    self.decreases += 1
+                    self._record("decrease", status, retry_after)
+                if retry_after and retry_after > 0:
+                    self.paused_until = max(self.paused_until, now + retry_after)
+                    self._record("pause", status, retry_after)
+            elif status is not None and status < 500:
+                before = int(self.window)
+                self.window = min(self.maximum, self.window + self.increase / max(1.0, self.window))
+                if int(self.window) != before:
+                    self.increases += 1
+                    self._record("increase", status, None)
+            self._cond.notify_all()
+
+    def _record(self, event: str, status: Optional[int], retry_after: Optional[float]) -> None:
+        self.history.append({
+            "t": round(time.monotonic() - self._started, 2),
+            "event": event,
+            "window": round(self.window, 2),
+            "status": status,
+            "retry_after": retry_after,
+        })
+
+    # ---------- статистика ----------
+
+    def stats(self) -> Dict[str, Any]:
+        with self._cond:
+            history: List[Dict[str, Any]] = list(self.history)
+            return {
+                "window": round(self.window, 2),
+                "min": self.minimum,
+                "max": self.maximum,
+                "in_flight": self.in_flight,
+                "peak_in_flight": self.peak_in_flight,
+                "increases": self.increases,
+                "decreases": self.decreases,
+                "slot_wait_s": round(self.wait_s, 3),
+                "history": history,
+            }
+
+    def reset_history(self) -> None:
+        """Окно сохраняем (выученное значение полезно следующему синку), счётчики — обнуляем."""
+        with self._cond:
+            self._started = time.monotonic()
+            self.history.clear()
+            self.increases = 0
+            self.decreases = 0
+            self.wait_s = 0.0
+            self.peak_in_flight = self.in_flight
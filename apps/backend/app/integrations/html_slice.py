@@ -0,0 +1,324 @@
+"""
+Ранняя нарезка публичной страницы 999.md.
+
+Из страницы объявления импорту нужны мета-теги (цена, og:*), блок
+характеристик (классы вида styles_group__row__AbCdE / group__key__ /
+group__value__) и — как fallback для фоток — ссылки на BoardImages.
+Всё остальное (скрипты Next.js, похожие объявления, футер) — это
+большая часть байтов и почти всё время разбора.
+
+HtmlSlicer читает ответ потоком и сканирует теги регулярками, без
+дерева: держит стек открытых тегов, тело <script>/<style> пропускает
+целиком (из скриптов только вынимает url картинок — и только если в
+тексте вообще есть BoardImages / 999.md). Блок характеристик — это
+предок первого тега с group__-классом (на ANCESTORS уровней выше) до
+его закрытия; если дальше в пределах N999_HTML_SLICE_TAIL символов
+встречается ещё такой тег — блок растягивается до него.
+
+Раньше конца страницы останавливаемся, только если фотки со страницы не
+нужны (images=False — API их уже отдал): галерея и __NEXT_DATA__ с
+BoardImages идут после блока характеристик. Тогда короткий остаток (до
+N999_HTML_SLICE_DRAIN байт) дочитываем вхолостую, чтобы соединение
+вернулось в пул, длинный — бросаем вместе с соединением. С images=True
+страница сканируется до конца — в разбор всё равно уходит только нарезка.
+
+document() — маленький HTML из того, что нужно: meta, img/a со ссылками
+на фотки и url из скриптов (в исходном порядке) плюс блок характеристик
+как есть. Его и разбирает html_parsers — разбор тот же, документ в разы
+меньше.
+
+N999_HTML_SLICE=0 — качать и разбирать страницу целиком (как раньше).
+При записи корпуса (N999_RECORD_DIR) страница тоже качается целиком.
+"""
+import codecs
+import os
+import re
+from typing import List, Optional, Tuple
+
+SLICE = os.getenv("N999_HTML_SLICE", "1").lower() not in ("0", "false", "no", "off")
+# сколько символов после закрытия блока характеристик ждём следующую его часть
+TAIL = int(os.getenv("N999_HTML_SLICE_TAIL", "16384"))
+# остаток не длиннее стольких байт дочитываем (keep-alive), длиннее — рвём соединение
+DRAIN = int(os.getenv("N999_HTML_SLICE_DRAIN", "65536"))
+CHUNK_SIZE = 16 * 1024
+# блок характеристик = предок первого group__-тега на столько уровней выше
+# (row -> список -> группа); pass 2 в html_parsers смотрит в родителя key
+ANCESTORS = 2
+
+IMAGE_URL_RE = re.compile(r'(https?://[^\s"\']*?(?:BoardImages|999\.md)[^\s"\']*\.(?:jpg|jpeg|png))', re.I)
+
+_TAG_RE = re.compile(r"""<(/?)([a-zA-Z][a-zA-Z0-9:-]*)((?:[^>"']|"[^"]*"|'[^']*')*)>""")
+# начало тега, обрезанное концом буфера (в т.ч. посреди значения в кавычках)
+_TAG_PREFIX_RE = re.compile(
+    r"""(?:</?(?:[a-zA-Z][a-zA-Z0-9:-]*(?:[^>"']|"[^"]*"|'[^']*')*(?:"[^"]*|'[^']*)?)?|<!-?)\Z"""
+)
+_MARKER_RE = re.compile(r"group__(?:row|key|value)__")
+_RAW_END = {
+    "script": re.compile(r"</script\s*>", re.I),
+    "style": re.compile(r"</style\s*>", re.I),
+}
+_VOID = frozenset((
+    "area", "base", "br", "col", "embed", "hr", "img", "input",
+    "link", "meta", "param", "source", "track", "wbr",
+))
+# недокачанный тег длиннее этого — уже не тег, а '<' в тексте
+_MAX_TAG = 8192
+
+
+def configure_html_slice(enabled: bool) -> bool:
+    """Включить/выключить нарезку в процессе (бенчмарк, отладка)."""
+    global SLICE
+    SLICE = bool(enabled)
+    return SLICE
+
+
+def has_image_needle(text: str) -> bool:
+    return "BoardImages" in text or "999.md" in text
+
+
+def script_image_urls(text: str) -> List[str]:
+    """url картинок из текста скрипта; регулярку гоняем, только если там вообще есть BoardImages / 999.md."""
+    if not text or not has_image_needle(text):
+        return []
+    return IMAGE_URL_RE.findall(text)
+
+
+def _remaining_bytes(resp) -> Optional[int]:
+    """Сколько байт тела ещё на проводе (Content-Length и tell() оба — до распаковки gzip)."""
+    try:
+        return int(resp.headers["Content-Length"]) - int(resp.raw.tell())
+    except (KeyError, TypeError, ValueError, AttributeError, OSError):
+        return None
+
+
+class HtmlSlicer:
+    """
+    slicer = HtmlSlicer(images=False)
+    for text in chunks:
+        if slicer.feed(text):
+            break          # всё нужное уже есть
+    slicer.close()
+    slicer.document()      # -> компактный HTML для html_parsers
+    """
+
+    def __init__(self, tail: int = TAIL, drain: int = DRAIN, images: bool = True):
+        self.tail = tail
+        self.drain = drain
+        # True -> фотки возьмём со страницы, после блока характеристик не останавливаемся
+        self.images = images
+        self.done = False
+        self._buf = ""
+        self._pos = 0
+        self._closed = False
+        self._stack: List[Tuple[str, int]] = []
+        self._raw: Optional[str] = None
+        self._raw_start = 0
+        self._head_end: Optional[int] = None
+        # (позиция, фрагмент) вне блока характеристик — meta, img/a, url из скриптов
+        self._pieces: List[Tuple[int, str]] = []
+        self._region_start: Optional[int] = None
+        self._region_end: Optional[int] = None
+        self._anchor: Optional[int] = None
+        self._document: Optional[str] = None
+        # замеры (consume_response)
+        self.bytes_read = 0
+        self.bytes_drained = 0
+        self.stopped_early = False
+        self.truncated = False
+
+    # ---------- поток ----------
+
+    def feed(self, text: str) -> bool:
+        """Дописать кусок страницы. True — дальше можно не читать."""
+        if self.done or not text:
+            return self.done
+        self._buf += text
+        self._scan(final=False)
+        return self.done
+
+    def close(self) -> None:
+        """Конец потока (или остановились сами): досканировать хвост и закрыть блок."""
+        if self._closed:
+            return
+        self._closed = True
+        if not self.done:
+            self._scan(final=True)
+        if self._region_start is not None and self._region_end is None:
+            self._region_end = len(self._buf)
+
+    def consume_response(self, resp) -> "HtmlSlicer":
+        """Прочитать requests.Response (stream=True) до момента, когда всё нужное собрано."""
+        decoder = codecs.getincrementaldecoder(resp.encoding or "utf-8")(errors="replace")
+        chunks = resp.iter_content(chunk_size=CHUNK_SIZE)
+        for chunk in chunks:
+            self.bytes_read += len(chunk)
+            if self.feed(decoder.decode(chunk)):
+                self.stopped_early = True
+                break
+        else:
+            self.feed(decoder.decode(b"", final=True))
+        self.close()
+        if self.stopped_early:
+            remaining = _remaining_bytes(resp)
+            if remaining is not None and remaining > self.drain:
+                # хвост заведомо длинный — дешевле новое соединение, чем докачка
+                self.truncated = True
+                return self
+            # короткий (или неизвестной длины) хвост дочитываем вхолостую — соединение вернётся в пул
+            for chunk in chunks:
+                self.bytes_drained += len(chunk)
+                if self.bytes_drained > self.drain:
+                    self.truncated = True
+                    break
+        return self
+
+    # ---------- результат ----------
+
+    @property
+    def region(self) -> str:
+        if self._region_start is None:
+            return ""
+        return self._buf[self._region_start:self._region_end]
+
+    @property
+    def chars_scanned(self) -> int:
+        return len(self._buf)
+
+    def document(self) -> str:
+        if self._document is None:
+            self.close()
+            self._document = self._build_document()
+        return self._document
+
+    def _build_document(self) -> str:
+        start, end = self._region_start, self._region_end
+        head: List[str] = []
+        body: List[Tuple[int, str]] = []
+        for pos, piece in self._pieces:
+            if start is not None and start <= pos < (end if end is not None else len(self._buf)):
+                continue  # и так лежит внутри блока
+            if self._head_end is None or pos < self._head_end:
+                head.append(piece)
+            else:
+                body.append((pos, piece))
+        if start is not None:
+            body.append((start, self.region))
+        body.sort(key=lambda item: item[0])
+        return (
+            "<html><head>" + "".join(head) + "</head><body>"
+            + "".join(piece for _, piece in body) + "</body></html>"
+        )
+
+    # ---------- сканер ----------
+
+    def _scan(self, final: bool) -> None:
+        buf = self._buf
+        while not self.done:
+            if self._raw is not None:
+                end = _RAW_END[self._raw].search(buf, self._pos)
+                if end is None:
+                    if not final:
+                        # в следующий раз ищем с конца (с запасом на разрезанный "</script")
+                        self._pos = max(self._pos, len(buf) - 16)
+                        self._check_tail(len(buf))
+                        break
+                    self._raw_text(buf[self._raw_start:])
+                    self._pos = len(buf)
+                    break
+                self._raw_text(buf[self._raw_start:end.start()])
+                self._raw = None
+                self._pos = end.end()
+                continue
+
+            i = buf.find("<", self._pos)
+            if i < 0:
+                self._pos = len(buf)
+                break
+            if buf.startswith("<!--", i):
+                j = buf.find("-->", i + 4)
+                if j < 0:
+                    if final:
+                        self._pos = len(buf)
+                    else:
+                        self._pos = i
+                    break
+                self._pos = j + 3
+                continue
+            m = _TAG_RE.match(buf, i)
+            if m is None:
+                if not final and len(buf) - i < _MAX_TAG and _TAG_PREFIX_RE.match(buf, i):
+                    self._pos = i  # тег недокачан — ждём следующий кусок
+                    break
+                self._pos = i + 1  # <!DOCTYPE, <?xml или просто '<' в тексте
+                continue
+            self._pos = m.end()
+            self._tag(m, i)
+            if self._region_end is not None:
+                self._check_tail(self._pos)
+
+    def _check_tail(self, pos: int) -> None:
+        """Фотки не нужны, блок закрыт и за TAIL символов новых group__-тегов нет — дальше не читаем."""
+        if not self.images and self._anchor is None and self._region_end is not None and pos - self._region_end >= self.tail:
+            self.done = True
+
+    def _tag(self, m, start: int) -> None:
+        closing, name, attrs = m.groups()
+        name = name.lower()
+        end = m.end()
+        if closing:
+            self._close(name, end)
+            if name == "head" and self._head_end is None:
+                self._head_end = start
+            return
+        if name == "body" and self._head_end is None:
+            self._head_end = start
+
+        if name == "meta":
+            if "property" in attrs:
+                self._pieces.append((start, m.group(0)))
+        elif name in ("img", "a"):
+            if has_image_needle(attrs):
+                self._pieces.append((start, m.group(0) + ("</a>" if name == "a" else "")))
+
+        self_closing = attrs.rstrip().endswith("/")
+        if name in _RAW_END and not self_closing:
+            self._raw = name
+            self._raw_start = end
+            return
+        if name in _VOID or self_closing:
+            return
+        self._stack.append((name, start))
+        if _MARKER_RE.search(attrs):
+            self._marker()
+
+    def _close(self, name: str, end: int) -> None:
+        stack = self._stack
+        # закрываем до ближайшего одноимённого (незакрытые li/p внутри закроются вместе с ним);
+        # лишний закрывающий без пары — игнорируем, как и парсеры
+        for k in range(len(stack) - 1, -1, -1):
+            if stack[k][0] == name:
+                del stack[k:]
+                break
+        else:
+            return
+        if self._anchor is not None and len(stack) <= self._anchor:
+            self._anchor = None
+            self._region_end = end
+
+    def _marker(self) -> None:
+        if self._anchor is not None:
+            return  # уже внутри открытого блока
+        idx = max(0, len(self._stack) - 1 - ANCESTORS)
+        anchor_start = self._stack[idx][1]
+        if self._region_start is None or anchor_start < self._region_start:
+            self._region_start = anchor_start
+        self._anchor = idx
+        self._region_end = None
+
+    def _raw_text(self, text: str) -> None:
+        if self._raw != "script":
+            return
+        urls = script_image_urls(text)
+        if urls:
+            # в документ — отдельным скриптом на месте исходного: порядок url как у полного разбора
+            self._pieces.append((self._raw_start, "<script>" + " ".join(f'"{u}"' for u in urls) + "</script>"))
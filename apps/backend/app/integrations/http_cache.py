@@ -0,0 +1,173 @@
+"""
+HTTP-кеш ответов partners API (/adverts/{id}, /adverts/{id}/features).
+
+- если сервер отдал ETag / Last-Modified — храним их вместе с телом и
+  в следующий синк шлём условный GET (If-None-Match / If-Modified-Since);
+  на 304 отдаём тело из кеша
+- если валидаторов нет — тело живёт N999_HTTP_CACHE_TTL секунд и в
+  пределах TTL запрос не делаем вовсе (кроме перезапроса объявления,
+  которое поменялось по листингу или идёт по --full: get_json(revalidate=True))
+- кладём только тело, которое разобралось как JSON
+
+Хранилище — тот же Redis, что у брокера (N999_HTTP_CACHE_BACKEND=redis),
+для локального запуска — memory, отключить — off. Redis не отвечает —
+на время переходим на память процесса (redis_conn.RedisFailover).
+"""
+import hashlib
+import json
+import os
+import threading
+import time
+import zlib
+from typing import Any, Dict, Optional
+
+from app.integrations.redis_conn import RedisFailover, get_redis
+
+BACKEND = os.getenv("N999_HTTP_CACHE_BACKEND", "redis").lower()
+KEY_PREFIX = os.getenv("N999_HTTP_CACHE_PREFIX", "n999:hc")
+# сколько живёт тело без валидаторов (и не перезапрашивается вовсе)
+TTL = int(os.getenv("N999_HTTP_CACHE_TTL", str(2 * 3600)))
+# сколько держим тело с валидаторами (дальше — обычный GET)
+KEEP = int(os.getenv("N999_HTTP_CACHE_KEEP", str(7 * 24 * 3600)))
+
+
+class CacheEntry:
+    def __init__(self, body: str, etag: str = "", last_modified: str = "", stored_at: float = 0.0):
+        self.body = body
+        self.etag = etag
+        self.last_modified = last_modified
+        self.stored_at = stored_at or time.time()
+
+    @property
+    def has_validators(self) -> bool:
+        return bool(self.etag or self.last_modified)
+
+    def is_fresh(self, ttl: int = TTL) -> bool:
+        return (time.time() - self.stored_at) < ttl
+
+    def conditional_headers(self) -> Dict[str, str]:
+        headers: Dict[str, str] = {}
+        if self.etag:
+            headers["If-None-Match"] = self.etag
+        if self.last_modified:
+            headers["If-Modified-Since"] = self.last_modified
+        return headers
+
+    def dumps(self) -> bytes:
+        raw = json.dumps({
+            "b": self.body,
+            "e": self.etag,
+            "lm": self.last_modified,
+            "t": self.stored_at,
+        }, ensure_ascii=False)
+        return zlib.compress(raw.encode("utf-8"))
+
+    @classmethod
+    def loads(cls, blob: bytes) -> "CacheEntry":
+        data = json.loads(zlib.decompress(blob).decode("utf-8"))
+        return cls(data["b"], data.get("e", ""), data.get("lm", ""), data.get("t", 0.0))
+
+
+class MemoryCacheStore:
+    name = "memory"
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._data: Dict[str, tuple] = {}
+
+    def get(self, key: str) -> Optional[bytes]:
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return None
+            blob, expires = item
+            if expires < time.time():
+                self._data.pop(key, None)
+                return None
+            return blob
+
+    def set(self, key: str, blob: bytes, ttl: int) -> None:
+        with self._lock:
+            self._data[key] = (blob, time.time() + ttl)
+
+
+class RedisCacheStore:
+    name = "redis"
+
+    def __init__(self, client=None):
+        self._client = client
+
+    def get(self, key: str) -> Optional[bytes]:
+        return (self._client or get_redis()).get(key)
+
+    def set(self, key: str, blob: bytes, ttl: int) -> None:
+        (self._client or get_redis()).set(key, blob, ex=ttl)
+
+
+class ResponseCache:
+    """Обёртка над хранилищем: ключи, сериализация, временный переход на memory при падении Redis."""
+
+    def __init__(self, store=None, prefix: str = KEY_PREFIX):
+        self.store = store
+        self.prefix = prefix
+        self.failover = RedisFailover(store, MemoryCacheStore, "http_cache") if store is not None else None
+
+    @property
+    def enabled(self) -> bool:
+        return self.store is not None
+
+    @property
+    def backend_name(self) -> str:
+        if self.failover is None:
+            return "off"
+        return self.failover.name
+
+    def key(self, url: str, params: Optional[Dict[str, Any]] = None) -> str:
+        qs = "&".join(f"{k}={params[k]}" for k in sorted(params or {}))
+        digest = hashlib.sha1(f"{url}?{qs}".encode("utf-8")).hexdigest()
+        return f"{self.prefix}:{digest}"
+
+    def get(self, key: str) -> Optional[CacheEntry]:
+        if self.store is None:
+            return None
+        blob = self.failover.call("get", key)
+        if not blob:
+            return None
+        try:
+            return CacheEntry.loads(blob)
+        except Exception:
+            return None
+
+    def put(self, key: str, entry: CacheEntry) -> None:
+        if self.store is None:
+            return
+        self.failover.call("set", key, entry.dumps(), KEEP if entry.has_validators else TTL)
+
+
+def build_cache(backend_name: str = BACKEND) -> ResponseCache:
+    if backend_name == "off":
+        return ResponseCache(store=None)
+    if backend_name == "memory":
+        return ResponseCache(store=MemoryCacheStore())
+    return ResponseCache(store=RedisCacheStore())
+
+
+_cache: Optional[ResponseCache] = None
+_cache_lock = threading.Lock()
+
+
+def get_cache() -> ResponseCache:
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = build_cache()
+    return _cache
+
+
+def configure_cache(backend_name: str) -> ResponseCache:
+    """Подменить процессный кеш (бенчмарк, отладка): redis | memory | off."""
+    global _cache
+    with _cache_lock:
+        _cache = build_cache(backend_name)
+    return _cache
@@ -1,21 +1,40 @@
 import base64
+import json
 import os
-from typing import Dict, Any, Optional
+import threading
+import time
+from collections import defaultdict, deque
+from typing import Callable, Dict, Any, Optional, Deque
 
 import requests
 from requests.adapters import HTTPAdapter
 from urllib3.util.retry import Retry
 
-API_BASE = "https://partners-api.999.md"
+from app.integrations.concurrency import AdaptiveConcurrency, CONGESTION_STATUSES, RETRY_AFTER_STATUSES
+from app.integrations import html_slice
+from app.integrations.http_cache import CacheEntry, get_cache
+from app.integrations.ratelimit import get_limiter
+from app.integrations.replay import REPLAY_DIR, Corpus, ReplayAdapter, get_recorder
+
+# обе базы можно увести на локальный стенд (app.integrations.standin_999)
+API_BASE = os.getenv("N999_API_BASE", "https://partners-api.999.md").rstrip("/")
+PUBLIC_BASE = os.getenv("N999_PUBLIC_BASE", "https://999.md").rstrip("/")
 
 # Настройки ретраев/бэк-оффа из .env
 RETRY_TOTAL = int(os.getenv("N999_RETRY_TOTAL", "5"))
 RETRY_BACKOFF = float(os.getenv("N999_RETRY_BACKOFF", "0.6"))  # секунды; backoff_factor
 RETRY_STATUSES = (429, 502, 503, 504)
 
+# Пул соединений (keep-alive) — сколько сокетов держим на один хост
+POOL_SIZE = int(os.getenv("N999_POOL_SIZE", "10"))
+REQUEST_TIMEOUT = float(os.getenv("N999_TIMEOUT", "30"))
+
+# сколько последних замеров латентности держим на эндпоинт (для p50/p95)
+LATENCY_SAMPLES = 5000
 
-def _session() -> requests.Session:
-    """Session с ретраями на 429/5xx и экспоненциальным бэк-оффом."""
+
+def _session(pool_size: int = POOL_SIZE) -> requests.Session:
+    """Session с ретраями на 429/5xx, экспоненциальным бэк-оффом и пулом keep-alive соединений."""
     s = requests.Session()
     retry = Retry(
         total=RETRY_TOTAL,
@@ -25,7 +44,11 @@ def _session() -> requests.Session:
         raise_on_status=False,
         respect_retry_after_header=True,
     )
-    adapter = HTTPAdapter(max_retries=retry)
+    adapter = HTTPAdapter(
+        max_retries=retry,
+        pool_connections=pool_size,
+        pool_maxsize=pool_size,
+    )
     s.mount("https://", adapter)
     s.mount("http://", adapter)
     return s
@@ -40,45 +63,391 @@ def _auth_header() -> Dict[str, str]:
     return {"Authorization": f"Basic {token}"}
 
 
+def _retry_after_seconds(resp: requests.Response) -> Optional[float]:
+    value = resp.headers.get("Retry-After")
+    if not value:
+        return None
+    try:
+        return Retry(0).parse_retry_after(value)
+    except Exception:
+        return None
+
+
+def _wire_bytes(resp: requests.Response) -> int:
+    """Сколько байт тела прочитано с сокета (urllib3 считает до распаковки gzip)."""
+    tell = getattr(resp.raw, "tell", None)
+    try:
+        return int(tell()) if tell is not None else len(resp.content or b"")
+    except (ValueError, OSError):
+        return 0
+
+
+def _percentile(sorted_vals, q: float) -> float:
+    if not sorted_vals:
+        return 0.0
+    idx = min(len(sorted_vals) - 1, int(round(q * (len(sorted_vals) - 1))))
+    return sorted_vals[idx]
+
+
+# =========================
+# Общий клиент на процесс
+# =========================
+
+class Partners999Client:
+    """
+    Один пул соединений на весь процесс:
+    - keep-alive: TCP/TLS рукопожатие делаем один раз на сокет, а не на каждый запрос
+    - Basic auth заголовок кодируем один раз
+    - считаем рукопожатия / переиспользованные соединения / латентность по эндпоинтам
+    - перед каждым запросом ждём свой слот в глобальном token-bucket лимитере
+      (см. app.integrations.ratelimit) и считаем, сколько ждали
+    - число одновременных запросов держит AIMD-контроллер
+      (см. app.integrations.concurrency): растёт на чистых ответах,
+      режется на 429/5xx, Retry-After ставит паузу
+    - get_json(..., cache=True) ходит через HTTP-кеш (app.integrations.http_cache):
+      условные GET по ETag/Last-Modified, без валидаторов — TTL
+    """
+
+    def __init__(self, pool_size: int = POOL_SIZE):
+        self.pool_size = pool_size
+        self.pid = os.getpid()
+        self.session = _session(pool_size)
+        if REPLAY_DIR:
+            # офлайн-режим: в сеть не ходим, отвечаем из записанного корпуса
+            self.mount_replay(Corpus.load(REPLAY_DIR))
+        self._auth: Optional[Dict[str, str]] = None
+        self._lock = threading.Lock()
+        self._latency: Dict[str, Deque[float]] = defaultdict(lambda: deque(maxlen=LATENCY_SAMPLES))
+        self._calls: Dict[str, int] = defaultdict(int)
+        self._total_s: Dict[str, float] = defaultdict(float)
+        self._errors: Dict[str, int] = defaultdict(int)
+        self._waits: Dict[str, Deque[float]] = defaultdict(lambda: deque(maxlen=LATENCY_SAMPLES))
+        self._wait_total_s: Dict[str, float] = defaultdict(float)
+        self._retries: Dict[str, int] = defaultdict(int)
+        self._throttled: Dict[str, int] = defaultdict(int)
+        # байты тела с провода (до распаковки gzip) — сколько реально скачали
+        self._bytes: Dict[str, int] = defaultdict(int)
+        # нарезка публичных страниц (html_slice): pages / stopped_early / truncated / chars_*
+        self._slice: Dict[str, int] = defaultdict(int)
+        # кеш: endpoint -> {"hit": n, "miss": n, "revalidated": n, "stored": n}
+        self._cache: Dict[str, Dict[str, int]] = defaultdict(lambda: defaultdict(int))
+        self.concurrency = AdaptiveConcurrency()
+        # базовая линия счётчиков пулов urllib3 на момент reset_stats()
+        self._base_connections = 0
+        self._base_requests = 0
+
+    def auth_header(self) -> Dict[str, str]:
+        if self._auth is None:
+            self._auth = _auth_header()
+        return self._auth
+
+    def get(
+        self,
+        endpoint: str,
+        url: str,
+        *,
+        params: Optional[Dict[str, Any]] = None,
+        auth: bool = True,
+        headers: Optional[Dict[str, str]] = None,
+        consume: Optional[Callable[[requests.Response], Any]] = None,
+    ) -> requests.Response:
+        """
+        GET через общий пул. endpoint — короткое имя для статистики
+        ("listing", "advert", "features", "public_html").
+
+        consume(resp) — читать тело потоком (stream=True) самому, внутри
+        слота конкурентности и замера времени; ответ после него закрывается.
+        Зовётся только для ответов < 400.
+        """
+        if auth:
+            headers = {**self.auth_header(), **(headers or {})}
+        waited = get_limiter().acquire(endpoint)
+        with self._lock:
+            self._waits[endpoint].append(waited)
+            self._wait_total_s[endpoint] += waited
+
+        with self.concurrency.slot() as feedback:
+            t0 = time.perf_counter()
+            try:
+                resp = self.session.get(
+                    url, headers=headers, params=params, timeout=REQUEST_TIMEOUT, stream=consume is not None,
+                )
+                if consume is not None:
+                    try:
+                        if resp.status_code < 400:
+                            consume(resp)
+                    finally:
+                        nbytes = _wire_bytes(resp)
+                        resp.close()
+                else:
+                    nbytes = _wire_bytes(resp)
+            except requests.RequestException:
+                feedback(None, throttled=True)
+                with self._lock:
+                    self._errors[endpoint] += 1
+                raise
+            dt = time.perf_counter() - t0
+
+            # urllib3 мог уже сам отретраить 429/5xx — смотрим его историю
+            history = getattr(getattr(resp.raw, "retries", None), "history", None) or ()
+            throttled = any(h.status in CONGESTION_STATUSES for h in history)
+            retry_after = _retry_after_seconds(resp) if resp.status_code in RETRY_AFTER_STATUSES else None
+            feedback(resp.status_code, throttled=throttled, retry_after=retry_after)
+
+        with self._lock:
+            self._calls[endpoint] += 1
+            self._total_s[endpoint] += dt
+            self._latency[endpoint].append(dt)
+            self._bytes[endpoint] += nbytes
+            self._retries[endpoint] += len(history)
+            self._throttled[endpoint] += sum(1 for h in history if h.status == 429) + (resp.status_code == 429)
+            if resp.status_code >= 400:
+                self._errors[endpoint] += 1
+        return resp
+
+    def get_json(
+        self,
+        endpoint: str,
+        url: str,
+        *,
+        params: Optional[Dict[str, Any]] = None,
+        cache: bool = False,
+        revalidate: bool = False,
+    ) -> Dict[str, Any]:
+        """
+        GET + raise_for_status + json. С cache=True:
+        - свежая запись без валидаторов -> отдаём без запроса (hit);
+          с revalidate=True — нет: объявление перезапрашиваем, потому что оно
+          поменялось (дельта по листингу, --full), а подтвердить тело нечем
+        - запись с ETag/Last-Modified -> условный GET, на 304 отдаём из кеша (revalidated)
+        - иначе обычный GET (miss), ответ 200 кладём в кеш — только если это валидный JSON
+        """
+        store = get_cache() if cache else None
+        if store is None or not store.enabled:
+            resp = self.get(endpoint, url, params=params)
+            resp.raise_for_status()
+            return resp.json()
+
+        key = store.key(url, params)
+        entry = store.get(key)
+        if entry is not None and not entry.has_validators and entry.is_fresh() and not revalidate:
+            self._count_cache(endpoint, "hit")
+            return json.loads(entry.body)
+
+        cond = entry.conditional_headers() if entry is not None else None
+        resp = self.get(endpoint, url, params=params, headers=cond)
+        if resp.status_code == 304 and entry is not None:
+            self._count_cache(endpoint, "revalidated")
+            entry.stored_at = time.time()
+            store.put(key, entry)
+            return json.loads(entry.body)
+
+        resp.raise_for_status()
+        self._count_cache(endpoint, "miss")
+        data = resp.json()  # битое тело падает здесь и в кеш не попадает
+        store.put(key, CacheEntry(
+            resp.text,
+            etag=resp.headers.get("ETag", ""),
+            last_modified=resp.headers.get("Last-Modified", ""),
+        ))
+        self._count_cache(endpoint, "stored")
+        return data
+
+    def count_slice(self, slicer: html_slice.HtmlSlicer) -> None:
+        with self._lock:
+            self._slice["pages"] += 1
+            self._slice["stopped_early"] += int(slicer.stopped_early)
+            self._slice["truncated"] += int(slicer.truncated)
+            self._slice["chars_scanned"] += slicer.chars_scanned
+            self._slice["chars_kept"] += len(slicer.document())
+
+    def _count_cache(self, endpoint: str, event: str) -> None:
+        with self._lock:
+            self._cache[endpoint][event] += 1
+
+    def _pool_counters(self) -> tuple:
+        """(новых соединений, всего запросов) по всем пулам urllib3 этой сессии."""
+        connections = 0
+        reqs = 0
+        for adapter in set(self.session.adapters.values()):
+            pools = getattr(getattr(adapter, "poolmanager", None), "pools", None)
+            if pools is None:
+                continue
+            for key in list(pools.keys()):
+                pool = pools.get(key)
+                if pool is None:
+                    continue
+                connections += getattr(pool, "num_connections", 0)
+                reqs += getattr(pool, "num_requests", 0)
+        return connections, reqs
+
+    def stats(self) -> Dict[str, Any]:
+        connections, reqs = self._pool_counters()
+        handshakes = max(0, connections - self._base_connections)
+        total_reqs = max(0, reqs - self._base_requests)
+
+        endpoints: Dict[str, Any] = {}
+        with self._lock:
+            cache = {name: dict(events) for name, events in self._cache.items()}
+            html_slice_stats = dict(self._slice)
+            for name in sorted(set(self._calls) | set(self._errors) | set(self._waits)):
+                samples = sorted(self._latency[name])
+                waits = sorted(self._waits[name])
+                calls = self._calls[name]
+                endpoints[name] = {
+                    "calls": calls,
+                    "errors": self._errors[name],
+                    "retries": self._retries[name],
+                    "status_429": self._throttled[name],
+                    "total_s": round(self._total_s[name], 3),
+                    "avg_ms": round(self._total_s[name] / calls * 1000, 1) if calls else 0.0,
+                    "p50_ms": round(_percentile(samples, 0.50) * 1000, 1),
+                    "p95_ms": round(_percentile(samples, 0.95) * 1000, 1),
+                    "max_ms": round((samples[-1] if samples else 0.0) * 1000, 1),
+                    "bytes": self._bytes[name],
+                    "avg_kib": round(self._bytes[name] / calls / 1024, 1) if calls else 0.0,
+                    # ожидание слота в rate limiter'е (до отправки запроса)
+                    "ratelimit_wait_s": round(self._wait_total_s[name], 3),
+                    "ratelimit_waited": sum(1 for w in waits if w > 0),
+                    "ratelimit_wait_p95_ms": round(_percentile(waits, 0.95) * 1000, 1),
+                    "ratelimit_wait_max_ms": round((waits[-1] if waits else 0.0) * 1000, 1),
+                }
+
+        return {
+            "pool_size": self.pool_size,
+            "ratelimit_backend": get_limiter().backend_name,
+            "handshakes": handshakes,
+            "requests": total_reqs,
+            "reused_connections": max(0, total_reqs - handshakes),
+            "endpoints": endpoints,
+            "cache_backend": get_cache().backend_name,
+            "cache": cache,
+            "html_slice": html_slice_stats,
+        }
+
+    def mount_replay(self, corpus: Corpus) -> None:
+        """Отвечать из корпуса вместо сети (N999_REPLAY_DIR, бенчмарк)."""
+        adapter = ReplayAdapter(corpus)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+
+    def reset_stats(self) -> None:
+        self._base_connections, self._base_requests = self._pool_counters()
+        with self._lock:
+            self._latency.clear()
+            self._calls.clear()
+            self._total_s.clear()
+            self._errors.clear()
+            self._waits.clear()
+            self._wait_total_s.clear()
+            self._retries.clear()
+            self._throttled.clear()
+            self._bytes.clear()
+            self._slice.clear()
+            self._cache.clear()
+        self.concurrency.reset_history()
+
+
+_client: Optional[Partners999Client] = None
+_client_lock = threading.Lock()
+
+
+def get_client() -> Partners999Client:
+    """
+    Процесс-глобальный клиент. После fork (prefork-воркеры Celery)
+    пересоздаём, чтобы не делить сокеты с родителем.
+    """
+    global _client
+    client = _client
+    if client is not None and client.pid == os.getpid():
+        return client
+    with _client_lock:
+        if _client is None or _client.pid != os.getpid():
+            _client = Partners999Client()
+        return _client
+
+
+def client_stats() -> Dict[str, Any]:
+    return get_client().stats()
+
+
+def reset_client_stats() -> None:
+    get_client().reset_stats()
+
+
+def concurrency_stats() -> Dict[str, Any]:
+    """Текущее окно AIMD-контроллера и история его изменений."""
+    return get_client().concurrency.stats()
+
+
+def _record(endpoint: str, data: Any, **kwargs) -> None:
+    """N999_RECORD_DIR: дописываем ответ в корпус для офлайн-бенчмарков."""
+    recorder = get_recorder()
+    if recorder is None:
+        return
+    body = data if isinstance(data, str) else json.dumps(data, ensure_ascii=False)
+    recorder.record(endpoint, body, **kwargs)
+
+
 def get_adverts(page: int = 1, page_size: int = 50, states: Optional[str] = None, lang: Optional[str] = None) -> Dict[str, Any]:
     params = {"page": page, "page_size": page_size}
     if states:
         params["states"] = states  # e.g. 'public,hidden'
     if lang:
         params["lang"] = lang
-    resp = _session().get(f"{API_BASE}/adverts", headers=_auth_header(), params=params, timeout=30)
-    resp.raise_for_status()
-    return resp.json()
+    data = get_client().get_json("listing", f"{API_BASE}/adverts", params=params)
+    _record("listing", data, page=page, page_size=page_size)
+    return data
 
 
-def get_advert(advert_id: str, lang: Optional[str] = None) -> Dict[str, Any]:
+def get_advert(advert_id: str, lang: Optional[str] = None, revalidate: bool = False) -> Dict[str, Any]:
     params = {}
     if lang:
         params["lang"] = lang
-    resp = _session().get(f"{API_BASE}/adverts/{advert_id}", headers=_auth_header(), params=params, timeout=30)
-    resp.raise_for_status()
-    return resp.json()
+    data = get_client().get_json(
+        "advert", f"{API_BASE}/adverts/{advert_id}", params=params, cache=True, revalidate=revalidate,
+    )
+    _record("advert", data, advert_id=advert_id)
+    return data
 
 
-def get_advert_features(advert_id: str, lang: Optional[str] = None) -> Dict[str, Any]:
+def get_advert_features(advert_id: str, lang: Optional[str] = None, revalidate: bool = False) -> Dict[str, Any]:
     params = {}
     if lang:
         params["lang"] = lang
-    resp = _session().get(f"{API_BASE}/adverts/{advert_id}/features", headers=_auth_header(), params=params, timeout=30)
-    resp.raise_for_status()
-    return resp.json()
+    data = get_client().get_json(
+        "features", f"{API_BASE}/adverts/{advert_id}/features", params=params, cache=True, revalidate=revalidate,
+    )
+    _record("features", data, advert_id=advert_id)
+    return data
 
-import requests
 
-def get_public_ad_html(advert_id: str, lang: str = "ro") -> str:
+def get_public_ad_html(advert_id: str, lang: str = "ro", images: bool = True) -> str:
     """
     Получает HTML публичной страницы объявления (fallback, если API не дал images).
     Пример URL: https://999.md/ro/88470725
+
+    По умолчанию (N999_HTML_SLICE) страница читается потоком только до блока
+    характеристик и возвращается её нарезка — meta, ссылки на фотки и сам блок
+    (см. app.integrations.html_slice); для html_parsers это обычный HTML.
+    images=False — фотки уже есть в API: страницу можно бросить сразу после
+    блока характеристик. Иначе дочитываем до конца — галерея и скрипты с
+    BoardImages идут после блока.
     """
     lang = (lang or "ro").lower()
     # id может открываться и по /ro/{id} и по /ro/view/{id}; упрощённый вариант:
-    url = f"https://999.md/{lang}/{advert_id}"
-    resp = requests.get(url, timeout=30)
-    resp.raise_for_status()
-    return resp.text
+    url = f"{PUBLIC_BASE}/{lang}/{advert_id}"
+    client = get_client()
+    if not html_slice.SLICE or get_recorder() is not None:
+        # целиком: нарезка выключена или пишем корпус (там нужна вся страница)
+        resp = client.get("public_html", url, auth=False)
+        resp.raise_for_status()
+        _record("public_html", resp.text, advert_id=advert_id)
+        return resp.text
 
+    # потоком: читаем, пока не соберём meta + блок характеристик, разбирать отдаём нарезку
+    slicer = html_slice.HtmlSlicer(images=images)
+    resp = client.get("public_html", url, auth=False, consume=slicer.consume_response)
+    resp.raise_for_status()
+    client.count_slice(slicer)
+    return slicer.document()
@@ -0,0 +1,176 @@
+"""
+Asyncio-вариант клиента partners999.
+
+Сетевой стек тот же, что и в синхронном модуле (общий пул keep-alive
+соединений из partners999.get_client()), блокирующие вызовы уходят в
+отдельный пул потоков из N999_CONCURRENCY воркеров — это и есть потолок
+HTTP-запросов в полёте. gather() дополнительно ограничивает семафором,
+сколько объявлений обрабатывается одновременно.
+
+Совет: N999_POOL_SIZE держать >= N999_CONCURRENCY, иначе лишние
+соединения будут открываться и тут же закрываться.
+"""
+import asyncio
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Awaitable, Callable, Dict, Iterable, List, Optional, TypeVar
+
+from app.integrations import partners999
+
+CONCURRENCY = int(os.getenv("N999_CONCURRENCY", "8"))
+
+T = TypeVar("T")
+R = TypeVar("R")
+
+_executor: Optional[ThreadPoolExecutor] = None
+_executor_lock = threading.Lock()
+
+
+def _get_executor() -> ThreadPoolExecutor:
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(
+                    max_workers=max(1, CONCURRENCY),
+                    thread_name_prefix="n999",
+                )
+    return _executor
+
+
+async def _run(fn: Callable[..., R], *args, **kwargs) -> R:
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_get_executor(), lambda: fn(*args, **kwargs))
+
+
+# =========================
+# Корутины API
+# =========================
+
+async def get_adverts(page: int = 1, page_size: int = 50, states: Optional[str] = None, lang: Optional[str] = None) -> Dict[str, Any]:
+    return await _run(partners999.get_adverts, page=page, page_size=page_size, states=states, lang=lang)
+
+
+async def get_advert(advert_id: str, lang: Optional[str] = None, revalidate: bool = False) -> Dict[str, Any]:
+    return await _run(partners999.get_advert, advert_id, lang=lang, revalidate=revalidate)
+
+
+async def get_advert_features(advert_id: str, lang: Optional[str] = None, revalidate: bool = False) -> Dict[str, Any]:
+    return await _run(partners999.get_advert_features, advert_id, lang=lang, revalidate=revalidate)
+
+
+async def get_public_ad_html(advert_id: str, lang: str = "ro", images: bool = True) -> str:
+    return await _run(partners999.get_public_ad_html, advert_id, lang=lang, images=images)
+
+
+# =========================
+# gather с ограничением параллелизма
+# =========================
+
+async def gather(
+    items: Iterable[T],
+    fetch: Callable[[T], Awaitable[R]],
+    *,
+    concurrency: Optional[int] = None,
+    return_exceptions: bool = True,
+) -> List[Any]:
+    """
+    Как asyncio.gather, но одновременно выполняется не больше concurrency
+    корутин fetch(item). Порядок результатов совпадает с порядком items.
+    При return_exceptions=True исключение кладётся на место результата.
+    """
+    sem = asyncio.Semaphore(max(1, concurrency or CONCURRENCY))
+
+    async def one(item: T):
+        async with sem:
+            return await fetch(item)
+
+    return await asyncio.gather(*(one(it) for it in items), return_exceptions=return_exceptions)
+
+
+async def fetch_advert_bundle(
+    advert_id: str,
+    lang: Optional[str] = None,
+    *,
+    with_html: bool = True,
+    revalidate: bool = False,
+) -> Dict[str, Any]:
+    """
+    advert + features (+ публичный HTML) одного объявления параллельно.
+    Упавшие части в bundle не попадают — вызывающий код сам решит,
+    перезапрашивать ли их синхронно. revalidate — см. Partners999Client.get_json.
+    """
+    jobs = [
+        get_advert(advert_id, lang=lang, revalidate=revalidate),
+        get_advert_features(advert_id, lang=lang, revalidate=revalidate),
+    ]
+    if with_html:
+        jobs.append(get_public_ad_html(advert_id, lang="ru"))
+    results = await asyncio.gather(*jobs, return_exceptions=True)
+
+    bundle: Dict[str, Any] = {"advert_id": advert_id, "errors": {}}
+    for key, res in zip(("advert", "features", "html"), results):
+        if isinstance(res, BaseException):
+            bundle["errors"][key] = res
+        else:
+            bundle[key] = res
+    return bundle
+
+
+def fetch_advert_bundles(
+    advert_ids: Iterable[str],
+    lang: Optional[str] = None,
+    *,
+    concurrency: Optional[int] = None,
+    with_html: bool = True,
+    revalidate: bool = False,
+) -> Dict[str, Dict[str, Any]]:
+    """
+    Синхронная точка входа для импорта: тянем пачку объявлений разом,
+    не больше concurrency объявлений в полёте. Возвращает {advert_id: bundle}.
+    """
+    ids = [str(a) for a in advert_ids]
+    if not ids:
+        return {}
+
+    async def run():
+        return await gather(
+            ids,
+            lambda a: fetch_advert_bundle(a, lang=lang, with_html=with_html, revalidate=revalidate),
+            concurrency=concurrency,
+        )
+
+    out: Dict[str, Dict[str, Any]] = {}
+    for advert_id, res in zip(ids, asyncio.run(run())):
+        if isinstance(res, BaseException):
+            out[advert_id] = {"advert_id": advert_id, "errors": {"bundle": res}}
+        else:
+            out[advert_id] = res
+    return out
+
+
+def fetch_public_htmls(
+    advert_ids: Iterable[str],
+    *,
+    concurrency: Optional[int] = None,
+    lang: str = "ru",
+    without_images: Iterable[str] = (),
+) -> Dict[str, Any]:
+    """
+    Пачкой качаем публичные страницы. {advert_id: html | исключение}.
+    without_images — id, чьи фотки уже есть в API: их страницы можно не дочитывать.
+    """
+    ids = [str(a) for a in advert_ids]
+    if not ids:
+        return {}
+    skip_images = {str(a) for a in without_images}
+
+    async def run():
+        return await gather(
+            ids,
+            lambda a: get_public_ad_html(a, lang=lang, images=a not in skip_images),
+            concurrency=concurrency,
+        )
+
+    return dict(zip(ids, asyncio.run(run())))
@@ -0,0 +1,166 @@
+"""
+Глобальный token-bucket лимитер запросов к 999.md.
+
+Бакет на каждый класс эндпоинтов (listing / advert / features / public_html)
+живёт в Redis, поэтому квота общая для всех воркеров Celery. Вместо
+фиксированных sleep между объявлениями ждём ровно столько, сколько нужно,
+чтобы не превысить rate — если до квоты далеко, не ждём вовсе.
+
+Бакет работает «с резервированием»: каждый вызов сразу забирает токен
+(баланс может уйти в минус) и получает время, через которое его слот
+наступит. Так ожидающие выстраиваются в очередь за один round-trip.
+
+Бэкенд выбирается через N999_RATELIMIT_BACKEND:
+  redis  — по умолчанию, общий для всех процессов
+  memory — in-memory бакет на процесс (локальный запуск, тесты)
+  off    — без лимитов
+Если Redis не отвечает, лимитер N999_REDIS_RETRY_S секунд считает квоту
+в памяти процесса и снова пробует Redis (redis_conn.RedisFailover).
+"""
+import os
+import threading
+import time
+from typing import Dict, Optional, Tuple
+
+from app.integrations.redis_conn import RedisFailover, get_redis
+
+BACKEND = os.getenv("N999_RATELIMIT_BACKEND", "redis").lower()
+KEY_PREFIX = os.getenv("N999_RATELIMIT_PREFIX", "n999:rl")
+
+# (запросов в секунду, размер бакета)
+DEFAULT_RATES: Dict[str, Tuple[float, float]] = {
+    "listing": (1.0, 2.0),
+    "advert": (5.0, 10.0),
+    "features": (5.0, 10.0),
+    "public_html": (3.0, 6.0),
+}
+
+
+def _rates_from_env() -> Dict[str, Tuple[float, float]]:
+    """N999_RATE_<CLASS> / N999_BURST_<CLASS>, например N999_RATE_FEATURES=3."""
+    rates: Dict[str, Tuple[float, float]] = {}
+    for name, (rate, burst) in DEFAULT_RATES.items():
+        env = name.upper()
+        rate = float(os.getenv(f"N999_RATE_{env}", rate))
+        burst = float(os.getenv(f"N999_BURST_{env}", burst))
+        rates[name] = (rate, max(1.0, burst))
+    return rates
+
+
+# KEYS[1] — ключ бакета; ARGV: rate, burst
+# Возвращает сколько секунд ждать до своего слота (строкой — Lua-числа
+# при возврате в Redis обрезаются до целых).
+_TAKE_LUA = """
+local rate = tonumber(ARGV[1])
+local burst = tonumber(ARGV[2])
+local t = redis.call('TIME')
+local now = tonumber(t[1]) + tonumber(t[2]) / 1000000
+local state = redis.call('HMGET', KEYS[1], 'tokens', 'ts')
+local tokens = tonumber(state[1]) or burst
+local ts = tonumber(state[2]) or now
+tokens = math.min(burst, tokens + math.max(0, now - ts) * rate) - 1
+local wait = 0
+if tokens < 0 then
+  wait = -tokens / rate
+end
+redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'ts', tostring(now))
+redis.call('PEXPIRE', KEYS[1], math.ceil((burst / rate + wait) * 1000) + 1000)
+return tostring(wait)
+"""
+
+
+class MemoryTokenBucket:
+    """In-memory бакеты (та же логика, что в Lua-скрипте) — на один процесс."""
+
+    name = "memory"
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._state: Dict[str, Tuple[float, float]] = {}
+
+    def take(self, key: str, rate: float, burst: float) -> float:
+        now = time.monotonic()
+        with self._lock:
+            tokens, ts = self._state.get(key, (burst, now))
+            tokens = min(burst, tokens + max(0.0, now - ts) * rate) - 1
+            self._state[key] = (tokens, now)
+        return -tokens / rate if tokens < 0 else 0.0
+
+
+class RedisTokenBucket:
+    """Бакеты в Redis: атомарный Lua-скрипт, время берём у самого Redis."""
+
+    name = "redis"
+
+    def __init__(self, client=None):
+        self._client = client
+        self._script = None
+
+    def take(self, key: str, rate: float, burst: float) -> float:
+        if self._script is None:
+            self._script = (self._client or get_redis()).register_script(_TAKE_LUA)
+        return float(self._script(keys=[key], args=[rate, burst]))
+
+
+class TokenBucketLimiter:
+    """
+    acquire(endpoint) блокирует до своего слота и возвращает, сколько
+    секунд пришлось ждать. Если Redis недоступен — на время (RedisFailover,
+    N999_REDIS_RETRY_S) переходим на in-memory бакет, чтобы импорт не падал
+    из-за лимитера, и снова пробуем Redis: квота на процесс — не общая.
+    """
+
+    def __init__(self, backend=None, rates: Optional[Dict[str, Tuple[float, float]]] = None, prefix: str = KEY_PREFIX):
+        self.backend = backend
+        self.rates = rates if rates is not None else _rates_from_env()
+        self.prefix = prefix
+        self.failover = RedisFailover(backend, MemoryTokenBucket, "ratelimit") if backend is not None else None
+
+    @property
+    def backend_name(self) -> str:
+        if self.failover is None:
+            return "off"
+        return self.failover.name
+
+    def acquire(self, endpoint: str) -> float:
+        if self.backend is None or endpoint not in self.rates:
+            return 0.0
+        rate, burst = self.rates[endpoint]
+        if rate <= 0:
+            return 0.0
+
+        key = f"{self.prefix}:{endpoint}"
+        wait = self.failover.call("take", key, rate, burst)
+
+        if wait > 0:
+            time.sleep(wait)
+        return wait
+
+
+def build_limiter(backend_name: str = BACKEND) -> TokenBucketLimiter:
+    if backend_name == "off":
+        return TokenBucketLimiter(backend=None)
+    if backend_name == "memory":
+        return TokenBucketLimiter(backend=MemoryTokenBucket())
+    return TokenBucketLimiter(backend=RedisTokenBucket())
+
+
+_limiter: Optional[TokenBucketLimiter] = None
+_limiter_lock = threading.Lock()
+
+
+def get_limiter() -> TokenBucketLimiter:
+    global _limiter
+    if _limiter is None:
+        with _limiter_lock:
+            if _limiter is None:
+                _limiter = build_limiter()
+    return _limiter
+
+
+def configure_limiter(backend_name: str) -> TokenBucketLimiter:
+    """Подменить процессный лимитер (бенчмарк, отладка): redis | memory | off."""
+    global _limiter
+    with _limiter_lock:
+        _limiter = build_limiter(backend_name)
+    return _limiter
@@ -0,0 +1,112 @@
+"""
+Общее подключение к Redis (тот же инстанс, что брокер Celery) и
+RedisFailover — как вести себя, когда Redis не отвечает.
+"""
+import logging
+import os
+import threading
+import time
+from typing import Any, Callable, Optional
+
+import redis
+from redis.exceptions import RedisError
+
+REDIS_URL = os.getenv("REDIS_URL", "redis://redis:6379/0")
+# окно работы без Redis после сбоя; каждый следующий сбой подряд удваивает его до MAX
+RETRY_S = float(os.getenv("N999_REDIS_RETRY_S", "10"))
+RETRY_MAX_S = float(os.getenv("N999_REDIS_RETRY_MAX_S", "300"))
+
+logger = logging.getLogger(__name__)
+
+_redis: Optional[redis.Redis] = None
+_redis_pid: Optional[int] = None
+_lock = threading.Lock()
+
+
+def get_redis() -> redis.Redis:
+    """Клиент на процесс (после fork пересоздаём — пул соединений у redis-py свой)."""
+    global _redis, _redis_pid
+    if _redis is not None and _redis_pid == os.getpid():
+        return _redis
+    with _lock:
+        if _redis is None or _redis_pid != os.getpid():
+            _redis = redis.Redis.from_url(REDIS_URL, socket_timeout=5, socket_connect_timeout=5)
+            _redis_pid = os.getpid()
+        return _redis
+
+
+class RedisFailover:
+    """
+    Вызовы к хранилищу в Redis с поведением при сбое, общим для лимитера,
+    HTTP-кеша и лока синка:
+
+    - fallback_factory задана (лимитер, кеш) — временный переход: после
+      RedisError вызовы идут в локальное хранилище (fallback_factory()) на
+      RETRY_S секунд, потом снова пробуем Redis; упал опять — окно вдвое
+      длиннее (до RETRY_MAX_S), ответил — возвращаемся на Redis
+    - fallback_factory=None (лок) — «на закрытие»: RedisError пробрасываем,
+      решает вызывающий
+
+    Переходы пишем в лог (logger app.integrations.redis_conn).
+    """
+
+    def __init__(
+        self,
+        primary: Any,
+        fallback_factory: Optional[Callable[[], Any]],
+        what: str,
+        retry_s: float = RETRY_S,
+        retry_max_s: float = RETRY_MAX_S,
+    ):
+        self.primary = primary
+        self.fallback_factory = fallback_factory
+        self.what = what
+        self.retry_s = retry_s
+        self.retry_max_s = retry_max_s
+        self.fallback: Optional[Any] = None
+        self.failures = 0
+        self._retry_at = 0.0
+        self._lock = threading.Lock()
+
+    @property
+    def name(self) -> str:
+        if self.fallback is not None:
+            return f"{self.primary.name}->{self.fallback.name}"
+        return self.primary.name
+
+    def call(self, method: str, *args):
+        fallback = self.fallback
+        if fallback is not None and time.monotonic() < self._retry_at:
+            return getattr(fallback, method)(*args)
+        try:
+            result = getattr(self.primary, method)(*args)
+        except RedisError as e:
+            if self.fallback_factory is None:
+                logger.warning("%s: Redis недоступен (%r)", self.what, e)
+                raise
+            return getattr(self._fail_over(e), method)(*args)
+        if fallback is not None:
+            self._recover()
+        return result
+
+    def _fail_over(self, exc: RedisError) -> Any:
+        with self._lock:
+            self.failures += 1
+            delay = min(self.retry_max_s, self.retry_s * 2 ** (self.failures - 1))
+            self._retry_at = time.monotonic() + delay
+            if self.fallback is None:
+                self.fallback = self.fallback_factory()
+            fallback = self.fallback
+        logger.warning(
+            "%s: Redis недоступен (%r) — %.0f с работаем на %s, потом пробуем снова",
+            self.what, exc, delay, fallback.name,
+        )
+        return fallback
+
+    def _recover(self) -> None:
+        with self._lock:
+            if self.fallback is None:
+                return
+            self.fallback = None
+            self.failures = 0
+        logger.warning("%s: Redis снова отвечает — возвращаемся на него", self.what)
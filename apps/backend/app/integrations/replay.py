@@ -0,0 +1,322 @@
+"""
+Запись и воспроизведение ответов 999.md — для бенчмарков и регрессий без
+похода в настоящий partners API.
+
+Корпус — папка с gzip-JSONL файлами, по одному на тип эндпоинта:
+
+    listing.jsonl.gz      {"page": 1, "page_size": 25, "body": "<json>"}
+    advert.jsonl.gz       {"id": "88470725", "body": "<json>"}
+    features.jsonl.gz     {"id": "88470725", "body": "<json>"}
+    public_html.jsonl.gz  {"id": "88470725", "body": "<html>"}
+
+- N999_RECORD_DIR=<папка>  — клиент partners999 дописывает туда всё, что получил
+- N999_REPLAY_DIR=<папка>  — клиент вообще не ходит в сеть, ответы берутся из
+  корпуса (ReplayAdapter монтируется в requests.Session)
+"""
+import atexit
+import gzip
+import hashlib
+import io
+import json
+import os
+import random
+import re
+import threading
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+import requests
+from requests.adapters import BaseAdapter
+from requests.structures import CaseInsensitiveDict
+
+RECORD_DIR = os.getenv("N999_RECORD_DIR", "")
+REPLAY_DIR = os.getenv("N999_REPLAY_DIR", "")
+
+ENDPOINTS = ("listing", "advert", "features", "public_html")
+
+_RE_ADVERT = re.compile(r"^/adverts/(\d+)/?$")
+_RE_FEATURES = re.compile(r"^/adverts/(\d+)/features/?$")
+_RE_PUBLIC = re.compile(r"^/([a-z]{2})/(?:view/)?(\d+)/?$")
+
+
+def classify(path: str) -> Tuple[Optional[str], Optional[str]]:
+    """URL path -> (endpoint, advert_id). Для листинга id = None."""
+    path = path.split("?", 1)[0]
+    if path.rstrip("/") == "/adverts":
+        return "listing", None
+    m = _RE_FEATURES.match(path)
+    if m:
+        return "features", m.group(1)
+    m = _RE_ADVERT.match(path)
+    if m:
+        return "advert", m.group(1)
+    m = _RE_PUBLIC.match(path)
+    if m:
+        return "public_html", m.group(2)
+    return None, None
+
+
+def body_etag(body: str) -> str:
+    return '"%s"' % hashlib.sha1(body.encode("utf-8")).hexdigest()[:16]
+
+
+# =========================
+# Корпус
+# =========================
+
+class Corpus:
+    """Записанные ответы в памяти + чтение/запись на диск."""
+
+    def __init__(self, path: str = ""):
+        self.path = path
+        self.listing_entries: List[Dict[str, Any]] = []
+        self.bodies: Dict[str, Dict[str, str]] = {name: {} for name in ENDPOINTS if name != "listing"}
+        self._listing_ids: set = set()
+
+    # ---------- загрузка ----------
+
+    @classmethod
+    def load(cls, path: str) -> "Corpus":
+        corpus = cls(path)
+        for rec in _read_jsonl(os.path.join(path, "listing.jsonl.gz")):
+            try:
+                corpus.add_listing_entries(json.loads(rec["body"]).get("adverts") or [])
+            except Exception:
+                continue
+        for name in corpus.bodies:
+            for rec in _read_jsonl(os.path.join(path, f"{name}.jsonl.gz")):
+                if rec.get("id") and rec.get("body") is not None:
+                    corpus.bodies[name][str(rec["id"])] = rec["body"]
+        return corpus
+
+    def add_listing_entries(self, entries: List[Dict[str, Any]]) -> None:
+        for entry in entries:
+            advert_id = str(entry.get("id") or "")
+            if advert_id and advert_id not in self._listing_ids:
+                self._listing_ids.add(advert_id)
+                self.listing_entries.append(entry)
+
+    # ---------- выдача ----------
+
+    def listing_page(self, page: int, page_size: int) -> Dict[str, Any]:
+        """Пагинация строится заново из всех записанных записей листинга — работает при любом page_size."""
+        page = max(1, page)
+        page_size = max(1, page_size)
+        start = (page - 1) * page_size
+        return {
+            "adverts": self.listing_entries[start:start + page_size],
+            "page": page,
+            "page_size": page_size,
+            "subtotal": len(self.listing_entries),
+        }
+
+    def body(self, endpoint: str, advert_id: str) -> Optional[str]:
+        return self.bodies.get(endpoint, {}).get(str(advert_id))
+
+    def __len__(self) -> int:
+        return len(self.listing_entries)
+
+    # ---------- синтетика ----------
+
+    @classmethod
+    def synthetic(cls, count: int, seed: int = 999) -> "Corpus":
+        """Фейковый сток из count объявлений — когда записанного корпуса нет."""
+        rnd = random.Random(seed)
+        corpus = cls()
+        makes = [("BMW", "320d", "Дизель"), ("Toyota", "RAV4", "Гибрид"), ("Skoda", "Octavia", "Бензин"),
+                 ("Tesla", "Model 3", "Электричество"), ("Mercedes", "E300de", "Плагин-гибрид")]
+        for n in range(count):
+            advert_id = str(80000000 + n)
+            make, model, fuel = makes[n % len(makes)]
+            year = 2010 + rnd.randint(0, 14)
+            price = 5000 + rnd.randint(0, 60) * 500
+            title = f"{make} {model}"
+            corpus.add_listing_entries([{
+                "id": int(advert_id),
+                "title": title,
+                "price": {"value": price, "unit": "eur"},
+                "categories": {"category": {"id": 658}, "subcategory": {"id": 659}},
+                "state": "public",
+            }])
+            features = [
+                {"title": "Марка", "value": make},
+                {"title": "Модель", "value": model},
+                {"title": "Год выпуска", "value": str(year)},
+                {"title": "Пробег", "value": f"{rnd.randint(10, 300)} 000 км"},
+                {"title": "Тип топлива", "value": fuel},
+                {"title": "КПП", "value": "Автомат"},
+            ]
+            images = [f"{advert_id}_{k}.jpg" for k in range(n % 4)]
+            corpus.bodies["advert"][advert_id] = json.dumps({
+                "id": int(advert_id), "title": title, "body": f"{title}, {year}",
+                "price": {"value": price, "unit": "eur"}, "images": images,
+            }, ensure_ascii=False)
+            corpus.bodies["features"][advert_id] = json.dumps(
+                {"features_groups": [{"features": features}]}, ensure_ascii=False,
+            )
+            rows = "".join(
+                f'<div class="styles_group__row__x1"><span class="styles_group__key__k1">{f["title"]}</span>'
+                f'<span class="styles_group__value__v1">{f["value"]}</span></div>'
+                for f in features
+            )
+            scripts = "".join(f"<script>window.__d{k}={{\"x\":{k}}};</script>" for k in range(20))
+            corpus.bodies["public_html"][advert_id] = (
+                "<html><head>"
+                f'<meta property="og:title" content="{title}"/>'
+                f'<meta property="og:description" content="{title}, {year}"/>'
+                f'<meta property="product:price:amount" content="{price}"/>'
+                '<meta property="product:price:currency" content="EUR"/>'
+                f'<meta property="og:image" content="https://i.simpalsmedia.com/999.md/BoardImages/900x900/{advert_id}.jpg"/>'
+                f"</head><body>{scripts}<main>{rows}</main>{scripts}</body></html>"
+            )
+        return corpus
+
+    def save(self, path: str) -> None:
+        os.makedirs(path, exist_ok=True)
+        with gzip.open(os.path.join(path, "listing.jsonl.gz"), "wt", encoding="utf-8") as fh:
+            fh.write(json.dumps({"page": 1, "page_size": len(self.listing_entries),
+                                 "body": json.dumps({"adverts": self.listing_entries}, ensure_ascii=False)},
+                                ensure_ascii=False) + "\n")
+        for name, items in self.bodies.items():
+            with gzip.open(os.path.join(path, f"{name}.jsonl.gz"), "wt", encoding="utf-8") as fh:
+                for advert_id, body in items.items():
+                    fh.write(json.dumps({"id": advert_id, "body": body}, ensure_ascii=False) + "\n")
+
+
+def _read_jsonl(path: str) -> Iterator[Dict[str, Any]]:
+    if not os.path.exists(path):
+        return
+    with gzip.open(path, "rt", encoding="utf-8") as fh:
+        try:
+            for line in fh:
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    yield json.loads(line)
+                except ValueError:
+                    continue  # недописанная строка (процесс убили посреди записи)
+        except (EOFError, OSError):
+            return  # у последнего gzip member'а нет хвоста — читаем что успели
+
+
+# =========================
+# Запись
+# =========================
+
+class Recorder:
+    """
+    Дописывает ответы в корпус. На процесс — один gzip member на файл
+    (режим "ab": новые запуски добавляют свои member'ы, файл остаётся читаемым).
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._files: Dict[str, Any] = {}
+        os.makedirs(path, exist_ok=True)
+        atexit.register(self.close)
+
+    def close(self) -> None:
+        with self._lock:
+            for fh in self._files.values():
+                try:
+                    fh.close()
+                except Exception:
+                    pass
+            self._files.clear()
+
+    def record(self, endpoint: str, body: str, *, advert_id: Optional[str] = None, page: int = 0, page_size: int = 0) -> None:
+        if endpoint not in ENDPOINTS:
+            return
+        rec: Dict[str, Any] = {"body": body}
+        if endpoint == "listing":
+            rec.update(page=page, page_size=page_size)
+        else:
+            rec["id"] = str(advert_id)
+        line = json.dumps(rec, ensure_ascii=False) + "\n"
+        with self._lock:
+            fh = self._files.get(endpoint)
+            if fh is None:
+                fh = gzip.open(os.path.join(self.path, f"{endpoint}.jsonl.gz"), "at", encoding="utf-8")
+                self._files[endpoint] = fh
+            fh.write(line)
+            fh.flush()
+
+
+_recorder: Optional[Recorder] = None
+_recorder_lock = threading.Lock()
+
+
+def get_recorder() -> Optional[Recorder]:
+    global _recorder
+    if not RECORD_DIR:
+        return None
+    if _recorder is None:
+        with _recorder_lock:
+            if _recorder is None:
+                _recorder = Recorder(RECORD_DIR)
+    return _recorder
+
+
+# =========================
+# Воспроизведение
+# =========================
+
+def _query_int(params: Dict[str, List[str]], name: str, default: int) -> int:
+    try:
+        return int((params.get(name) or [default])[0])
+    except (TypeError, ValueError):
+        return default
+
+
+def render(corpus: Corpus, path: str, query: Dict[str, List[str]]) -> Tuple[int, str, str]:
+    """(status, content-type, body) для запроса к корпусу — общий код для адаптера и стенд-сервера."""
+    endpoint, advert_id = classify(path)
+    if endpoint == "listing":
+        page = _query_int(query, "page", 1)
+        page_size = _query_int(query, "page_size", 50)
+        return 200, "application/json", json.dumps(corpus.listing_page(page, page_size), ensure_ascii=False)
+    if endpoint is None:
+        return 404, "application/json", '{"error": "unknown endpoint"}'
+
+    body = corpus.body(endpoint, advert_id)
+    if body is None:
+        return 404, "application/json", '{"error": "not in corpus"}'
+    ctype = "text/html; charset=utf-8" if endpoint == "public_html" else "application/json"
+    return 200, ctype, body
+
+
+class ReplayAdapter(BaseAdapter):
+    """requests-адаптер, который отвечает из корпуса и не трогает сеть."""
+
+    def __init__(self, corpus: Corpus):
+        super().__init__()
+        self.corpus = corpus
+
+    def send(self, request, stream=False, timeout=None, verify=True, cert=None, proxies=None):
+        from urllib.parse import parse_qs, urlsplit
+
+        parts = urlsplit(request.url)
+        status, ctype, body = render(self.corpus, parts.path, parse_qs(parts.query))
+
+        etag = body_etag(body)
+        if status == 200 and request.headers.get("If-None-Match") == etag:
+            status, body = 304, ""
+
+        resp = requests.Response()
+        resp.status_code = status
+        resp.url = request.url
+        resp.request = request
+        resp.encoding = "utf-8"
+        payload = body.encode("utf-8")
+        resp.headers = CaseInsensitiveDict({
+            "Content-Type": ctype,
+            "Content-Length": str(len(payload)),
+            "ETag": etag,
+        })
+        resp.raw = io.BytesIO(payload)
+        resp.reason = {200: "OK", 304: "Not Modified"}.get(status, "Not Found")
+        return resp
+
+    def close(self):
+        pass
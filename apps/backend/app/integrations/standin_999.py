@@ -0,0 +1,111 @@
+"""
+Локальный «двойник» partners API и публичных страниц 999.md.
+
+Отдаёт корпус (см. app.integrations.replay) по тем же путям:
+    GET /adverts?page=&page_size=      листинг (пагинация из корпуса)
+    GET /adverts/{id}                  объявление
+    GET /adverts/{id}/features         характеристики
+    GET /{lang}/{id}                   публичная HTML-страница
+
+С настраиваемой задержкой, долей 429 (с Retry-After) и ETag/304.
+Импорт направляем сюда через N999_API_BASE / N999_PUBLIC_BASE.
+"""
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, Optional
+from urllib.parse import parse_qs, urlsplit
+
+from app.integrations.replay import Corpus, body_etag, render
+
+
+class StandinConfig:
+    def __init__(
+        self,
+        latency_ms: float = 0.0,
+        jitter_ms: float = 0.0,
+        rate_429: float = 0.0,
+        retry_after: int = 1,
+        seed: Optional[int] = None,
+    ):
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.rate_429 = rate_429
+        self.retry_after = retry_after
+        self.random = random.Random(seed)
+
+
+class StandinServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, corpus: Corpus, config: StandinConfig):
+        super().__init__(address, _Handler)
+        self.corpus = corpus
+        self.config = config
+        self.stats: Dict[str, int] = {}
+        self._stats_lock = threading.Lock()
+
+    def count(self, key: str) -> None:
+        with self._stats_lock:
+            self.stats[key] = self.stats.get(key, 0) + 1
+
+    @property
+    def base_url(self) -> str:
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    server: StandinServer
+
+    def do_GET(self):
+        cfg = self.server.config
+        delay = cfg.latency_ms + (cfg.random.uniform(-cfg.jitter_ms, cfg.jitter_ms) if cfg.jitter_ms else 0.0)
+        if delay > 0:
+            time.sleep(delay / 1000.0)
+
+        if cfg.rate_429 and cfg.random.random() < cfg.rate_429:
+            self.server.count("429")
+            self._send(429, "application/json", '{"error": "too many requests"}', {"Retry-After": str(cfg.retry_after)})
+            return
+
+        parts = urlsplit(self.path)
+        status, ctype, body = render(self.server.corpus, parts.path, parse_qs(parts.query))
+        self.server.count(str(status))
+
+        headers = {}
+        if status == 200:
+            etag = body_etag(body)
+            headers["ETag"] = etag
+            if self.headers.get("If-None-Match") == etag:
+                self.server.count("304")
+                self._send(304, ctype, "", headers)
+                return
+        self._send(status, ctype, body, headers)
+
+    def _send(self, status: int, ctype: str, body: str, headers: Dict[str, Any]):
+        payload = body.encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", ctype)
+        self.send_header("Content-Length", str(len(payload)))
+        for k, v in headers.items():
+            self.send_header(k, v)
+        self.end_headers()
+        if payload:
+            self.wfile.write(payload)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def make_server(corpus: Corpus, host: str = "127.0.0.1", port: int = 8999, config: Optional[StandinConfig] = None) -> StandinServer:
+    return StandinServer((host, port), corpus, config or StandinConfig())
+
+
+def start_in_thread(corpus: Corpus, host: str = "127.0.0.1", port: int = 0, config: Optional[StandinConfig] = None) -> StandinServer:
+    """Поднять сервер в фоне (port=0 -> свободный порт). Останавливать через server.shutdown()."""
+    server = make_server(corpus, host, port, config)
+    threading.Thread(target=server.serve_forever, name="n999-standin", daemon=True).start()
+    return server
@@ -0,0 +1,400 @@
+"""
+Распределённый лок на синк 999.md — чтобы beat не запускал новый прогон,
+пока идёт прошлый (двойная нагрузка на API, 429, гонки на update_or_create
+и архивации).
+
+Лок — ключ в Redis с арендой (SET NX PX). Держатель продлевает аренду
+heartbeat'ом из фонового потока; если воркер умер, ключ сам истечёт через
+N999_SYNC_LOCK_TTL секунд. Снять/продлить может только владелец (сверяем
+значение в Lua). Кто пришёл, пока лок занят, не ждёт — «сливается» с идущим
+прогоном: инкрементит счётчик coalesced и выходит; держатель увидит его
+в своём результате.
+
+Лок работает «на закрытие»: если Redis не отвечает, acquire() возвращает
+False (в state() — error), и синк не запускается — beat повторит в свой
+срок. Перейти на in-memory нельзя: другой воркер лока не увидит. Если
+heartbeat не смог продлить аренду (перехватили или Redis лежал дольше
+TTL), lock.lost = True и ensure_held() бросает SyncLockLost — синк зовёт
+его между страницами и прерывается.
+
+Бэкенд выбирается через N999_SYNC_LOCK_BACKEND:
+  redis  — по умолчанию, общий для всех воркеров
+  memory — на процесс (локальный запуск)
+  off    — без лока
+"""
+import json
+import os
+import socket
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, Optional, Tuple
+
+from redis.exceptions import RedisError
+
+from app.integrations.redis_conn import RedisFailover, get_redis
+
+BACKEND = os.getenv("N999_SYNC_LOCK_BACKEND", "redis").lower()
+KEY_PREFIX = os.getenv("N999_SYNC_LOCK_PREFIX", "n999:lock")
+# аренда; heartbeat продлевает её каждые TTL/3
+TTL = int(os.getenv("N999_SYNC_LOCK_TTL", "120"))
+# fan-out держит лок между задачами без heartbeat'а: аренду продлевает каждая пачка
+FANOUT_TTL = int(os.getenv("N999_SYNC_LOCK_FANOUT_TTL", "1800"))
+
+# KEYS[1] — ключ лока, KEYS[2] — счётчик coalesced; ARGV: значение владельца, новая аренда (мс)
+_EXTEND_LUA = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+  redis.call('PEXPIRE', KEYS[2], ARGV[2])
+  return redis.call('PEXPIRE', KEYS[1], ARGV[2])
+end
+return 0
+"""
+
+_RELEASE_LUA = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+  return redis.call('DEL', KEYS[1])
+end
+return 0
+"""
+
+
+class SyncLockUnavailable(RuntimeError):
+    """Бэкенд лока (Redis) не отвечает."""
+
+
+class SyncLockLost(RuntimeError):
+    """Аренду лока потеряли посреди синка — продолжать нельзя."""
+
+
+class MemoryLockStore:
+    """In-memory ключи с истечением (та же семантика, что у Redis) — на один процесс."""
+
+    name = "memory"
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._values: Dict[str, Tuple[str, float]] = {}
+        self._counters: Dict[str, int] = {}
+
+    def _get(self, key: str) -> Optional[str]:
+        item = self._values.get(key)
+        if item is None:
+            return None
+        if item[1] <= time.monotonic():
+            del self._values[key]
+            return None
+        return item[0]
+
+    def acquire(self, key: str, value: str, ttl_ms: int) -> bool:
+        with self._lock:
+            if self._get(key) is not None:
+                return False
+            self._values[key] = (value, time.monotonic() + ttl_ms / 1000.0)
+            return True
+
+    def extend(self, key: str, value: str, ttl_ms: int) -> bool:
+        with self._lock:
+            if self._get(key) != value:
+                return False
+            self._values[key] = (value, time.monotonic() + ttl_ms / 1000.0)
+            return True
+
+    def release(self, key: str, value: str) -> bool:
+        with self._lock:
+            if self._get(key) != value:
+                return False
+            del self._values[key]
+            return True
+
+    def get(self, key: str) -> Optional[str]:
+        with self._lock:
+            return self._get(key)
+
+    def incr(self, key: str, ttl_ms: int) -> int:
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + 1
+            return self._counters[key]
+
+    def pop_counter(self, key: str) -> int:
+        with self._lock:
+            return self._counters.pop(key, 0)
+
+
+class RedisLockStore:
+    name = "redis"
+
+    def __init__(self, client=None):
+        self._client = client
+        self._extend = None
+        self._release = None
+
+    @property
+    def client(self):
+        return self._client or get_redis()
+
+    def acquire(self, key: str, value: str, ttl_ms: int) -> bool:
+        return bool(self.client.set(key, value, nx=True, px=ttl_ms))
+
+    def extend(self, key: str, value: str, ttl_ms: int) -> bool:
+        if self._extend is None:
+            self._extend = self.client.register_script(_EXTEND_LUA)
+        return bool(self._extend(keys=[key, key + ":coalesced"], args=[value, ttl_ms]))
+
+    def release(self, key: str, value: str) -> bool:
+        if self._release is None:
+            self._release = self.client.register_script(_RELEASE_LUA)
+        return bool(self._release(keys=[key], args=[value]))
+
+    def get(self, key: str) -> Optional[str]:
+        raw = self.client.get(key)
+        return raw.decode("utf-8") if isinstance(raw, bytes) else raw
+
+    def incr(self, key: str, ttl_ms: int) -> int:
+        pipe = self.client.pipeline()
+        pipe.incr(key)
+        pipe.pexpire(key, ttl_ms)
+        return int(pipe.execute()[0])
+
+    def pop_counter(self, key: str) -> int:
+        pipe = self.client.pipeline()
+        pipe.get(key)
+        pipe.delete(key)
+        raw = pipe.execute()[0]
+        return int(raw or 0)
+
+
+def _owner(kind: str, task_id: Optional[str] = None) -> Dict[str, Any]:
+    return {
+        "kind": kind,
+        "task_id": task_id,
+        "host": socket.gethostname(),
+        "pid": os.getpid(),
+        "token": uuid.uuid4().hex,
+        "acquired_at": time.time(),
+    }
+
+
+class SyncLock:
+    """
+    Лок одного синка. acquire() не ждёт: занят — возвращает False
+    (и считает попытку в coalesced). state() — dict для результата задачи.
+
+    Значение ключа — JSON с владельцем (kind, task_id, host, pid, token),
+    его же можно передать в другую задачу (lock.value -> from_value) —
+    так fan-out держит лок от листинга до chord-колбэка.
+    """
+
+    def __init__(self, name: str, ttl: int = TTL, store=None, prefix: str = KEY_PREFIX):
+        self.name = name
+        self.key = f"{prefix}:{name}"
+        self.ttl = max(1, int(ttl))
+        self.store = store
+        self.value: Optional[str] = None
+        self.acquired = False
+        self.lost = False
+        self.extends = 0
+        self.coalesced = 0
+        self.holder: Optional[Dict[str, Any]] = None
+        self.error: Optional[str] = None
+        self._acquired_mono = 0.0
+        self._extended_mono = 0.0
+        self._stop = threading.Event()
+        self._heartbeat: Optional[threading.Thread] = None
+
+    # ---------- бэкенд ----------
+
+    @property
+    def store(self):
+        return self._store
+
+    @store.setter
+    def store(self, store) -> None:
+        self._store = store
+        # без fallback: Redis недоступен -> ошибка, а не лок в памяти процесса
+        self.failover = RedisFailover(store, None, "sync_lock") if store is not None else None
+
+    @property
+    def backend_name(self) -> str:
+        if self.store is None:
+            return "off"
+        return self.store.name
+
+    def _call(self, method: str, *args):
+        """Redis недоступен — SyncLockUnavailable: без общего лока взаимного исключения нет."""
+        try:
+            return self.failover.call(method, *args)
+        except RedisError as e:
+            raise SyncLockUnavailable(f"sync lock backend {self.store.name!r} unavailable: {e!r}") from e
+
+    # ---------- захват / продление / снятие ----------
+
+    def acquire(self, kind: str, task_id: Optional[str] = None) -> bool:
+        if self.store is None:
+            self.acquired = True
+            return True
+        value = json.dumps(_owner(kind, task_id), sort_keys=True)
+        try:
+            if self._call("acquire", self.key, value, self.ttl * 1000):
+                self.value = value
+                self.acquired = True
+                self._acquired_mono = self._extended_mono = time.monotonic()
+                return True
+            self.coalesced = self._call("incr", self.key + ":coalesced", self.ttl * 1000)
+            raw = self._call("get", self.key)
+            self.holder = _loads(raw)
+        except SyncLockUnavailable as e:
+            # не знаем, свободен ли лок, — значит, не берём
+            self.error = str(e)
+        return False
+
+    def extend(self) -> bool:
+        """Продлить аренду. Перехватили — False и lost; Redis недоступен — SyncLockUnavailable."""
+        if self.store is None or not self.value:
+            return True
+        ok = bool(self._call("extend", self.key, self.value, self.ttl * 1000))
+        if ok:
+            self.extends += 1
+            self._extended_mono = time.monotonic()
+        else:
+            self.lost = True
+        return ok
+
+    def ensure_held(self) -> None:
+        """Для синка, между страницами: аренда потеряна -> SyncLockLost."""
+        if self.lost:
+            raise SyncLockLost(f"sync lock {self.name!r} lost: {self.error or 'lease taken over'}")
+
+    def release(self) -> None:
+        self.stop_heartbeat()
+        if self.store is None or not self.value:
+            return
+        try:
+            if not self._call("release", self.key, self.value):
+                self.lost = True
+            self.coalesced = self._call("pop_counter", self.key + ":coalesced")
+        except SyncLockUnavailable as e:
+            self.error = str(e)  # ключ сам истечёт через TTL
+
+    # ---------- heartbeat ----------
+
+    def start_heartbeat(self) -> None:
+        if self.store is None or not self.value or self._heartbeat is not None:
+            return
+        self._stop.clear()
+        self._heartbeat = threading.Thread(target=self._beat, name=f"sync-lock-{self.name}", daemon=True)
+        self._heartbeat.start()
+
+    def stop_heartbeat(self) -> None:
+        if self._heartbeat is not None:
+            self._stop.set()
+            self._heartbeat.join(timeout=5)
+            self._heartbeat = None
+
+    def _beat(self) -> None:
+        interval = max(1.0, self.ttl / 3.0)
+        while not self._stop.wait(interval):
+            try:
+                if not self.extend():
+                    # аренду перехватили (долгий GC/пауза дольше TTL) — дальше продлевать нечего
+                    return
+            except SyncLockUnavailable as e:
+                self.error = str(e)
+                if time.monotonic() - self._extended_mono >= self.ttl:
+                    # аренда истекла, пока Redis лежал: лок мог взять другой воркер
+                    self.lost = True
+                    return
+
+    # ---------- передача между задачами ----------
+
+    @classmethod
+    def from_value(cls, name: str, value: Optional[str], ttl: int = TTL) -> "SyncLock":
+        lock = cls(name, ttl=ttl, store=get_lock_store())
+        lock.value = value
+        lock.acquired = bool(value)
+        return lock
+
+    def state(self) -> Dict[str, Any]:
+        owner = _loads(self.value) if self.value else None
+        state: Dict[str, Any] = {
+            "name": self.name,
+            "backend": self.backend_name,
+            "acquired": self.acquired,
+            "ttl_s": self.ttl,
+            "extends": self.extends,
+            "lost": self.lost,
+            "coalesced": self.coalesced,
+        }
+        if self.error:
+            state["error"] = self.error
+        if owner:
+            state["owner"] = {k: owner.get(k) for k in ("kind", "task_id", "host", "pid")}
+        if self._acquired_mono:
+            state["held_s"] = round(time.monotonic() - self._acquired_mono, 3)
+        if self.holder is not None:
+            state["holder"] = {k: self.holder.get(k) for k in ("kind", "task_id", "host", "pid")}
+            if self.holder.get("acquired_at"):
+                state["holder"]["running_s"] = round(time.time() - self.holder["acquired_at"], 1)
+        return state
+
+
+def _loads(raw: Optional[str]) -> Optional[Dict[str, Any]]:
+    if not raw:
+        return None
+    try:
+        return json.loads(raw)
+    except ValueError:
+        return {"raw": raw}
+
+
+def build_store(backend_name: str = BACKEND):
+    if backend_name == "off":
+        return None
+    if backend_name == "memory":
+        return MemoryLockStore()
+    return RedisLockStore()
+
+
+_store_obj = None
+_store_built = False
+_store_lock = threading.Lock()
+
+
+def get_lock_store():
+    global _store_obj, _store_built
+    if not _store_built:
+        with _store_lock:
+            if not _store_built:
+                _store_obj = build_store()
+                _store_built = True
+    return _store_obj
+
+
+def configure_sync_lock(backend_name: str):
+    """Подменить процессный бэкенд лока (локальный запуск, отладка): redis | memory | off."""
+    global _store_obj, _store_built
+    with _store_lock:
+        _store_obj = build_store(backend_name)
+        _store_built = True
+    return _store_obj
+
+
+@contextmanager
+def sync_lock(name: str, kind: str, task_id: Optional[str] = None, ttl: int = TTL) -> Iterator[SyncLock]:
+    """
+    with sync_lock("999", "full", task_id) as lock:
+        if not lock.acquired:
+            return {"skipped": True, "lock": lock.state()}
+        ...  # синк; аренду продлевает heartbeat
+
+    Лок снимается при выходе (и при исключении).
+    """
+    lock = SyncLock(name, ttl=ttl, store=get_lock_store())
+    if not lock.acquire(kind, task_id):
+        yield lock
+        return
+    lock.start_heartbeat()
+    try:
+        yield lock
+    finally:
+        lock.release()
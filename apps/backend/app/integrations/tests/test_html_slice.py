@@ -0,0 +1,72 @@
+"""Нарезка публичной страницы (html_slice) против разбора целой страницы."""
+import pytest
+
+from app.cars.management.commands.bench_html_parsers import _extract, _slice
+from app.cars.services import html_parsers
+from app.integrations import partners999
+from app.integrations.html_slice import TAIL
+
+BOARD = "https://i.simpalsmedia.com/999.md/BoardImages/900x900"
+
+SPEC = [("Марка", "BMW"), ("Модель", "320d"), ("Год выпуска", "2019"), ("Тип топлива", "Дизель")]
+
+
+def _page(advert_id: str = "88000001") -> str:
+    """Фотки (галерея и __NEXT_DATA__) идут после блока характеристик и длинного хвоста."""
+    rows = "".join(
+        f'<div class="styles_group__row__x1"><span class="styles_group__key__k1">{k}</span>'
+        f'<span class="styles_group__value__v1">{v}</span></div>'
+        for k, v in SPEC
+    )
+    filler = "".join(f'<div class="similar"><a href="/ru/{n}">Похожее {n}</a></div>' for n in range(TAIL // 20))
+    gallery = "".join(f'<img src="{BOARD}/{advert_id}_{k}.jpg" alt=""/>' for k in range(3))
+    next_data = '{"props":{"images":["%s/%s_3.jpg","%s/%s_4.jpg"]}}' % (BOARD, advert_id, BOARD, advert_id)
+    return (
+        "<!DOCTYPE html><html><head>"
+        '<meta property="og:title" content="BMW 320d"/>'
+        '<meta property="product:price:amount" content="15500"/>'
+        '<meta property="product:price:currency" content="EUR"/>'
+        "</head><body>"
+        f'<main><section class="styles_group__a1"><ul>{rows}</ul></section></main>'
+        f"{filler}<div class=\"gallery\">{gallery}</div>"
+        f'<script id="__NEXT_DATA__" type="application/json">{next_data}</script>'
+        "</body></html>"
+    )
+
+
+@pytest.mark.parametrize("backend", html_parsers.available_backends())
+def test_photos_after_spec_block_are_kept(backend):
+    html = _page()
+    full = _extract(html_parsers.Bs4Page(html))
+    assert len(full["images"]) == 5
+
+    slicer = _slice(html, images=True)
+    assert not slicer.done
+    assert _extract(html_parsers.BACKENDS[backend](slicer.document())) == full
+
+
+@pytest.mark.parametrize("backend", html_parsers.available_backends())
+def test_without_images_stops_after_spec_block(backend):
+    html = _page()
+    full = _extract(html_parsers.Bs4Page(html))
+
+    slicer = _slice(html, images=False)
+    assert slicer.done
+    assert slicer.chars_scanned < len(html)
+    got = _extract(html_parsers.BACKENDS[backend](slicer.document()))
+    assert got["meta"] == full["meta"]
+    assert got["spec_pairs"] == full["spec_pairs"]
+
+
+def test_public_html_keeps_photos_by_default(corpus):
+    advert_id = str(corpus.listing_entries[0]["id"])
+    corpus.bodies["public_html"][advert_id] = _page(advert_id)
+
+    page = html_parsers.parse_page(partners999.get_public_ad_html(advert_id, lang="ru"))
+    assert len(page.image_candidates()) == 5
+
+    lean = html_parsers.parse_page(partners999.get_public_ad_html(advert_id, lang="ru", images=False))
+    assert lean.spec_pairs() == page.spec_pairs()
+    slicing = partners999.get_client().stats()["html_slice"]
+    assert slicing["pages"] == 2
+    assert slicing["stopped_early"] == 1
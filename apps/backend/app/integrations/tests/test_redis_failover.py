@@ -0,0 +1,143 @@
+"""RedisFailover: временный переход на память и возврат на Redis (лимитер, кеш), fail closed (лок)."""
+import pytest
+from redis.exceptions import ConnectionError as RedisConnectionError
+
+from app.integrations import redis_conn
+from app.integrations.http_cache import CacheEntry, MemoryCacheStore, ResponseCache
+from app.integrations.ratelimit import MemoryTokenBucket, TokenBucketLimiter
+from app.integrations.sync_lock import MemoryLockStore, SyncLock, SyncLockUnavailable
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(redis_conn.time, "monotonic", clock)
+    return clock
+
+
+class SwitchBucket(MemoryTokenBucket):
+    """Память под видом Redis: пока down=True, падает как Redis."""
+
+    name = "redis"
+    down = False
+
+    def __init__(self):
+        super().__init__()
+        self.calls = 0
+
+    def take(self, key, rate, burst):
+        self.calls += 1
+        if self.down:
+            raise RedisConnectionError("redis is down")
+        return super().take(key, rate, burst)
+
+
+class SwitchCacheStore(MemoryCacheStore):
+    name = "redis"
+    down = False
+
+    def get(self, key):
+        if self.down:
+            raise RedisConnectionError("redis is down")
+        return super().get(key)
+
+    def set(self, key, blob, ttl):
+        if self.down:
+            raise RedisConnectionError("redis is down")
+        super().set(key, blob, ttl)
+
+
+def test_limiter_retries_redis_after_window(clock, caplog):
+    redis = SwitchBucket()
+    limiter = TokenBucketLimiter(backend=redis, rates={"advert": (1000.0, 1000.0)})
+    limiter.failover.retry_s = 10
+
+    redis.down = True
+    with caplog.at_level("WARNING", logger="app.integrations.redis_conn"):
+        limiter.acquire("advert")
+    assert limiter.backend_name == "redis->memory"
+    assert "ratelimit: Redis недоступен" in caplog.text
+
+    # в окне Redis не дёргаем вовсе
+    limiter.acquire("advert")
+    assert redis.calls == 1
+
+    redis.down = False
+    clock.now += 10
+    with caplog.at_level("WARNING", logger="app.integrations.redis_conn"):
+        limiter.acquire("advert")
+    assert redis.calls == 2
+    assert limiter.backend_name == "redis"
+    assert "снова отвечает" in caplog.text
+
+
+def test_repeated_failures_back_off(clock):
+    redis = SwitchBucket()
+    limiter = TokenBucketLimiter(backend=redis, rates={"advert": (1000.0, 1000.0)})
+    limiter.failover.retry_s = 10
+    limiter.failover.retry_max_s = 25
+    redis.down = True
+
+    limiter.acquire("advert")
+    clock.now += 10
+    limiter.acquire("advert")  # окно кончилось, Redis всё ещё лежит -> окно 20 с
+    assert redis.calls == 2
+    clock.now += 19
+    limiter.acquire("advert")
+    assert redis.calls == 2
+    clock.now += 1
+    limiter.acquire("advert")  # следующее окно упирается в retry_max_s
+    assert redis.calls == 3
+    clock.now += 24
+    limiter.acquire("advert")
+    assert redis.calls == 3
+    clock.now += 1
+    limiter.acquire("advert")
+    assert redis.calls == 4
+
+
+def test_cache_fails_over_and_comes_back(clock):
+    store = SwitchCacheStore()
+    cache = ResponseCache(store=store)
+    cache.failover.retry_s = 10
+    entry = CacheEntry(body="{}", etag='"v1"')
+
+    store.down = True
+    cache.put("k", entry)  # не падает: пишем в память процесса
+    assert cache.backend_name == "redis->memory"
+    assert cache.get("k").etag == '"v1"'
+
+    store.down = False
+    clock.now += 10
+    assert cache.get("k") is None  # снова Redis — там этой записи нет
+    assert cache.backend_name == "redis"
+    cache.put("k", entry)
+    assert store.get("k") is not None
+
+
+class DownLockStore(MemoryLockStore):
+    name = "redis"
+
+    def acquire(self, key, value, ttl_ms):
+        raise RedisConnectionError("redis is down")
+
+
+def test_lock_fails_closed(clock, caplog):
+    lock = SyncLock("sync-999", store=DownLockStore())
+
+    with caplog.at_level("WARNING", logger="app.integrations.redis_conn"):
+        assert not lock.acquire("full", "t1")
+    assert "redis is down" in lock.error
+    assert lock.failover.fallback is None
+    clock.now += 3600
+    with pytest.raises(SyncLockUnavailable):
+        lock._call("acquire", lock.key, "v", 1000)
+    assert "sync_lock: Redis недоступен" in caplog.text
@@ -0,0 +1,110 @@
+"""Replay-адаптер и HTTP-кэш клиента 999: условные запросы по ETag."""
+import json
+
+import pytest
+import requests
+
+from app.integrations import partners999
+from app.integrations.http_cache import configure_cache
+from app.integrations.replay import body_etag
+
+
+@pytest.fixture
+def cache():
+    return configure_cache("memory")
+
+
+def _advert_url(advert_id: str) -> str:
+    return f"{partners999.API_BASE}/adverts/{advert_id}"
+
+
+def test_conditional_request_gets_304(corpus):
+    advert_id = str(corpus.listing_entries[0]["id"])
+    etag = body_etag(corpus.body("advert", advert_id))
+    session = partners999.get_client().session
+
+    fresh = session.get(_advert_url(advert_id))
+    assert fresh.status_code == 200
+    assert fresh.headers["ETag"] == etag
+
+    revalidated = session.get(_advert_url(advert_id), headers={"If-None-Match": etag})
+    assert revalidated.status_code == 304
+    assert revalidated.reason == "Not Modified"
+    assert revalidated.content == b""
+
+    stale = session.get(_advert_url(advert_id), headers={"If-None-Match": '"other"'})
+    assert stale.status_code == 200
+    assert stale.json()["id"] == int(advert_id)
+
+
+def test_missing_advert_is_404(corpus):
+    resp = partners999.get_client().session.get(_advert_url("1"))
+    assert resp.status_code == 404
+    with pytest.raises(requests.HTTPError):
+        resp.raise_for_status()
+
+
+def test_cached_fetch_is_revalidated(corpus, cache):
+    advert_id = str(corpus.listing_entries[0]["id"])
+    client = partners999.get_client()
+
+    first = partners999.get_advert(advert_id)
+    second = partners999.get_advert(advert_id)
+
+    assert second == first == json.loads(corpus.body("advert", advert_id))
+    events = client.stats()["cache"]["advert"]
+    assert events["miss"] == 1
+    assert events["revalidated"] == 1
+
+
+def test_cache_picks_up_changed_body(corpus, cache):
+    advert_id = str(corpus.listing_entries[0]["id"])
+    partners999.get_advert(advert_id)
+
+    changed = json.loads(corpus.body("advert", advert_id))
+    changed["title"] = "BMW 320d xDrive"
+    corpus.bodies["advert"][advert_id] = json.dumps(changed, ensure_ascii=False)
+
+    assert partners999.get_advert(advert_id)["title"] == "BMW 320d xDrive"
+    assert partners999.get_client().stats()["cache"]["advert"]["miss"] == 2
+
+
+@pytest.fixture
+def no_validators(monkeypatch):
+    """Сервер без ETag: тело живёт в кеше TTL секунд без запросов."""
+    monkeypatch.setattr("app.integrations.replay.body_etag", lambda body: "")
+
+
+def test_fresh_entry_without_validators_is_served_without_request(corpus, cache, no_validators):
+    advert_id = str(corpus.listing_entries[0]["id"])
+    first = partners999.get_advert(advert_id)
+    corpus.bodies["advert"][advert_id] = json.dumps({**first, "title": "changed"})
+
+    assert partners999.get_advert(advert_id) == first
+    stats = partners999.get_client().stats()
+    assert stats["cache"]["advert"]["hit"] == 1
+    assert stats["endpoints"]["advert"]["calls"] == 1
+
+
+def test_revalidate_bypasses_fresh_entry(corpus, cache, no_validators):
+    advert_id = str(corpus.listing_entries[0]["id"])
+    first = partners999.get_advert(advert_id)
+    corpus.bodies["advert"][advert_id] = json.dumps({**first, "title": "changed"})
+
+    assert partners999.get_advert(advert_id, revalidate=True)["title"] == "changed"
+    # и перезаписанное тело дальше отдаётся из кеша
+    assert partners999.get_advert(advert_id)["title"] == "changed"
+    assert partners999.get_client().stats()["endpoints"]["advert"]["calls"] == 2
+
+
+def test_invalid_body_is_not_cached(corpus, cache):
+    advert_id = str(corpus.listing_entries[0]["id"])
+    good = corpus.body("advert", advert_id)
+    corpus.bodies["advert"][advert_id] = "{not json"
+
+    with pytest.raises(ValueError):
+        partners999.get_advert(advert_id)
+    assert "stored" not in partners999.get_client().stats()["cache"]["advert"]
+
+    corpus.bodies["advert"][advert_id] = good
+    assert partners999.get_advert(advert_id) == json.loads(good)
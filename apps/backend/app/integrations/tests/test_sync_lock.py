@@ -0,0 +1,97 @@
+"""Лок синка: взаимное исключение, потеря аренды, недоступный Redis."""
+import time
+
+import pytest
+from redis.exceptions import ConnectionError as RedisConnectionError
+
+from app.integrations.sync_lock import MemoryLockStore, RedisLockStore, SyncLock, SyncLockLost
+
+
+class DownRedis:
+    """Redis, который не отвечает ни на что."""
+
+    def __getattr__(self, name):
+        def fail(*args, **kwargs):
+            raise RedisConnectionError("redis is down")
+        return fail
+
+
+class FlakyStore(MemoryLockStore):
+    """Память, но extend падает, как Redis, когда down=True."""
+
+    down = False
+
+    def extend(self, key, value, ttl_ms):
+        if self.down:
+            raise RedisConnectionError("redis is down")
+        return super().extend(key, value, ttl_ms)
+
+
+def test_second_acquire_coalesces():
+    store = MemoryLockStore()
+    first = SyncLock("sync-999", store=store)
+    second = SyncLock("sync-999", store=store)
+
+    assert first.acquire("full", "t1")
+    assert not second.acquire("liveness", "t2")
+    assert second.coalesced == 1
+    assert second.state()["holder"]["task_id"] == "t1"
+
+    first.release()
+    assert first.coalesced == 1
+    assert SyncLock("sync-999", store=store).acquire("full", "t3")
+
+
+def test_redis_down_fails_closed():
+    lock = SyncLock("sync-999", store=RedisLockStore(client=DownRedis()))
+
+    assert not lock.acquire("full", "t1")
+    assert not lock.acquired
+    state = lock.state()
+    assert state["backend"] == "redis"
+    assert "redis is down" in state["error"]
+    # и второй раз — тоже нет: на память процесса не переключаемся
+    assert not SyncLock("sync-999", store=RedisLockStore(client=DownRedis())).acquire("full", "t2")
+
+
+def test_taken_over_lease_is_lost():
+    store = MemoryLockStore()
+    lock = SyncLock("sync-999", store=store)
+    assert lock.acquire("full", "t1")
+    lock.ensure_held()
+
+    store._values[lock.key] = ("someone else", time.monotonic() + 60)
+
+    assert not lock.extend()
+    assert lock.lost
+    with pytest.raises(SyncLockLost):
+        lock.ensure_held()
+
+
+def test_heartbeat_marks_lost_when_redis_is_down_longer_than_ttl():
+    store = FlakyStore()
+    lock = SyncLock("sync-999", ttl=1, store=store)
+    assert lock.acquire("full", "t1")
+    store.down = True
+    lock.start_heartbeat()
+    try:
+        deadline = time.monotonic() + 5
+        while not lock.lost and time.monotonic() < deadline:
+            time.sleep(0.05)
+    finally:
+        lock.stop_heartbeat()
+
+    assert lock.lost
+    assert "redis is down" in lock.state()["error"]
+    with pytest.raises(SyncLockLost):
+        lock.ensure_held()
+
+
+def test_release_with_redis_down_does_not_raise():
+    store = MemoryLockStore()
+    lock = SyncLock("sync-999", store=store)
+    assert lock.acquire("full", "t1")
+    lock.store = RedisLockStore(client=DownRedis())
+
+    lock.release()
+    assert "redis is down" in lock.state()["error"]
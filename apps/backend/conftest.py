@@ -0,0 +1,37 @@
+"""
+Общие фикстуры: импорт гоняем по корпусу (replay) вместо 999.md —
+сеть, Redis и записанные страницы тестам не нужны.
+"""
+import os
+
+import pytest
+
+from app.integrations import html_slice, partners999
+from app.integrations.http_cache import configure_cache
+from app.integrations.ratelimit import configure_limiter
+from app.integrations.replay import Corpus
+from app.integrations.sync_lock import configure_sync_lock
+
+# ключ нужен только чтобы собрать заголовок Authorization
+os.environ.setdefault("N999_API_KEY", "test")
+
+
+@pytest.fixture(autouse=True)
+def _n999_backends():
+    """Лимитер выключен, кэш и лок — в памяти процесса, у каждого теста свои."""
+    configure_limiter("off")
+    configure_cache("off")
+    configure_sync_lock("memory")
+    html_slice.configure_html_slice(True)
+    yield
+    configure_cache("off")
+
+
+@pytest.fixture
+def corpus():
+    """Синтетический сток из 12 объявлений; клиент 999 отвечает из него."""
+    corpus = Corpus.synthetic(12)
+    client = partners999.get_client()
+    client.mount_replay(corpus)
+    client.reset_stats()
+    return corpus
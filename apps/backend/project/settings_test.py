@@ -0,0 +1,12 @@
+# apps/backend/project/settings_test.py
+# Настройки для pytest: всё как в settings, но БД — sqlite в памяти
+
+from .settings import *  # noqa: F401,F403
+
+DATABASES = {
+    "default": {
+        "ENGINE": "django.db.backends.sqlite3",
+        "NAME": ":memory:",
+    }
+}
+PASSWORD_HASHERS = ["django.contrib.auth.hashers.MD5PasswordHasher"]